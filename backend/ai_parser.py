@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+
+# صيغة كل حقل في رد النموذج، والتعليمات تُبنى من الحقول المطلوبة فقط (بنفس هذا الترتيب)
+PRODUCT_SCHEMA_FIELDS = {
+    "name_ar": '"name_ar": "نص"',
+    "name_en": '"name_en": "text"',
+    "short_description": '"short_description": "نص"',
+    "category": '"category": "نص"',
+    "why_win": '"why_win": "نص"',
+    "target": '"target": "نص"',
+    "age_range": '"age_range": "18-35"',
+    "gender": '"gender": "ذكر|أنثى|كلا"',
+    "interests": '"interests": ["نص"]',
+    "problem": '"problem": "نص"',
+    "difficulty": '"difficulty": 1',
+    "profit_analysis": '"profit_analysis": {"purchase_price": 0, "suggested_price": 0, "total_costs": 0}',
+    "marketing": ('"marketing": {"platform": "نص", "ad_copy": "نص", "video_idea": "نص", "hashtags": ["#وسم"], '
+                  '"ad_budget": "نص"}'),
+    "market_analysis": ('"market_analysis": {"competition": "منخفض|متوسط|عالي", "demand": "نص", '
+                        '"unique_point": "نص", "growth_prediction": "نص"}'),
+    "tips": '"tips": ["نص"]',
+}
+# الاسم مطلوب دائماً: المحلل التدريجي ومفتاح إزالة التكرار يعتمدان عليه
+REQUIRED_SCHEMA_FIELDS = ("name_ar", "name_en")
+
+
+def schema_prompt(fields=None):
+    """تعليمات الصيغة المطلوبة من النموذج (تُضاف إلى رسالة المستخدم) للحقول المحددة فقط"""
+    fields = PRODUCT_SCHEMA_FIELDS if fields is None else fields
+    body = ", ".join(PRODUCT_SCHEMA_FIELDS[name] for name in PRODUCT_SCHEMA_FIELDS if name in fields)
+    prompt = "أرجع JSON صالحاً فقط بدون أي نص قبله أو بعده وبدون markdown، بالشكل:\n" \
+             '{"products": [{' + body + "}]}"
+    if "profit_analysis" in fields:
+        prompt += "\nالأسعار أرقام فقط بعملة السوق المطلوب."
+    return prompt
+
+
+PRODUCT_SCHEMA_PROMPT = schema_prompt()
+
+TEXT_FIELDS = ("name_ar", "name_en", "short_description", "category", "why_win",
+               "target", "age_range", "gender", "problem")
+LIST_FIELDS = ("interests", "tips")
+SECTION_TEXT_FIELDS = {
+    "marketing": ("platform", "ad_copy", "video_idea", "ad_budget"),
+    "market_analysis": ("competition", "demand", "unique_point", "growth_prediction"),
+}
+
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩٫", "0123456789.")
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _scan(text):
+    """يرجع (الأقواس المفتوحة، هل النص داخل سلسلة، موضع آخر عنصر مكتمل)"""
+    stack = []
+    in_string = False
+    escaped = False
+    last_safe = 0
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            last_safe = i + 1
+        elif char == ",":
+            last_safe = i
+    return stack, in_string, last_safe
+
+
+def _close(text, stack):
+    closing = "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+    try:
+        return json.loads(_TRAILING_COMMA_RE.sub(r"\1", text + closing))
+    except ValueError:
+        return None
+
+
+def repair_json(text):
+    """إكمال JSON مقطوع: إغلاق النصوص والأقواس المفتوحة وحذف الفواصل الزائدة"""
+    stack, in_string, last_safe = _scan(text)
+    repaired = text + '"' if in_string else text
+    repaired = repaired.rstrip()
+    # مفتاح بدون قيمة أو فاصلة معلقة في نهاية النص المقطوع
+    if repaired.endswith(":"):
+        repaired += " null"
+    elif repaired.endswith(","):
+        repaired = repaired[:-1]
+    result = _close(repaired, stack)
+    if result is not None:
+        return result
+
+    # آخر محاولة: قص النص عند آخر عنصر مكتمل
+    truncated = text[:last_safe].rstrip().rstrip(",")
+    stack, _, _ = _scan(truncated)
+    return _close(truncated, stack)
+
+
+def _strip_fences(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = _FENCE_RE.sub("", text)
+    start = min([i for i in (text.find("{"), text.find("[")) if i != -1], default=-1)
+    return text[start:] if start > 0 else text
+
+
+def _products_from_document(document):
+    if isinstance(document, dict):
+        products = document.get("products")
+        if isinstance(products, list):
+            return [p for p in products if isinstance(p, dict)]
+        if "name_ar" in document or "name_en" in document:
+            return [document]
+        return []
+    if isinstance(document, list):
+        return [p for p in document if isinstance(p, dict)]
+    return []
+
+
+def parse_products(text):
+    """استخراج قائمة المنتجات الخام من رد النموذج مع إصلاح JSON المقطوع"""
+    if not text:
+        return []
+    cleaned = _strip_fences(text)
+    try:
+        return _products_from_document(json.loads(cleaned))
+    except ValueError:
+        pass
+
+    # قد يكون الرد عدة كائنات متتالية (JSON Lines) أو JSON مقطوعاً
+    parser = IncrementalProductParser()
+    products = parser.feed(cleaned) + parser.finish()
+    if products:
+        return products
+    return _products_from_document(repair_json(cleaned))
+
+
+class IncrementalProductParser:
+    """محلل تدريجي يرجع كل منتج فور اكتمال كائنه في النص المتدفق"""
+
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []
+        # بدايات الكائنات المرشحة لأن تكون منتجات: (العمق، الموضع في المخزن)
+        self._candidates = []
+
+    def _is_product_position(self):
+        # منتج = كائن في المستوى الأعلى، أو عنصر في مصفوفة عليا، أو عنصر في {"products": [...]}
+        return self._stack in ([], ["["], ["{", "["])
+
+    def feed(self, text):
+        """يضيف جزءاً من النص ويرجع المنتجات التي اكتملت فيه"""
+        products = []
+        for char in text:
+            self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._is_product_position():
+                    self._candidates.append((len(self._stack), len(self._buffer) - 1))
+                self._stack.append(char)
+            elif char == "[":
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if char == "}" and self._candidates and self._candidates[-1][0] == len(self._stack):
+                    _, start = self._candidates.pop()
+                    product = self._load("".join(self._buffer[start:]))
+                    if product is not None:
+                        products.append(product)
+                if not self._candidates:
+                    self._buffer = []
+        return products
+
+    def finish(self):
+        """نهاية النص: محاولة إنقاذ آخر منتج مقطوع"""
+        products = []
+        for _, start in reversed(self._candidates):
+            product = repair_json("".join(self._buffer[start:]))
+            if self._is_product(product):
+                products.append(product)
+                break
+        self._candidates = []
+        self._buffer = []
+        return products
+
+    @staticmethod
+    def _is_product(obj):
+        return isinstance(obj, dict) and bool(obj.get("name_ar") or obj.get("name_en"))
+
+    def _load(self, text):
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            obj = repair_json(text)
+        return obj if self._is_product(obj) else None
+
+
+def _clean_text(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return None
+
+
+def _clean_list(value):
+    if isinstance(value, str):
+        value = re.split(r"[،,\n]", value)
+    if not isinstance(value, list):
+        return None
+    items = [_clean_text(item) for item in value]
+    items = [item for item in items if item]
+    return items or None
+
+
+def _clean_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value if value >= 0 else None
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value.translate(_ARABIC_DIGITS).replace(",", ""))
+        if match:
+            number = float(match.group())
+            return int(number) if number.is_integer() else number
+    return None
+
+
+def normalize_product(raw, template):
+    """تحويل منتج خام من النموذج إلى شكل المنتج المعتمد، مع الرجوع لقيمة القالب لكل حقل غير صالح"""
+    product = dict(template)
+
+    for field in TEXT_FIELDS:
+        value = _clean_text(raw.get(field))
+        if value:
+            product[field] = value
+
+    for field in LIST_FIELDS:
+        value = _clean_list(raw.get(field))
+        if value:
+            product[field] = value
+
+    difficulty = raw.get("difficulty")
+    level = _clean_number(difficulty)
+    if level is not None and 1 <= level <= 5:
+        product["difficulty"] = "⭐" * int(level)
+    elif isinstance(difficulty, str) and difficulty.strip().startswith("⭐"):
+        product["difficulty"] = difficulty.strip()
+
+    for section, fields in SECTION_TEXT_FIELDS.items():
+        raw_section = raw.get(section)
+        if not isinstance(raw_section, dict):
+            continue
+        merged = dict(template[section])
+        for field in fields:
+            value = _clean_text(raw_section.get(field))
+            if value:
+                merged[field] = value
+        if section == "marketing":
+            hashtags = _clean_list(raw_section.get("hashtags"))
+            if hashtags:
+                merged["hashtags"] = [tag if tag.startswith("#") else f"#{tag}" for tag in hashtags]
+        product[section] = merged
+
+    product["profit_analysis"] = _normalize_profit(raw.get("profit_analysis"), template["profit_analysis"])
+    return product
+
+
+def _normalize_profit(raw_profit, template_profit):
+    profit = dict(template_profit)
+    if not isinstance(raw_profit, dict):
+        return profit
+
+    purchase = _clean_number(raw_profit.get("purchase_price"))
+    suggested = _clean_number(raw_profit.get("suggested_price"))
+    if purchase is None or suggested is None or suggested <= 0:
+        # الأسعار غير صالحة: نحتفظ بتحليل القالب كاملاً حتى تبقى الأرقام متسقة
+        return profit
+
+    costs = _clean_number(raw_profit.get("total_costs"))
+    if costs is None:
+        costs = round(purchase * 0.3, 2)
+    net_profit = round(suggested - purchase - costs, 2)
+    profit.update({
+        "purchase_price": purchase,
+        "suggested_price": suggested,
+        "total_costs": costs,
+        "net_profit": net_profit,
+        "profit_margin": f"{round(net_profit / suggested * 100)}%",
+    })
+    currency = _clean_text(raw_profit.get("currency"))
+    if currency:
+        profit["currency"] = currency
+    return profit
@@ -1,45 +1,628 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, stream_with_context
 from flask_cors import CORS
-import requests
+import click
+import contextvars
+import hashlib
+import json
+import math
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-
-# إعداد التسجيل
-logging.basicConfig(level=logging.INFO)
+from functools import lru_cache
+
+from ai_parser import IncrementalProductParser, normalize_product, parse_products
+from batch import BatchRunner
+from cache import STALE, create_cache, make_cache_key
+from catalog import ProductCatalog
+from compression import compress, negotiate_encoding
+from http_client import OPENROUTER_CHAT_URL, CircuitBreaker, CircuitOpenError, OpenRouterClient, OpenRouterError
+from jobs import JobQueue, JobStore, serialize_job
+from log_config import SamplingFilter, configure_logging, parse_module_levels
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from product_model import AI_SOURCE, Product
+from profiling import SamplingProfiler
+from prompts import PromptBuilder, estimate_messages_tokens, estimate_tokens, parse_prompt_fields
+from ratelimit import (
+    BudgetExceededError, OverloadedError, RateLimiter, TokenBudget, UpstreamGate, create_admission_store,
+)
+from routing import ModelRouter, parse_models
+from scoring import ENGINE as SCORING_ENGINE, columns_from_rows, score_columns
+from semantic_cache import create_semantic_cache
+from serialization import FastJSONProvider, parse_fields, project_products
+from singleflight import SingleFlight
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, load_frontend
+from tracing import TraceIdFilter, Tracer, create_span_exporter, current_trace_id, parse_trace_header
+from warming import CacheWarmer, QueryStats, load_hot_queries, parse_hours
+
+# إعداد التسجيل: LOG_FORMAT نص أو json، و LOG_LEVELS لمستوى كل وحدة (مثل http_client=WARNING,payloads=DEBUG)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_LEVELS = parse_module_levels(os.environ.get("LOG_LEVELS", ""))
+# الكتابة من خيط خلفي عبر طابور حتى لا ينتظر خيط الطلب الكتابة على stderr (LOG_QUEUE=0 للتعطيل)،
+# والفائدة مع مخرج بطيء فقط: مع ملف محلي سريع لا يتغير عدد الطلبات في الثانية
+LOG_QUEUE = os.environ.get("LOG_QUEUE", "1") != "0"
+# نسبة ردود الذكاء الاصطناعي التي تُسجل في payloads عند تفعيله بمستوى DEBUG
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+# كل سطر يحمل رقم تتبع الطلب
+configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, use_queue=LOG_QUEUE, filters=[TraceIdFilter()])
 logger = logging.getLogger(__name__)
+payload_logger = logging.getLogger("payloads")
+payload_logger.addFilter(SamplingFilter(LOG_PAYLOAD_SAMPLE_RATE))
+
+app = Flask(__name__, static_folder=None)
+CORS(app, expose_headers=["X-Trace-Id", "X-Profile-File", "Retry-After"])
 
-app = Flask(__name__)
-CORS(app)
+# مشفر JSON لـ jsonify: auto (orjson إن توفر) أو orjson أو json
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "auto")
+# ضغط ردود JSON التي يتجاوز حجمها هذا الحد (0 لتعطيل الضغط)
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+app.json = FastJSONProvider(app, encoder=JSON_ENCODER)
 
 # إعداد مفتاح OpenRouter - ضع مفتاحك هنا
 OPENROUTER_API_KEY = ""
 
+# مجلد ملفات الواجهة (index.html و styles.css و script.js)
+FRONTEND_DIR = os.environ.get(
+    "FRONTEND_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend")
+)
+
+# إعدادات كاش النتائج (memory أو sqlite للمشاركة بين عمال gunicorn)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "900"))
+# stale-while-revalidate: بعد CACHE_TTL_SECONDS تُقدَّم النتيجة فوراً وتُحدَّث في الخلفية حتى CACHE_HARD_TTL_SECONDS،
+# وبعدها تبقى CACHE_STALE_IF_ERROR_SECONDS لتقديمها مع stale: true إذا فشل OpenRouter
+CACHE_HARD_TTL_SECONDS = int(os.environ.get("CACHE_HARD_TTL_SECONDS", "3600"))
+CACHE_STALE_IF_ERROR_SECONDS = int(os.environ.get("CACHE_STALE_IF_ERROR_SECONDS", "86400"))
+CACHE_REFRESH_WORKERS = int(os.environ.get("CACHE_REFRESH_WORKERS", "4"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "analyzer_cache.sqlite3")
+
+# الكاش الدلالي: إعادة استخدام تحليل استعلام قريب (توحيد عربي + تشابه n-grams)
+SEMANTIC_CACHE = os.environ.get("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_BACKEND = os.environ.get("SEMANTIC_CACHE_BACKEND", CACHE_BACKEND)
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_SQLITE_PATH = os.environ.get("SEMANTIC_CACHE_SQLITE_PATH", "analyzer_semantic.sqlite3")
+
+# كتالوج المنتجات المحللة سابقاً (SQLite FTS5): يجيب البحث محلياً ولا يطلب تحليلاً جديداً إلا لفجوات التغطية
+CATALOG = os.environ.get("CATALOG", "1") == "1"
+CATALOG_SQLITE_PATH = os.environ.get("CATALOG_SQLITE_PATH", "analyzer_catalog.sqlite3")
+CATALOG_MIN_RESULTS = int(os.environ.get("CATALOG_MIN_RESULTS", "5"))
+CATALOG_MAX_RESULTS = int(os.environ.get("CATALOG_MAX_RESULTS", "10"))
+CATALOG_MAX_AGE_HOURS = float(os.environ.get("CATALOG_MAX_AGE_HOURS", "168"))
+CATALOG_MAX_PRODUCTS = int(os.environ.get("CATALOG_MAX_PRODUCTS", "100000"))
+CATALOG_SEARCH_MAX_LIMIT = int(os.environ.get("CATALOG_SEARCH_MAX_LIMIT", "100"))
+
+# إعدادات عميل OpenRouter (تجميع الاتصالات، المهلات، إعادة المحاولة، قاطع الدائرة)
+OPENROUTER_API_URL = os.environ.get("OPENROUTER_API_URL", OPENROUTER_CHAT_URL)
+OPENROUTER_POOL_SIZE = int(os.environ.get("OPENROUTER_POOL_SIZE", "10"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.environ.get("OPENROUTER_CONNECT_TIMEOUT", "5"))
+OPENROUTER_READ_TIMEOUT = float(os.environ.get("OPENROUTER_READ_TIMEOUT", "30"))
+OPENROUTER_MAX_RETRIES = int(os.environ.get("OPENROUTER_MAX_RETRIES", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(os.environ.get("CIRCUIT_RECOVERY_SECONDS", "30"))
+
+# طلب التحليل: عدد المنتجات والحقول المطلوبة من النموذج (AI_PROMPT_FIELDS فارغ = كل الحقول)،
+# و max_tokens يُحسب منهما بهامش AI_OUTPUT_MARGIN وبحد أقصى AI_MAX_TOKENS
+AI_PRODUCT_COUNT = int(os.environ.get("AI_PRODUCT_COUNT", "3"))
+AI_PROMPT_FIELDS = parse_prompt_fields(os.environ.get("AI_PROMPT_FIELDS", ""))
+AI_TEMPERATURE = float(os.environ.get("AI_TEMPERATURE", "0.7"))
+AI_MAX_TOKENS = int(os.environ.get("AI_MAX_TOKENS", "2000"))
+AI_OUTPUT_MARGIN = float(os.environ.get("AI_OUTPUT_MARGIN", "1.25"))
+
+# نماذج OpenRouter مفصولة بفواصل، وكل طلب يذهب لأسرع نموذج سليم حسب آخر MODEL_LATENCY_WINDOW استدعاء ناجح
+OPENROUTER_MODELS = parse_models(os.environ.get("OPENROUTER_MODELS", "openai/gpt-3.5-turbo"))
+MODEL_LATENCY_WINDOW = int(os.environ.get("MODEL_LATENCY_WINDOW", "100"))
+MODEL_FAILURE_THRESHOLD = int(os.environ.get("MODEL_FAILURE_THRESHOLD", "3"))
+MODEL_RECOVERY_SECONDS = float(os.environ.get("MODEL_RECOVERY_SECONDS", "60"))
+# طلب احتياطي لنموذج بديل إذا تجاوز الطلب زمن HEDGE_QUANTILE لنموذجه (بعد HEDGE_MIN_SAMPLES قياس)،
+# وأول رد ناجح يُعتمد. HEDGE_WORKERS خيوط الطلبات المتسابقة، والأفضل ضعف UPSTREAM_MAX_INFLIGHT.
+# معطل افتراضياً: الطلب الخاسر في المحرك المتزامن يكمل حتى رده (يتوقف فقط قبل إعادة المحاولة) فيُحسب
+# استدعاءً ثانياً من حصة OpenRouter، ويُفعّل بعد التأكد من فائدته للذيل بـ benchmarks/model_routing_bench.py
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "0") == "1"
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", "16"))
+
+# إعدادات التحليل الجماعي
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "500"))
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "16"))
+BATCH_DEFAULT_CONCURRENCY = int(os.environ.get("BATCH_DEFAULT_CONCURRENCY", "4"))
+
+# إعدادات مهام الخلفية (JOB_WORKERS=0 لتعطيل التنفيذ في هذه العملية)
+JOBS_SQLITE_PATH = os.environ.get("JOBS_SQLITE_PATH", "analyzer_jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "600"))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "86400"))
+
+# تقييم المنتجات المرشحة دفعة واحدة (/api/score)
+SCORE_MAX_CANDIDATES = int(os.environ.get("SCORE_MAX_CANDIDATES", "100000"))
+
+# تسخين الكاش: تحليل الاستعلامات الساخنة مسبقاً خارج الذروة (WARM_ENABLED=1 للجدولة في الخلفية)
+# المصادر: ملف JSON بصيغة {"sa": ["ساعة ذكية", ...]} والأكثر طلباً خلال WARM_STATS_WINDOW_HOURS
+WARM_ENABLED = os.environ.get("WARM_ENABLED", "0") == "1"
+WARM_QUERIES_FILE = os.environ.get("WARM_QUERIES_FILE", "")
+WARM_FROM_STATS = os.environ.get("WARM_FROM_STATS", "1") == "1"
+WARM_STATS_SQLITE_PATH = os.environ.get("WARM_STATS_SQLITE_PATH", "analyzer_query_stats.sqlite3")
+WARM_STATS_WINDOW_HOURS = float(os.environ.get("WARM_STATS_WINDOW_HOURS", "72"))
+WARM_COUNTRIES = [c.strip() for c in os.environ.get("WARM_COUNTRIES", "sa,eg,ae,global").split(",") if c.strip()]
+WARM_TOP_N = int(os.environ.get("WARM_TOP_N", "50"))
+WARM_RATE_PER_MINUTE = float(os.environ.get("WARM_RATE_PER_MINUTE", "30"))
+WARM_TTL_SECONDS = int(os.environ.get("WARM_TTL_SECONDS", "86400"))
+WARM_HOURS = os.environ.get("WARM_HOURS", "2-6")
+WARM_INTERVAL_SECONDS = float(os.environ.get("WARM_INTERVAL_SECONDS", "3600"))
+WARM_LOCK_PATH = os.environ.get("WARM_LOCK_PATH", "analyzer_warm.lock")
+
+# الحد من الطلبات لكل عميل (مفتاح API أو IP) ومن استدعاءات OpenRouter المتزامنة
+# (sqlite لتسري الحدود على كل عمال gunicorn معاً، memory للعملية الحالية فقط)
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_SQLITE_PATH = os.environ.get("RATE_LIMIT_SQLITE_PATH", "analyzer_limits.sqlite3")
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "20"))
+# استخدام أول عنوان في X-Forwarded-For (فقط خلف proxy موثوق)
+RATE_LIMIT_TRUST_PROXY = os.environ.get("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+UPSTREAM_MAX_INFLIGHT = int(os.environ.get("UPSTREAM_MAX_INFLIGHT", "8"))
+UPSTREAM_MAX_QUEUED = int(os.environ.get("UPSTREAM_MAX_QUEUED", "16"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "10"))
+# عند امتلاء الطابور: sample (بيانات تجريبية فوراً) أو reject (رد 429 مع Retry-After)
+SHED_MODE = os.environ.get("SHED_MODE", "sample")
+SHED_RETRY_AFTER_SECONDS = float(os.environ.get("SHED_RETRY_AFTER_SECONDS", "5"))
+# ميزانية tokens في الدقيقة لكل استدعاءات OpenRouter (0 للتعطيل)، وبعد نفادها نتيجة قديمة أو تجريبية
+TOKEN_BUDGET_PER_MINUTE = int(os.environ.get("TOKEN_BUDGET_PER_MINUTE", "0"))
+
+# عدد الخيوط المخصصة لتوزيع platform=all على المنصات بالتوازي
+FANOUT_MAX_WORKERS = int(os.environ.get("FANOUT_MAX_WORKERS", "12"))
+
+# مجلد ملفات المقاييس المشترك بين عمال gunicorn (فارغ = مقاييس العملية الحالية فقط)
+METRICS_DIR = os.environ.get("METRICS_DIR", "analyzer_metrics")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+
+# التتبع: TRACE_EXPORT فارغ (معطل) أو مسار ملف JSON Lines أو رابط collector
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+
+# بروفايلر العينات لكل طلب: off أو header (الطلبات التي ترسل X-Profile: 1) أو all
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "off")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+
+PLATFORM_NAMES = {'amazon': 'أمازون', 'aliexpress': 'علي اكسبريس', 'noon': 'نون'}
+COMPETITION_RANK = {"منخفض": 0, "متوسط": 1, "عالي": 2}
+
+# مقاييس Prometheus (/metrics)
+metrics_registry = MetricsRegistry(METRICS_DIR, flush_interval=METRICS_FLUSH_SECONDS)
+HTTP_REQUESTS = metrics_registry.counter(
+    "analyzer_http_requests_total", "HTTP requests by endpoint and status", ("endpoint", "method", "status"))
+HTTP_REQUEST_SECONDS = metrics_registry.histogram(
+    "analyzer_http_request_duration_seconds", "Time to build the HTTP response", ("endpoint", "method"))
+STAGE_SECONDS = metrics_registry.histogram(
+    "analyzer_stage_duration_seconds", "Latency of each analysis stage", ("stage", "country", "platform"))
+RESULTS_TOTAL = metrics_registry.counter(
+    "analyzer_results_total", "Analysis results by source (ai, cache, sample)", ("source", "country", "platform"))
+FALLBACKS_TOTAL = metrics_registry.counter(
+    "analyzer_fallbacks_total", "Fallbacks to sample data by reason", ("reason", "country", "platform"))
+UPSTREAM_ERRORS_TOTAL = metrics_registry.counter(
+    "analyzer_openrouter_errors_total", "OpenRouter failures after retries", ("kind",))
+ADMISSION_TOTAL = metrics_registry.counter(
+    "analyzer_admission_rejections_total", "Requests rate limited or shed by admission control", ("outcome",))
+REVALIDATIONS_TOTAL = metrics_registry.counter(
+    "analyzer_cache_revalidations_total", "Background refreshes of stale cache entries")
+SEMANTIC_LOOKUPS_TOTAL = metrics_registry.counter(
+    "analyzer_semantic_cache_lookups_total", "Semantic cache lookups by matching rule or miss", ("rule",))
+CATALOG_LOOKUPS_TOTAL = metrics_registry.counter(
+    "analyzer_catalog_lookups_total", "Product catalog lookups answered locally (hit) or sent upstream (gap)",
+    ("outcome",))
+OPENROUTER_TOKENS_TOTAL = metrics_registry.counter(
+    "analyzer_openrouter_tokens_total", "OpenRouter tokens used by kind (prompt, completion)", ("kind",))
+OPENROUTER_REQUEST_TOKENS = metrics_registry.histogram(
+    "analyzer_openrouter_request_tokens", "Tokens per OpenRouter request by kind (prompt, completion)", ("kind",),
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000))
+OPENROUTER_MODEL_REQUESTS = metrics_registry.counter(
+    "analyzer_openrouter_model_requests_total",
+    "OpenRouter calls by model, role (primary, hedge) and outcome (success, lost, error, cancelled)",
+    ("model", "role", "outcome"))
+OPENROUTER_MODEL_SECONDS = metrics_registry.histogram(
+    "analyzer_openrouter_model_duration_seconds", "Latency of successful OpenRouter calls by model", ("model",))
+JOBS_TOTAL = metrics_registry.counter(
+    "analyzer_jobs_total", "Background analysis jobs finished by outcome (done, failed)", ("outcome",))
+JOB_WAIT_SECONDS = metrics_registry.histogram(
+    "analyzer_job_wait_seconds", "Time background jobs wait in the queue before a worker starts them",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600, 1800))
+# حالة الطابور تُقرأ من قاعدة المهام المشتركة بين العمال عند طلب /metrics (job_queue معرف لاحقاً)
+metrics_registry.gauge(
+    "analyzer_job_queue_jobs", "Background analysis jobs in the shared store by status",
+    lambda: job_queue.store.counts(), ("status",))
+metrics_registry.gauge(
+    "analyzer_job_queue_oldest_seconds", "Age of the oldest queued background job",
+    lambda: job_queue.store.oldest_queued_age())
+
+# القيم المسموحة في تسميات المقاييس، وأي قيمة أخرى تسجل كـ other حتى لا يتضخم عدد السلاسل
+METRIC_COUNTRIES = ('sa', 'eg', 'ae', 'global')
+METRIC_PLATFORMS = ('all', 'amazon', 'aliexpress', 'noon', 'tiktok')
+
+def metric_labels(country, platform):
+    return {
+        "country": country if country in METRIC_COUNTRIES else "other",
+        "platform": platform if platform in METRIC_PLATFORMS else "other",
+    }
+
+def observe_model_call(model, role, outcome, seconds):
+    """مقاييس كل استدعاء يرسله ModelRouter (النماذج من الإعدادات فعددها محدود)"""
+    OPENROUTER_MODEL_REQUESTS.inc(model=model, role=role, outcome=outcome)
+    if seconds is not None:
+        OPENROUTER_MODEL_SECONDS.observe(seconds, model=model)
+
+def observe_job(outcome, wait_seconds):
+    """مقاييس كل مهمة خلفية منتهية"""
+    JOBS_TOTAL.inc(outcome=outcome)
+    JOB_WAIT_SECONDS.observe(wait_seconds)
+
+tracer = Tracer(create_span_exporter(TRACE_EXPORT), sample_rate=TRACE_SAMPLE_RATE)
+
+@contextmanager
+def stage(name, country, platform):
+    """خطوة في مسار التحليل: تُقاس في /metrics وتظهر كخطوة في التتبع"""
+    labels = metric_labels(country, platform)
+    with tracer.span(name, **labels), STAGE_SECONDS.time(stage=name, **labels):
+        yield
+
 class SmartProductAnalyzer:
-    def __init__(self):
+    def __init__(self, cache=None, client=None, gate=None, semantic=None, catalog=None, prompts=None,
+                 token_budget=None, router=None):
         self.supported_platforms = ['amazon', 'aliexpress', 'noon', 'all']
+        self.cache = cache
+        self.semantic = semantic
+        self.catalog = catalog
+        self.client = client or OpenRouterClient()
+        self.gate = gate
+        self.prompts = prompts or PromptBuilder()
+        self.token_budget = token_budget
+        self.router = router or ModelRouter(OPENROUTER_MODELS)
+        self.inflight = SingleFlight()
+        self.fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout")
+        self.refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="revalidate")
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+    
+    @property
+    def fanout_platforms(self):
+        return [p for p in self.supported_platforms if p != 'all']
         
     def search_products(self, query, country, platform):
         """بحث ذكي في منصات متعددة"""
-        logger.info(f"بحث عن: {query} في {platform} للسوق {country}")
+        with tracer.span("search_products", query=query, **metric_labels(country, platform)):
+            return self._search_products(query, country, platform)
+    
+    def _search_products(self, query, country, platform):
+        logger.info("بحث عن: %s في %s للسوق %s", query, platform, country)
+        
+        # platform=all: طلب أصغر لكل منصة بالتوازي، وكل منصة لها مدخل كاش خاص بها
+        if platform == 'all' and OPENROUTER_API_KEY:
+            return self._search_all_platforms(query, country)
+        
+        # التحقق من الكاش قبل أي طلب للذكاء الاصطناعي
+        cache_key = make_cache_key(query, country, platform)
+        cached_products = self.cached_products(cache_key, query, country, platform)
+        if cached_products is not None:
+            return cached_products
+        
+        # الطلبات المتطابقة المتزامنة تنتظر نتيجة الطلب الأول بدلاً من تكرار الاستدعاء
+        with tracer.span("analyze_uncached"):
+            return self.inflight.do(cache_key, self._analyze_uncached, query, country, platform, cache_key)
+    
+    def cached_products(self, cache_key, query, country, platform):
+        """قراءة النتيجة من الكاش مع قياس زمن القراءة، ثم استعلام قريب في الكاش الدلالي، ثم كتالوج المنتجات"""
+        if self.cache is None:
+            return self.catalog_products(query, country, platform)
+        with stage("cache_lookup", country, platform):
+            entry = self.cache.lookup(cache_key)
+        products = None
+        if entry is not None:
+            products, state = entry
+            if state == STALE:
+                # النتيجة تُقدَّم الآن وتحديثها لا يؤخر هذا الطلب
+                self.schedule_refresh(query, country, platform)
+        elif self.semantic is not None:
+            with stage("semantic_lookup", country, platform):
+                match = self.semantic.lookup(query, country, platform)
+            SEMANTIC_LOOKUPS_TOTAL.inc(rule=match[1] if match is not None else "miss")
+            if match is not None:
+                products, rule, score = match
+                logger.info("⚡ نتيجة استعلام قريب من الكاش الدلالي (%s، %s)", rule, score)
+        if products is None:
+            return self.catalog_products(query, country, platform)
+        logger.info("⚡ تم العثور على النتائج في الكاش")
+        RESULTS_TOTAL.inc(source="cache", **metric_labels(country, platform))
+        return products
+    
+    def catalog_products(self, query, country, platform):
+        """منتجات مطابقة من الكتالوج المحلي إن كانت كافية، وإلا None فيُطلب تحليل جديد"""
+        if self.catalog is None:
+            return None
+        with stage("catalog_lookup", country, platform):
+            products = self.catalog.lookup(query, country, platform)
+        CATALOG_LOOKUPS_TOTAL.inc(outcome="hit" if products is not None else "gap")
+        if products is not None:
+            logger.info("📚 تم العثور على %s منتج في الكتالوج", len(products))
+            RESULTS_TOTAL.inc(source="catalog", **metric_labels(country, platform))
+        return products
+    
+    def schedule_refresh(self, query, country, platform):
+        """تحديث مدخل الكاش في الخلفية، مرة واحدة لكل مفتاح في نفس الوقت"""
+        cache_key = make_cache_key(query, country, platform)
+        with self._refreshing_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+        
+        def run():
+            try:
+                self.refresh(query, country, platform)
+            except Exception as e:
+                logger.warning("⚠️ فشل تحديث الكاش في الخلفية: %s", e)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(cache_key)
         
+        REVALIDATIONS_TOTAL.inc()
+        self.refresh_executor.submit(run)
+    
+    def stale_products(self, query, country, platform):
+        """آخر نتيجة محفوظة للاستعلام مع stale: true في كل منتج، أو None"""
+        if self.cache is None:
+            return None
+        products = self.cache.get_stale(make_cache_key(query, country, platform))
+        if products is None:
+            return None
+        logger.warning("⚠️ تقديم نتيجة قديمة من الكاش بدلاً من البيانات التجريبية")
+        RESULTS_TOTAL.inc(source="stale", **metric_labels(country, platform))
+        # نسخ لأن المنتجات المخزنة مشتركة بين الطلبات
+        return [dict(product, stale=True) for product in products]
+    
+    def fallback_products(self, query, country, platform, reason):
+        """عند فشل التحليل: النتيجة القديمة إن وُجدت وإلا البيانات التجريبية"""
+        products = self.stale_products(query, country, platform)
+        if products is not None:
+            return products
+        self.record_fallback(country, platform, reason)
+        return self.generate_sample_data(query, country, platform)
+    
+    def refresh(self, query, country, platform, ttl_seconds=None):
+        """تحليل جديد بدون قراءة الكاش وتخزينه (لتسخين الكاش)، مع دمج الطلبات المتزامنة لنفس المفتاح"""
+        cache_key = make_cache_key(query, country, platform)
+        return self.inflight.do(cache_key, self._analyze_uncached, query, country, platform, cache_key, ttl_seconds)
+    
+    def store_products(self, cache_key, query, country, platform, products, ttl_seconds=None):
+        """حفظ نتيجة الذكاء الاصطناعي في الكاش والكتالوج وتسجيل الاستعلام في الكاش الدلالي"""
+        if self.catalog is not None:
+            with stage("catalog_index", country, platform):
+                self.catalog.add(products, country, platform)
+        if self.cache is None:
+            return
+        self.cache.set(cache_key, products, ttl_seconds=ttl_seconds)
+        if self.semantic is not None:
+            self.semantic.add(cache_key, query, country, platform)
+    
+    @staticmethod
+    def record_fallback(country, platform, reason):
+        logger.info("🔄 استخدام البيانات التجريبية")
+        RESULTS_TOTAL.inc(source="sample", **metric_labels(country, platform))
+        FALLBACKS_TOTAL.inc(reason=reason, **metric_labels(country, platform))
+    
+    @staticmethod
+    def record_upstream_error(error):
+        """تصنيف فشل OpenRouter: circuit_open أو http_<code> أو connection أو invalid_response"""
+        if isinstance(error, CircuitOpenError):
+            kind = "circuit_open"
+        elif isinstance(error, OpenRouterError):
+            kind = f"http_{error.status_code}" if error.status_code else "connection"
+        else:
+            kind = "invalid_response"
+        UPSTREAM_ERRORS_TOTAL.inc(kind=kind)
+    
+    def upstream_slot(self):
+        """خانة من الحد الأقصى لاستدعاءات OpenRouter المتزامنة (OverloadedError إذا امتلأ الطابور)"""
+        return self.gate.admit() if self.gate is not None else nullcontext()
+    
+    def shed_load(self, error, query, country, platform):
+        """تخفيف الحمل: نتيجة قديمة إن وُجدت، وإلا 429 في وضع reject أو بيانات تجريبية بدون انتظار OpenRouter"""
+        logger.warning("⚠️ تخفيف الحمل (%s): %s", SHED_MODE, error)
+        ADMISSION_TOTAL.inc(outcome="shed")
+        stale = self.stale_products(query, country, platform)
+        if stale is not None:
+            return stale
+        if SHED_MODE == 'reject':
+            raise error
+        self.record_fallback(country, platform, "shed")
+        return self.generate_sample_data(query, country, platform)
+    
+    def budget_exhausted(self, error, query, country, platform):
+        """نفاد ميزانية tokens: النتيجة القديمة إن وُجدت وإلا البيانات التجريبية، بدون رفض الطلب"""
+        logger.warning("⚠️ نفدت ميزانية tokens لهذه الدقيقة (تتجدد بعد %.1f ثانية)", error.retry_after)
+        ADMISSION_TOTAL.inc(outcome="token_budget")
+        return self.fallback_products(query, country, platform, "token_budget")
+    
+    @contextmanager
+    def token_usage(self, data, country, platform):
+        """حجز tokens الطلب من الميزانية قبل الإرسال، ثم تسجيل الاستهلاك الفعلي ورد الفرق بعد الرد
+        
+        المستدعي يضع رد OpenRouter في response أو أجزاء البث في completion، وusage في الرد مقدم على التقدير.
+        allow_hedge يحجز tokens الطلب الاحتياطي قبل إرساله (False إذا نفدت الميزانية).
+        """
+        call = self.reserve_tokens(data)
+        try:
+            yield call
+        finally:
+            self.settle_tokens(call, data, country, platform)
+    
+    def reserve_tokens(self, data):
+        """الحجز قبل الإرسال: يرجع call الذي يضع فيه المستدعي الرد ثم يُمرر إلى settle_tokens"""
+        prompt_estimate = estimate_messages_tokens(data["messages"])
+        reserved = 0
+        if self.token_budget is not None:
+            reserved = self.token_budget.reserve(prompt_estimate + data["max_tokens"])
+        hedges = []
+        
+        def allow_hedge():
+            try:
+                hedges.append(self.token_budget.reserve(prompt_estimate + data["max_tokens"])
+                              if self.token_budget is not None else 0)
+            except BudgetExceededError:
+                return False
+            return True
+        
+        return {"allow_hedge": allow_hedge, "prompt_estimate": prompt_estimate, "reserved": reserved,
+                "hedges": hedges, "started": time.perf_counter()}
+    
+    def settle_tokens(self, call, data, country, platform):
+        """تسجيل الاستهلاك الفعلي بعد الرد ورد الفرق بينه وبين المحجوز إلى الميزانية"""
+        prompt_estimate = call["prompt_estimate"]
+        hedges = call["hedges"]
+        prompt_tokens, completion_tokens = self._used_tokens(call, prompt_estimate)
+        # الطلب الخاسر استهلك تعليماته على الأقل، وما ولّده قبل إلغائه غير معروف
+        prompt_tokens += prompt_estimate * len(hedges)
+        if self.token_budget is not None:
+            self.token_budget.settle(call["reserved"] + sum(hedges), prompt_tokens + completion_tokens)
+        # بدون رد (فشل الاتصال) لا يوجد استهلاك لتسجيله
+        if "response" in call or "completion" in call:
+            for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+                OPENROUTER_TOKENS_TOTAL.inc(tokens, kind=kind)
+                OPENROUTER_REQUEST_TOKENS.observe(tokens, kind=kind)
+            logger.info("🔢 OpenRouter: %s tokens للتعليمات و %s للرد (max_tokens %s) خلال %.2f ثانية",
+                        prompt_tokens, completion_tokens, data["max_tokens"], time.perf_counter() - call["started"],
+                        extra={"country": country, "platform": platform})
+    
+    @staticmethod
+    def _used_tokens(call, prompt_estimate):
+        """(tokens التعليمات، tokens الرد) من usage في رد OpenRouter، أو تقديرها من نص الرد"""
+        if "response" in call:
+            response = call["response"]
+            reported = response.get("usage") or {}
+            try:
+                text = response["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                text = ""
+        elif "completion" in call:
+            reported = {}
+            text = "".join(call["completion"])
+        else:
+            return 0, 0
+        return (reported.get("prompt_tokens") or prompt_estimate,
+                reported.get("completion_tokens") or estimate_tokens(text))
+    
+    def _submit_platform_searches(self, query, country):
+        # نسخة من السياق لكل منصة حتى تنتقل خطوات التتبع ورقم الطلب إلى خيوط التوزيع
+        return {
+            self.fanout_executor.submit(contextvars.copy_context().run, self.search_products, query, country, p): p
+            for p in self.fanout_platforms
+        }
+    
+    def _search_all_platforms(self, query, country):
+        """توزيع البحث على كل المنصات ثم دمج النتائج وترتيبها"""
+        results = {}
+        overloaded = None
+        futures = self._submit_platform_searches(query, country)
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except OverloadedError as e:
+                overloaded = e
+            except Exception as e:
+                logger.warning("⚠️ فشل البحث في %s: %s", futures[future], e)
+        
+        if not results:
+            if overloaded is not None:
+                raise overloaded
+            self.record_fallback(country, 'all', "all_platforms_failed")
+            return self.generate_sample_data(query, country, 'all')
+        return self.merge_platform_results(results)
+    
+    @staticmethod
+    def _dedupe_key(product):
+        name = product.get('name_en') or product.get('name_ar') or product.get('id', '')
+        return " ".join(str(name).lower().split())
+    
+    @staticmethod
+    def _rank_key(product):
+        """ترتيب المنتجات: هامش الربح الأعلى أولاً ثم المنافسة الأقل"""
+        margin = str(product.get('profit_analysis', {}).get('profit_margin', '0')).rstrip('%')
+        try:
+            margin = float(margin)
+        except ValueError:
+            margin = 0.0
+        competition = product.get('market_analysis', {}).get('competition')
+        return (-margin, COMPETITION_RANK.get(competition, len(COMPETITION_RANK)))
+    
+    def merge_platform_results(self, results):
+        """دمج نتائج المنصات مع إزالة المكرر وترتيب النتيجة"""
+        merged = {}
+        for platform in self.fanout_platforms:
+            for product in results.get(platform) or []:
+                key = self._dedupe_key(product)
+                existing = merged.get(key)
+                if existing is None:
+                    # نسخة سطحية حتى لا نعدل المنتجات المخزنة في الكاش
+                    merged[key] = dict(product, platforms=[platform])
+                elif platform not in existing['platforms']:
+                    existing['platforms'].append(platform)
+                    if self._rank_key(product) < self._rank_key(existing):
+                        merged[key] = dict(product, platforms=existing['platforms'])
+        return sorted(merged.values(), key=self._rank_key)
+    
+    def _analyze_uncached(self, query, country, platform, cache_key, ttl_seconds=None):
+        """التحليل الفعلي عند عدم وجود النتيجة في الكاش"""
         # محاولة استخدام OpenRouter أولاً
         try:
             if OPENROUTER_API_KEY:
-                logger.info("🔄 محاولة استخدام OpenRouter API...")
-                ai_products = self.analyze_with_ai(query, country, platform)
+                logger.debug("🔄 محاولة استخدام OpenRouter API...")
+                with self.upstream_slot():
+                    ai_products = self.analyze_with_ai(query, country, platform)
                 if ai_products:
                     logger.info("✅ تم استخدام تحليل الذكاء الاصطناعي بنجاح")
+                    RESULTS_TOTAL.inc(source="ai", **metric_labels(country, platform))
+                    # نخزن نتائج الذكاء الاصطناعي فقط، البيانات التجريبية رخيصة التوليد
+                    self.store_products(cache_key, query, country, platform, ai_products, ttl_seconds)
                     return ai_products
                 else:
                     logger.warning("⚠️ الذكاء الاصطناعي return None, استخدام البيانات التجريبية")
+        except BudgetExceededError as e:
+            return self.budget_exhausted(e, query, country, platform)
+        except OverloadedError as e:
+            return self.shed_load(e, query, country, platform)
         except Exception as e:
-            logger.warning(f"⚠️ فشل التحليل بالذكاء الاصطناعي: {str(e)}")
+            logger.warning("⚠️ فشل التحليل بالذكاء الاصطناعي: %s", e)
         
-        # العودة للبيانات التجريبية إذا فشل API
-        logger.info("🔄 استخدام البيانات التجريبية")
-        return self.generate_sample_data(query, country, platform)
+        # العودة للنتيجة القديمة أو البيانات التجريبية إذا فشل API
+        return self.fallback_products(query, country, platform, "ai_unavailable" if OPENROUTER_API_KEY else "no_api_key")
+    
+    def build_ai_request(self, query, country, platform, stream=False):
+        """تجهيز ترويسات وجسم طلب OpenRouter"""
+        # إعداد الطلب لـ OpenRouter API
+        headers = {
+            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://localhost",
+            "X-Title": "Smart Product Analyzer"
+        }
+        
+        data = {
+            "model": self.router.default_model,
+            "messages": self.prompts.messages(query, country, PLATFORM_NAMES.get(platform, platform)),
+            "temperature": self.prompts.temperature,
+            "max_tokens": self.prompts.max_tokens,
+            "response_format": {"type": "json_object"}
+        }
+        
+        if stream:
+            data["stream"] = True
+        return headers, data
     
     def analyze_with_ai(self, query, country, platform):
         """تحليل المنتجات باستخدام OpenRouter API"""
@@ -49,958 +632,946 @@ class SmartProductAnalyzer:
                 logger.warning("⚠️ OpenRouter API Key غير مضبوط")
                 return None
             
-            # إعداد الطلب لـ OpenRouter API
-            headers = {
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://localhost",
-                "X-Title": "Smart Product Analyzer"
-            }
-            
-            data = {
-                "model": "openai/gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": """أنت محلل منتجات اقتصادي خبير في السوق العربي. 
-قدم تحليلات واقعية وقابلة للتنفيذ للمنتجات الرابحة.
-أرجع البيانات في شكل منظم وجاهز للبرمجة."""
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"""
-قم بتحليل فرص الربح للمنتج: {query}
-للأسواق العربية خاصة: {country} على المنصة: {platform}
-
-المطلوب تحليل 3 منتجات مقترحة مع البيانات التالية لكل منتج:
-- اسم عربي للمنتج
-- اسم إنجليزي للمنتج  
-- وصف قصير
-- فئة المنتج
-- سبب الربحية
-- الجمهور المستهدف
-- الفئة العمرية
-- الاهتمامات
-- المشكلة التي يحلها
-- تحليل ربحي (سعر شراء، سعر بيع، هامش ربح)
-- نصائح تسويقية
-- تحليل السوق
-- نصائح الخبراء
-
-يجب أن تكون البيانات واقعية وقابلة للتنفيذ في السوق العربي.
-"""
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-            
-            # إرسال الطلب إلى OpenRouter API
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
+            headers, data = self.build_ai_request(query, country, platform)
             
-            # معالجة الرد
-            if response.status_code == 200:
-                result = response.json()
-                ai_text = result['choices'][0]['message']['content']
-                logger.info(f"✅ OpenRouter API responded successfully")
-                
-                # طباعة الرد لأغراض debugging
-                print("=== OpenRouter Response ===")
-                print(ai_text[:500])  # أول 500 حرف فقط
-                print("========================")
-                
-                return self.parse_ai_response(ai_text, query, country, platform)
-            else:
-                logger.error(f"❌ OpenRouter API error: {response.status_code} - {response.text}")
-                return None
+            # إرسال الطلب إلى OpenRouter API عبر الجلسة المشتركة
+            with self.token_usage(data, country, platform) as call:
+                with stage("openrouter", country, platform):
+                    # أسرع نموذج سليم، مع طلب احتياطي لنموذج بديل إذا تأخر الرد
+                    call["response"] = result = self.router.complete(
+                        self.client.chat_completion, data, headers, allow_hedge=call["allow_hedge"])
+            return self.handle_ai_result(result, query, country, platform)
                 
+        except BudgetExceededError:
+            raise
+        except CircuitOpenError as e:
+            logger.warning("⚡ قاطع الدائرة مفتوح، تخطي OpenRouter مؤقتاً")
+            self.record_upstream_error(e)
+            return None
+        except OpenRouterError as e:
+            logger.error("❌ OpenRouter API error: %s", e)
+            self.record_upstream_error(e)
+            return None
         except Exception as e:
-            logger.error(f"❌ OpenRouter connection error: {str(e)}")
+            logger.error("❌ OpenRouter connection error: %s", e)
+            self.record_upstream_error(e)
             return None
     
+    def stream_products(self, query, country, platform):
+        """مولد يرجع المنتجات واحداً تلو الآخر فور تحليلها من رد OpenRouter"""
+        if platform == 'all' and OPENROUTER_API_KEY:
+            # نتائج كل منصة ترسل فور انتهائها، بدون تكرار المنتجات بين المنصات
+            seen = set()
+            overloaded = None
+            futures = self._submit_platform_searches(query, country)
+            for future in as_completed(futures):
+                try:
+                    products = future.result()
+                except OverloadedError as e:
+                    overloaded = e
+                    continue
+                except Exception as e:
+                    logger.warning("⚠️ فشل البحث في %s: %s", futures[future], e)
+                    continue
+                for product in products:
+                    key = self._dedupe_key(product)
+                    if key not in seen:
+                        seen.add(key)
+                        yield dict(product, platforms=[futures[future]])
+            if not seen:
+                if overloaded is not None:
+                    raise overloaded
+                self.record_fallback(country, 'all', "all_platforms_failed")
+                yield from self.generate_sample_data(query, country, 'all')
+            return
+        
+        cache_key = make_cache_key(query, country, platform)
+        cached_products = self.cached_products(cache_key, query, country, platform)
+        if cached_products is not None:
+            yield from cached_products
+            return
+        
+        streamed = []
+        if OPENROUTER_API_KEY:
+            model = None
+            settled = False
+            try:
+                headers, data = self.build_ai_request(query, country, platform, stream=True)
+                # البث بدون طلب احتياطي: لا يمكن تبديل النموذج بعد بدء الإرسال للعميل
+                model = data["model"] = self.router.select()
+                templates = self.generate_sample_data(query, country, platform)
+                parser = IncrementalProductParser()
+                
+                def emit(raw_products):
+                    nonlocal settled
+                    for raw in raw_products:
+                        if not settled:
+                            # نتيجة الاستدعاء تُسجل مرة واحدة عند أول منتج، وزمن أول منتج هو ما يدخل في ترتيب
+                            # النماذج (مدة البث كاملة تعتمد على طول الرد)
+                            self.router.record_success(model, time.perf_counter() - started)
+                            settled = True
+                        index = len(streamed)
+                        streamed.append(self._ai_product(raw, templates[index % len(templates)], index))
+                        yield streamed[-1]
+                
+                # الخانة محجوزة طوال مدة البث وتتحرر عند انتهائه أو إغلاق العميل للاتصال
+                with self.upstream_slot(), self.token_usage(data, country, platform) as call:
+                    started = time.perf_counter()
+                    call["completion"] = deltas = []
+                    chunks = self.client.stream_chat_completion(data, headers)
+                    for delta in chunks:
+                        deltas.append(delta)
+                        yield from emit(parser.feed(delta))
+                    # إنقاذ آخر منتج إذا انقطع الرد قبل اكتماله
+                    yield from emit(parser.finish())
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage="openrouter_stream",
+                                          **metric_labels(country, platform))
+                
+                if streamed:
+                    RESULTS_TOTAL.inc(source="ai", **metric_labels(country, platform))
+                    self.store_products(cache_key, query, country, platform, streamed)
+                    return
+                logger.warning("⚠️ لم يتم العثور على منتجات في رد الذكاء الاصطناعي")
+            except BudgetExceededError as e:
+                yield from self.budget_exhausted(e, query, country, platform)
+                return
+            except OverloadedError as e:
+                yield from self.shed_load(e, query, country, platform)
+                return
+            except CircuitOpenError as e:
+                logger.warning("⚡ قاطع الدائرة مفتوح، تخطي OpenRouter مؤقتاً")
+                self.record_upstream_error(e)
+            except Exception as e:
+                logger.error("❌ OpenRouter stream error: %s", e)
+                self.record_upstream_error(e)
+                # الخطأ بعد أول منتج لا يُحسب فشلاً ثانياً لنفس الاستدعاء
+                if model is not None and not settled:
+                    self.router.record_failure(model)
+                    settled = True
+            finally:
+                # الطلب لم يصل للنموذج (الميزانية أو الطابور أو القاطع العام) أو انتهى بدون منتجات
+                # أو أغلق العميل الاتصال قبل أول منتج: لا يبقى طلبه التجريبي محجوزاً
+                if model is not None and not settled:
+                    self.router.release(model)
+        
+        reason = "ai_unavailable" if OPENROUTER_API_KEY else "no_api_key"
+        if not streamed:
+            yield from self.fallback_products(query, country, platform, reason)
+            return
+        # العودة للبيانات التجريبية لما تبقى من المنتجات
+        self.record_fallback(country, platform, reason)
+        yield from self.generate_sample_data(query, country, platform)[len(streamed):]
+    
+    def handle_ai_result(self, result, query, country, platform):
+        """استخراج نص الرد من JSON الخاص بـ OpenRouter وتحويله لمنتجات"""
+        ai_text = result['choices'][0]['message']['content']
+        logger.debug("✅ OpenRouter API responded successfully")
+        
+        # عينة من الردود لأغراض debugging، أول 500 حرف فقط (التنسيق يتم فقط إذا مرت الرسالة)
+        payload_logger.debug("OpenRouter response: %.500s", ai_text, extra={"country": country, "platform": platform})
+        
+        with stage("parse_ai_response", country, platform):
+            return self.parse_ai_response(ai_text, query, country, platform)
+    
     def parse_ai_response(self, ai_text, query, country, platform):
         """تحويل رد الذكاء الاصطناعي إلى بيانات منظمة"""
         try:
-            # في الإصدار الأول، نعود للبيانات التجريبية مع إشارة أن المصدر AI
-            products = self.generate_sample_data(query, country, platform)
+            raw_products = parse_products(ai_text)
+            if not raw_products:
+                logger.warning("⚠️ لم يتم العثور على منتجات في رد الذكاء الاصطناعي")
+                return None
             
-            # نضيف إشارة أن البيانات من الذكاء الاصطناعي
-            for product in products:
-                product['analyzed_by'] = 'openrouter'
-                product['source'] = 'ai-analysis'
-                # إضافة الرد الخام للفحص
-                product['ai_raw_response'] = ai_text[:200] + "..." if len(ai_text) > 200 else ai_text
+            # كل حقل غير صالح أو ناقص يأخذ قيمته من قالب البيانات التجريبية
+            templates = self.generate_sample_data(query, country, platform)
+            products = [
+                self._ai_product(raw, templates[i % len(templates)], i)
+                for i, raw in enumerate(raw_products)
+            ]
                 
-            logger.info(f"✅ تم معالجة رد الذكاء الاصطناعي، العودة لـ {len(products)} منتج")
+            logger.info("✅ تم معالجة رد الذكاء الاصطناعي، العودة لـ %s منتج", len(products))
             return products
             
         except Exception as e:
-            logger.error(f"❌ Error parsing AI response: {str(e)}")
+            logger.error("❌ Error parsing AI response: %s", e)
             return self.generate_sample_data(query, country, platform)
     
+    def _ai_product(self, raw, template, index):
+        """منتج نهائي من منتج خام في رد الذكاء الاصطناعي"""
+        # normalize_product ينسخ القالب وأقسامه بـ dict()، وهو أسرع بكثير على القواميس منه على السجلات
+        plain = template.to_plain()
+        product = normalize_product(raw, plain)
+        product['id'] = f"{template['source']}-{index + 1}"
+        product['analyzed_by'] = 'openrouter'
+        product['source'] = AI_SOURCE
+        # الأقسام التي لم يغيرها النموذج تبقى سجلات القالب نفسها (مشتركة بين المنتجات)
+        for section in Product.SECTIONS:
+            if product[section] is plain[section]:
+                product[section] = template[section]
+        return Product.from_mapping(product)
+    
     def generate_sample_data(self, query, country, platform):
         """توليد بيانات منتجات تجريبية شاملة"""
-        products = []
+        with stage("generate_sample_data", country, platform):
+            # الأجزاء الثابتة محسوبة مسبقاً لكل (سوق، منصة)، ونملأ هنا الحقول المعتمدة على الاستعلام فقط
+            timestamp = datetime.now().isoformat()
+            analyzed_by = "openrouter" if OPENROUTER_API_KEY else "sample"
+            hashtag = f"#{query}"
+            ad_copy = f"🔥 اكتشف أفضل {query} في السوق! 🔥\nجودة ممتازة ⭐ سعر لا يُنافس 🎯 توصيل سريع 🚚"
+            short_description = f"أحدث {query} في السوق بتقنيات متطورة وتصميم عصري"
         
-        for i in range(5):
-            base_price = 100 if country == 'sa' else 500
-            currency = 'ريال' if country == 'sa' else 'جنيه'
-            
-            product = {
-                "id": f"{platform}-{i+1}",
-                "name_ar": f"{query} الذكي #{i+1}",
-                "name_en": f"Smart {query} #{i+1}",
-                "image": f"https://picsum.photos/300/200?random={i}",
-                "short_description": f"أحدث {query} في السوق بتقنيات متطورة وتصميم عصري",
-                "category": query,
-                "difficulty": "⭐" * (i % 3 + 1),
-                "why_win": "طلب مرتفع وتكلفة منخفضة وهامش ربح عالي",
-                "target": "شباب ومراهقين" if i % 2 == 0 else "عائلات ومحترفين",
-                "age_range": "18-35" if i % 2 == 0 else "25-45",
-                "gender": "ذكر" if i % 3 == 0 else "أنثى" if i % 3 == 1 else "كلا",
-                "interests": ["تسوق", "موضة", "تقنية", "لياقة بدنية"],
-                "problem": "يحل مشكلة الحاجة لمنتج عملي بجودة عالية وسعر معقول",
-                
-                "profit_analysis": {
-                    "purchase_price": base_price + (i * 20),
-                    "suggested_price": (base_price + (i * 20)) * 2,
-                    "profit_margin": "45%",
-                    "total_costs": (base_price + (i * 20)) * 0.3,
-                    "net_profit": (base_price + (i * 20)) * 0.7,
-                    "currency": currency
-                },
-                
-                "suppliers": {
-                    "local": [
-                        {
-                            "name": "مورد محلي #1",
-                            "contact": "0551234567",
-                            "link": "#"
-                        }
-                    ],
-                    "international": [
-                        {
-                            "name": "AliExpress",
-                            "link": "https://aliexpress.com",
-                            "min_order": "1 قطعة"
-                        }
-                    ],
-                    "shipping_days": "7-14 يوم",
-                    "min_order": "1 قطعة"
-                },
-                
-                "marketing": {
-                    "platform": "تيك توك وإنستغرام",
-                    "ad_copy": f"🔥 اكتشف أفضل {query} في السوق! 🔥\nجودة ممتازة ⭐ سعر لا يُنافس 🎯 توصيل سريع 🚚",
-                    "video_idea": "عرض عملي للمنتج مع مقارنة الأسعار والجودة",
-                    "hashtags": [f"#{query}", "#تسوق", "#عروض", "#جودة"],
-                    "ad_budget": f"{50 + i * 10} {currency}/يوم"
-                },
-                
-                "market_analysis": {
-                    "competition": "منخفض" if i % 3 == 0 else "متوسط" if i % 3 == 1 else "عالي",
-                    "demand": "مستمر" if i % 2 == 0 else "موسمي",
-                    "unique_point": "جودة عالية وسعر تنافسي وتصميم مميز",
-                    "growth_prediction": f"+{15 + i * 5}% خلال 2024"
-                },
-                
-                "tips": [
-                    "ركز على التسويق عبر منصات الفيديو القصيرة",
-                    "التقط صور احترافية للمنتج من زوايا متعددة",
-                    "قدم ضمان مجاني لأول 30 يوم",
-                    "استخدم التوصيل السريع كعامل تمييز"
-                ],
-                
-                "timestamp": datetime.now().isoformat(),
-                "source": platform,
-                "country": country,
-                "analyzed_by": "openrouter" if OPENROUTER_API_KEY else "sample"
-            }
-            products.append(product)
+            hashtags = (hashtag, *SAMPLE_HASHTAGS)
+        
+            products = []
+            for i, (fill, fill_marketing) in enumerate(sample_fillers(country, platform)):
+                products.append(fill(
+                    f"{query} الذكي #{i+1}",
+                    f"Smart {query} #{i+1}",
+                    short_description,
+                    query,
+                    fill_marketing(ad_copy, hashtags),
+                    timestamp,
+                    analyzed_by,
+                ))
         
         return products
 
+
+class FrozenDict(dict):
+    """قاموس للقراءة فقط يُشارك بين الطلبات ويُسلسل إلى JSON كقاموس عادي"""
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("sample templates are read-only, copy them with dict() first")
+    
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+SAMPLE_HASHTAGS = ("#تسوق", "#عروض", "#جودة")
+SAMPLE_TIPS = _freeze([
+    "ركز على التسويق عبر منصات الفيديو القصيرة",
+    "التقط صور احترافية للمنتج من زوايا متعددة",
+    "قدم ضمان مجاني لأول 30 يوم",
+    "استخدم التوصيل السريع كعامل تمييز"
+])
+SAMPLE_INTERESTS = _freeze(["تسوق", "موضة", "تقنية", "لياقة بدنية"])
+SAMPLE_SUPPLIERS = _freeze({
+    "local": [
+        {
+            "name": "مورد محلي #1",
+            "contact": "0551234567",
+            "link": "#"
+        }
+    ],
+    "international": [
+        {
+            "name": "AliExpress",
+            "link": "https://aliexpress.com",
+            "min_order": "1 قطعة"
+        }
+    ],
+    "shipping_days": "7-14 يوم",
+    "min_order": "1 قطعة"
+})
+
+
+@lru_cache(maxsize=256)
+def sample_templates(country, platform):
+    """قوالب المنتجات التجريبية الثابتة لكل (سوق، منصة)، تُبنى مرة واحدة وتُشارك بين الطلبات"""
+    base_price = 100 if country == 'sa' else 500
+    currency = 'ريال' if country == 'sa' else 'جنيه'
+    templates = []
+    
+    purchase_prices = [base_price + (i * 20) for i in range(5)]
+    # أرقام الربح من محرك التقييم بدلاً من نسبة ثابتة
+    profits = score_columns({
+        "purchase_price": purchase_prices,
+        "suggested_price": [price * 2 for price in purchase_prices],
+        "costs": [price * 0.3 for price in purchase_prices],
+        "shipping_days": [14] * 5,
+        "ad_budget": [50 + i * 10 for i in range(5)],
+        "competition": [i % 3 for i in range(5)],
+    })
+    
+    for i, purchase_price in enumerate(purchase_prices):
+        templates.append(Product.from_mapping({
+            "id": f"{platform}-{i+1}",
+            # الحقول المعتمدة على الاستعلام تملأ في generate_sample_data (None للحفاظ على ترتيب المفاتيح)
+            "name_ar": None,
+            "name_en": None,
+            "image": f"https://picsum.photos/300/200?random={i}",
+            "short_description": None,
+            "category": None,
+            "difficulty": "⭐" * (i % 3 + 1),
+            "why_win": "طلب مرتفع وتكلفة منخفضة وهامش ربح عالي",
+            "target": "شباب ومراهقين" if i % 2 == 0 else "عائلات ومحترفين",
+            "age_range": "18-35" if i % 2 == 0 else "25-45",
+            "gender": "ذكر" if i % 3 == 0 else "أنثى" if i % 3 == 1 else "كلا",
+            "interests": SAMPLE_INTERESTS,
+            "problem": "يحل مشكلة الحاجة لمنتج عملي بجودة عالية وسعر معقول",
+            
+            "profit_analysis": {
+                "purchase_price": purchase_price,
+                "suggested_price": purchase_price * 2,
+                "profit_margin": f"{profits['profit_margin'][i] * 100:.0f}%",
+                "total_costs": purchase_price * 0.3,
+                "net_profit": profits['net_profit'][i],
+                "currency": currency
+            },
+            
+            "suppliers": SAMPLE_SUPPLIERS,
+            
+            "marketing": {
+                "platform": "تيك توك وإنستغرام",
+                "ad_copy": None,
+                "video_idea": "عرض عملي للمنتج مع مقارنة الأسعار والجودة",
+                "hashtags": None,
+                "ad_budget": f"{50 + i * 10} {currency}/يوم"
+            },
+            
+            "market_analysis": {
+                "competition": "منخفض" if i % 3 == 0 else "متوسط" if i % 3 == 1 else "عالي",
+                "demand": "مستمر" if i % 2 == 0 else "موسمي",
+                "unique_point": "جودة عالية وسعر تنافسي وتصميم مميز",
+                "growth_prediction": f"+{15 + i * 5}% خلال 2024"
+            },
+            
+            "tips": SAMPLE_TIPS,
+            "timestamp": None,
+            "source": platform,
+            "country": country,
+            "analyzed_by": None
+        }))
+    
+    return tuple(templates)
+
+
+@lru_cache(maxsize=256)
+def sample_fillers(country, platform):
+    """دوال بناء المنتج وقسم التسويق من كل قالب بالحقول المعتمدة على الاستعلام (بترتيب generate_sample_data)"""
+    return tuple(
+        (
+            template.filler("name_ar", "name_en", "short_description", "category", "marketing", "timestamp",
+                            "analyzed_by"),
+            template.marketing.filler("ad_copy", "hashtags"),
+        )
+        for template in sample_templates(country, platform)
+    )
+
 # تهيئة المحلل
-analyzer = SmartProductAnalyzer()
+result_cache = create_cache(
+    CACHE_BACKEND,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    max_entries=CACHE_MAX_ENTRIES,
+    sqlite_path=CACHE_SQLITE_PATH,
+    stale_seconds=max(0, CACHE_HARD_TTL_SECONDS - CACHE_TTL_SECONDS),
+    stale_if_error_seconds=CACHE_STALE_IF_ERROR_SECONDS,
+)
+openrouter_client = OpenRouterClient(
+    url=OPENROUTER_API_URL,
+    pool_size=OPENROUTER_POOL_SIZE,
+    connect_timeout=OPENROUTER_CONNECT_TIMEOUT,
+    read_timeout=OPENROUTER_READ_TIMEOUT,
+    max_retries=OPENROUTER_MAX_RETRIES,
+    breaker=CircuitBreaker(
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout=CIRCUIT_RECOVERY_SECONDS,
+    ),
+)
+admission_store = create_admission_store(RATE_LIMIT_BACKEND, sqlite_path=RATE_LIMIT_SQLITE_PATH)
+rate_limiter = RateLimiter(admission_store, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST)
+upstream_gate = UpstreamGate(
+    admission_store,
+    max_inflight=UPSTREAM_MAX_INFLIGHT,
+    max_queued=UPSTREAM_MAX_QUEUED,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+    retry_after=SHED_RETRY_AFTER_SECONDS,
+)
+token_budget = TokenBudget(admission_store, per_minute=TOKEN_BUDGET_PER_MINUTE)
+model_router = ModelRouter(
+    OPENROUTER_MODELS,
+    window=MODEL_LATENCY_WINDOW,
+    failure_threshold=MODEL_FAILURE_THRESHOLD,
+    recovery_timeout=MODEL_RECOVERY_SECONDS,
+    hedge=HEDGE_REQUESTS,
+    hedge_quantile=HEDGE_QUANTILE,
+    hedge_min_samples=HEDGE_MIN_SAMPLES,
+    hedge_min_delay=HEDGE_MIN_DELAY_SECONDS,
+    hedge_workers=HEDGE_WORKERS,
+    observer=observe_model_call,
+)
+prompt_builder = PromptBuilder(
+    product_count=AI_PRODUCT_COUNT,
+    fields=AI_PROMPT_FIELDS,
+    temperature=AI_TEMPERATURE,
+    max_tokens=AI_MAX_TOKENS,
+    output_margin=AI_OUTPUT_MARGIN,
+)
+semantic_cache = create_semantic_cache(
+    result_cache,
+    SEMANTIC_CACHE_BACKEND,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=CACHE_MAX_ENTRIES,
+    sqlite_path=SEMANTIC_CACHE_SQLITE_PATH,
+) if SEMANTIC_CACHE else None
+product_catalog = ProductCatalog(
+    CATALOG_SQLITE_PATH,
+    min_results=CATALOG_MIN_RESULTS,
+    max_results=CATALOG_MAX_RESULTS,
+    max_age=CATALOG_MAX_AGE_HOURS * 3600,
+    max_products=CATALOG_MAX_PRODUCTS,
+) if CATALOG else None
+analyzer = SmartProductAnalyzer(
+    cache=result_cache, client=openrouter_client, gate=upstream_gate, semantic=semantic_cache,
+    catalog=product_catalog, prompts=prompt_builder, token_budget=token_budget, router=model_router)
+batch_runner = BatchRunner(analyzer, max_workers=BATCH_MAX_WORKERS)
+job_queue = JobQueue(
+    JobStore(JOBS_SQLITE_PATH),
+    analyzer,
+    workers=JOB_WORKERS,
+    stale_after=JOB_STALE_SECONDS,
+    retention=JOB_RETENTION_SECONDS,
+    observer=observe_job,
+)
+query_stats = QueryStats(WARM_STATS_SQLITE_PATH) if WARM_FROM_STATS else None
+cache_warmer = CacheWarmer(
+    analyzer,
+    hot_queries=load_hot_queries(WARM_QUERIES_FILE),
+    query_stats=query_stats,
+    countries=WARM_COUNTRIES,
+    top_n=WARM_TOP_N,
+    stats_window=WARM_STATS_WINDOW_HOURS * 3600,
+    rate_per_minute=WARM_RATE_PER_MINUTE,
+    ttl_seconds=WARM_TTL_SECONDS,
+    hours=parse_hours(WARM_HOURS),
+    interval=WARM_INTERVAL_SECONDS,
+    lock_path=WARM_LOCK_PATH,
+)
+if WARM_ENABLED:
+    cache_warmer.start()
+metrics_registry.start()
+
+# الواجهة الرئيسية: تُحمل من مجلد frontend مرة واحدة عند التشغيل مع نسخ مضغوطة مسبقاً
+frontend_index, frontend_assets = load_frontend(FRONTEND_DIR)
+
+def send_static_asset(asset, cache_control):
+    """إرسال ملف ثابت مع دعم If-None-Match واختيار الضغط حسب Accept-Encoding"""
+    encoding, body = asset.select_encoding(request.headers.get('Accept-Encoding'))
+    etag = asset.version if encoding is None else f"{asset.version}-{encoding}"
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    
+    # كل نسخ الضغط لها نفس المحتوى، لذلك يكفي تطابق رقم النسخة
+    client_tags = request.if_none_match.as_set(include_weak=True)
+    if request.if_none_match.star_tag or any(tag.startswith(asset.version) for tag in client_tags):
+        return Response(status=304, headers=headers)
+    
+    response = Response(body, content_type=asset.content_type, headers=headers)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
 
-# الواجهة الرئيسية
 @app.route('/')
 def serve_frontend():
-    return """
-    <!DOCTYPE html>
-    <html dir="rtl" lang="ar">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>المحلل الذكي للمنتجات الرابحة</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                direction: rtl;
-            }
-
-            .container {
-                max-width: 1200px;
-                margin: 0 auto;
-                padding: 20px;
-            }
-
-            .header {
-                text-align: center;
-                color: white;
-                margin-bottom: 40px;
-            }
-
-            .header h1 {
-                font-size: 2.5rem;
-                margin-bottom: 10px;
-                text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-            }
-
-            .header p {
-                font-size: 1.2rem;
-                opacity: 0.9;
-            }
-
-            .search-section {
-                background: white;
-                border-radius: 20px;
-                padding: 40px;
-                box-shadow: 0 15px 35px rgba(0,0,0,0.1);
-                margin-bottom: 30px;
-            }
-
-            .search-box input {
-                width: 100%;
-                padding: 15px 20px;
-                border: 2px solid #e1e5e9;
-                border-radius: 12px;
-                font-size: 1.1rem;
-                margin-bottom: 20px;
-                transition: all 0.3s ease;
-            }
-
-            .search-box input:focus {
-                outline: none;
-                border-color: #4CAF50;
-                box-shadow: 0 0 0 3px rgba(76, 175, 80, 0.1);
-            }
-
-            .filters {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 20px;
-                margin-bottom: 25px;
-            }
-
-            .filter-group {
-                display: flex;
-                flex-direction: column;
-            }
-
-            .filter-group label {
-                font-weight: 600;
-                margin-bottom: 8px;
-                color: #333;
-            }
-
-            .filter-group select {
-                padding: 12px 15px;
-                border: 2px solid #e1e5e9;
-                border-radius: 8px;
-                font-size: 1rem;
-                background: white;
-            }
-
-            .analyze-btn {
-                width: 100%;
-                padding: 15px;
-                background: linear-gradient(135deg, #4CAF50, #45a049);
-                color: white;
-                border: none;
-                border-radius: 12px;
-                font-size: 1.2rem;
-                font-weight: 600;
-                cursor: pointer;
-                transition: all 0.3s ease;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 10px;
-            }
-
-            .analyze-btn:hover {
-                transform: translateY(-2px);
-                box-shadow: 0 8px 25px rgba(76, 175, 80, 0.3);
-            }
-
-            .loading-spinner {
-                width: 20px;
-                height: 20px;
-                border: 2px solid transparent;
-                border-top: 2px solid white;
-                border-radius: 50%;
-                animation: spin 1s linear infinite;
-            }
-
-            @keyframes spin {
-                0% { transform: rotate(0deg); }
-                100% { transform: rotate(360deg); }
-            }
-
-            .loading-section {
-                background: white;
-                border-radius: 20px;
-                padding: 60px 40px;
-                text-align: center;
-                margin-bottom: 30px;
-                display: none;
-            }
-
-            .spinner {
-                width: 50px;
-                height: 50px;
-                border: 4px solid #f3f3f3;
-                border-top: 4px solid #4CAF50;
-                border-radius: 50%;
-                animation: spin 1s linear infinite;
-                margin: 0 auto 20px;
-            }
-
-            .results-section {
-                background: white;
-                border-radius: 20px;
-                padding: 30px;
-                margin-bottom: 30px;
-                display: none;
-            }
-
-            .results-header {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-bottom: 30px;
-                padding-bottom: 15px;
-                border-bottom: 2px solid #f0f0f0;
-            }
-
-            .results-header h2 {
-                color: #333;
-                font-size: 1.8rem;
-            }
-
-            .results-info {
-                display: flex;
-                gap: 20px;
-                color: #666;
-            }
-
-            .product-card {
-                background: #f8f9fa;
-                border-radius: 15px;
-                padding: 25px;
-                margin-bottom: 25px;
-                border-right: 5px solid #4CAF50;
-                transition: all 0.3s ease;
-            }
-
-            .product-card:hover {
-                transform: translateY(-3px);
-                box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-            }
-
-            .product-header {
-                display: flex;
-                gap: 20px;
-                margin-bottom: 20px;
-                align-items: start;
-            }
-
-            .product-image {
-                width: 150px;
-                height: 150px;
-                border-radius: 10px;
-                object-fit: cover;
-                border: 3px solid white;
-                box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            }
-
-            .product-basic-info {
-                flex: 1;
-            }
-
-            .product-name {
-                font-size: 1.4rem;
-                color: #333;
-                margin-bottom: 10px;
-            }
-
-            .product-description {
-                color: #666;
-                line-height: 1.6;
-                margin-bottom: 15px;
-            }
-
-            .detail-section {
-                background: white;
-                border-radius: 10px;
-                padding: 20px;
-                margin-bottom: 15px;
-                border-right: 3px solid #e9ecef;
-            }
-
-            .detail-section h4 {
-                color: #4CAF50;
-                margin-bottom: 15px;
-                font-size: 1.1rem;
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }
-
-            .detail-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-                gap: 15px;
-            }
-
-            .detail-item {
-                display: flex;
-                flex-direction: column;
-                gap: 5px;
-            }
-
-            .detail-label {
-                font-weight: 600;
-                color: #555;
-                font-size: 0.9rem;
-            }
-
-            .detail-value {
-                color: #333;
-                line-height: 1.5;
-            }
-
-            .profit-badge {
-                background: #4CAF50;
-                color: white;
-                padding: 4px 12px;
-                border-radius: 20px;
-                font-size: 0.8rem;
-                font-weight: 600;
-            }
-
-            .tips-list {
-                list-style: none;
-                padding: 0;
-            }
-
-            .tips-list li {
-                padding: 8px 0;
-                border-bottom: 1px solid #f0f0f0;
-                display: flex;
-                align-items: start;
-                gap: 10px;
-            }
-
-            .tips-list li:before {
-                content: "💡";
-                font-size: 1.1rem;
-            }
-
-            .error-section {
-                background: white;
-                border-radius: 20px;
-                padding: 40px;
-                text-align: center;
-                margin-bottom: 30px;
-                display: none;
-            }
-
-            .error-card {
-                max-width: 400px;
-                margin: 0 auto;
-            }
-
-            .error-card h3 {
-                color: #f44336;
-                margin-bottom: 15px;
-            }
-
-            .error-card button {
-                background: #f44336;
-                color: white;
-                border: none;
-                padding: 12px 25px;
-                border-radius: 8px;
-                cursor: pointer;
-                margin-top: 15px;
-            }
-
-            .ai-badge {
-                background: #2196F3;
-                color: white;
-                padding: 4px 12px;
-                border-radius: 20px;
-                font-size: 0.8rem;
-                font-weight: 600;
-                margin-left: 10px;
-            }
-
-            @media (max-width: 768px) {
-                .container {
-                    padding: 15px;
-                }
-                
-                .search-section {
-                    padding: 25px;
-                }
-                
-                .filters {
-                    grid-template-columns: 1fr;
-                }
-                
-                .product-header {
-                    flex-direction: column;
-                }
-                
-                .product-image {
-                    width: 100%;
-                    height: 200px;
-                }
-                
-                .detail-grid {
-                    grid-template-columns: 1fr;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <!-- الهيدر -->
-            <header class="header">
-                <h1>🎯 المحلل الذكي للمنتجات الرابحة</h1>
-                <p>اكتشف أفضل المنتجات ربحية في السوق خلال دقائق</p>
-                <div style="background: rgba(255,255,255,0.2); padding: 10px; border-radius: 10px; margin-top: 10px;">
-                    <span style="color: #4CAF50;">✓ نظام الذكاء الاصطناعي مفعل (OpenRouter)</span>
-                </div>
-            </header>
-
-            <!-- قسم البحث -->
-            <section class="search-section">
-                <div class="search-box">
-                    <input type="text" id="query" placeholder="ما نوع المنتج الذي تبحث عنه؟ (مثال: ساعات ذكية، أجهزة رياضية، إكسسوارات)...">
-                    
-                    <div class="filters">
-                        <div class="filter-group">
-                            <label>السوق المستهدف:</label>
-                            <select id="country">
-                                <option value="sa">🇸🇦 السعودية</option>
-                                <option value="eg">🇪🇬 مصر</option>
-                                <option value="ae">🇦🇪 الإمارات</option>
-                                <option value="global">🌍 عالمي</option>
-                            </select>
-                        </div>
-                        
-                        <div class="filter-group">
-                            <label>منصة البيع:</label>
-                            <select id="platform">
-                                <option value="all">جميع المنصات</option>
-                                <option value="amazon">أمازون</option>
-                                <option value="aliexpress">علي اكسبريس</option>
-                                <option value="noon">نون</option>
-                                <option value="tiktok">تيك توك</option>
-                            </select>
-                        </div>
-                    </div>
-
-                    <button id="analyzeBtn" class="analyze-btn">
-                        <span class="btn-text">🔍 ابدأ التحليل الذكي</span>
-                        <div class="loading-spinner" style="display: none;"></div>
-                    </button>
-                </div>
-            </section>
-
-            <!-- حالة التحميل -->
-            <div id="loadingSection" class="loading-section">
-                <div class="loading-content">
-                    <div class="spinner"></div>
-                    <h3>جاري البحث والتحليل...</h3>
-                    <p>نستخدم الذكاء الاصطناعي لتحليل أفضل فرص الربح لك</p>
-                </div>
-            </div>
-
-            <!-- النتائج -->
-            <section id="resultsSection" class="results-section">
-                <div class="results-header">
-                    <h2>نتائج التحليل <span id="aiBadge" class="ai-badge" style="display: none;">AI</span></h2>
-                    <div class="results-info">
-                        <span id="resultsCount">0 منتج</span>
-                        <span id="searchQuery"></span>
-                    </div>
-                </div>
-                <div id="resultsContainer" class="results-container"></div>
-            </section>
-
-            <!-- قسم الأخطاء -->
-            <div id="errorSection" class="error-section">
-                <div class="error-card">
-                    <h3>⚠️ حدث خطأ</h3>
-                    <p id="errorMessage"></p>
-                    <button onclick="hideError()">حاول مرة أخرى</button>
-                </div>
-            </div>
-        </div>
-
-        <script>
-            // إعدادات API
-            const API_BASE_URL = window.location.origin;
-
-            // عناصر DOM
-            const elements = {
-                queryInput: document.getElementById('query'),
-                countrySelect: document.getElementById('country'),
-                platformSelect: document.getElementById('platform'),
-                analyzeBtn: document.getElementById('analyzeBtn'),
-                loadingSection: document.getElementById('loadingSection'),
-                resultsSection: document.getElementById('resultsSection'),
-                resultsContainer: document.getElementById('resultsContainer'),
-                resultsCount: document.getElementById('resultsCount'),
-                searchQuery: document.getElementById('searchQuery'),
-                errorSection: document.getElementById('errorSection'),
-                errorMessage: document.getElementById('errorMessage'),
-                aiBadge: document.getElementById('aiBadge')
-            };
-
-            // استمع لضغط Enter في حقل البحث
-            elements.queryInput.addEventListener('keypress', function(e) {
-                if (e.key === 'Enter') {
-                    analyzeProducts();
-                }
-            });
-
-            // زر التحليل
-            elements.analyzeBtn.addEventListener('click', analyzeProducts);
-
-            async function analyzeProducts() {
-                const query = elements.queryInput.value.trim();
-                
-                if (!query) {
-                    showError('يرجى إدخال نوع المنتج الذي تريد البحث عنه');
-                    return;
-                }
-
-                // إظهار حالة التحميل
-                showLoading(true);
-                hideResults();
-                hideError();
-
-                try {
-                    const response = await fetch(API_BASE_URL + '/api/analyze', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            query: query,
-                            country: elements.countrySelect.value,
-                            platform: elements.platformSelect.value
-                        })
-                    });
-
-                    const data = await response.json();
-
-                    if (!response.ok) {
-                        throw new Error(data.error || 'حدث خطأ في الخادم');
-                    }
-
-                    if (!data.success) {
-                        throw new Error(data.error || 'فشل في التحليل');
-                    }
-
-                    // عرض النتائج
-                    displayResults(data);
-                    
-                } catch (error) {
-                    console.error('Error:', error);
-                    showError(error.message);
-                } finally {
-                    showLoading(false);
-                }
-            }
-
-            function displayResults(data) {
-                elements.resultsCount.textContent = data.products_count + ' منتج';
-                elements.searchQuery.textContent = 'عنوان البحث: ' + data.query;
-                
-                // إظهار شارة AI إذا كان التحليل باستخدام الذكاء الاصطناعي
-                const hasAI = data.products.some(p => p.analyzed_by === 'openrouter');
-                elements.aiBadge.style.display = hasAI ? 'inline-block' : 'none';
-                
-                elements.resultsContainer.innerHTML = '';
-                
-                data.products.forEach((product, index) => {
-                    const productCard = createProductCard(product, index + 1);
-                    elements.resultsContainer.appendChild(productCard);
-                });
-                
-                showResults();
-            }
+    return send_static_asset(frontend_index, REVALIDATE_CACHE_CONTROL)
 
-            function createProductCard(product, index) {
-                const card = document.createElement('div');
-                card.className = 'product-card';
-                
-                const aiBadge = product.analyzed_by === 'openrouter' ? 
-                    '<span class="ai-badge">تحليل بالذكاء الاصطناعي</span>' : '';
-                
-                card.innerHTML = `
-                    <div class="product-header">
-                        <img src="${product.image}" alt="${product.name_ar}" class="product-image" 
-                             onerror="this.src='https://via.placeholder.com/300x200/667eea/white?text=صورة+المنتج'">
-                        
-                        <div class="product-basic-info">
-                            <h3 class="product-name">${index}. ${product.name_ar} ${aiBadge}</h3>
-                            <p class="product-description">${product.short_description}</p>
-                            
-                            <div style="display: flex; gap: 15px; flex-wrap: wrap; margin-top: 10px;">
-                                <span class="profit-badge">💰 هامش ربح: ${product.profit_analysis.profit_margin}</span>
-                                <span class="profit-badge" style="background: #2196F3;">📊 ${product.difficulty}</span>
-                                <span class="profit-badge" style="background: #FF9800;">🎯 ${product.target}</span>
-                            </div>
-                        </div>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>📊 المعلومات الأساسية</h4>
-                        <div class="detail-grid">
-                            <div class="detail-item">
-                                <span class="detail-label">الفئة:</span>
-                                <span class="detail-value">${product.category}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">سبب الربحية:</span>
-                                <span class="detail-value">${product.why_win}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">المشكلة التي يحلها:</span>
-                                <span class="detail-value">${product.problem}</span>
-                            </div>
-                        </div>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>💰 تحليل الربحية</h4>
-                        <div class="detail-grid">
-                            <div class="detail-item">
-                                <span class="detail-label">سعر الشراء:</span>
-                                <span class="detail-value">${product.profit_analysis.purchase_price} ${product.profit_analysis.currency}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">سعر البيع المقترح:</span>
-                                <span class="detail-value">${product.profit_analysis.suggested_price} ${product.profit_analysis.currency}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">صافي الربح:</span>
-                                <span class="detail-value">${product.profit_analysis.net_profit} ${product.profit_analysis.currency}</span>
-                            </div>
-                        </div>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>🎯 الجمهور المستهدف</h4>
-                        <div class="detail-grid">
-                            <div class="detail-item">
-                                <span class="detail-label">الفئة العمرية:</span>
-                                <span class="detail-value">${product.age_range}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">الجنس:</span>
-                                <span class="detail-value">${product.gender}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">الاهتمامات:</span>
-                                <span class="detail-value">${product.interests.join('، ')}</span>
-                            </div>
-                        </div>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>📢 الاستراتيجية التسويقية</h4>
-                        <div class="detail-grid">
-                            <div class="detail-item">
-                                <span class="detail-label">منصة البيع:</span>
-                                <span class="detail-value">${product.marketing.platform}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">ميزانية الإعلان:</span>
-                                <span class="detail-value">${product.marketing.ad_budget}</span>
-                            </div>
-                        </div>
-                        <div style="margin-top: 15px;">
-                            <span class="detail-label">النص الإعلاني:</span>
-                            <p style="background: #f8f9fa; padding: 12px; border-radius: 8px; margin-top: 8px; line-height: 1.5;">
-                                ${product.marketing.ad_copy}
-                            </p>
-                        </div>
-                        <div style="margin-top: 10px;">
-                            <span class="detail-label">الهاشتاقات:</span>
-                            <p style="color: #667eea; font-weight: 500; margin-top: 5px;">
-                                ${product.marketing.hashtags.join(' ')}
-                            </p>
-                        </div>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>📊 تحليل السوق</h4>
-                        <div class="detail-grid">
-                            <div class="detail-item">
-                                <span class="detail-label">مستوى المنافسة:</span>
-                                <span class="detail-value">${product.market_analysis.competition}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">حجم الطلب:</span>
-                                <span class="detail-value">${product.market_analysis.demand}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">توقعات النمو:</span>
-                                <span class="detail-value">${product.market_analysis.growth_prediction}</span>
-                            </div>
-                        </div>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>⚡ نصائح الخبراء</h4>
-                        <ul class="tips-list">
-                            ${product.tips.map(tip => '<li>' + tip + '</li>').join('')}
-                        </ul>
-                    </div>
-
-                    <div class="detail-section">
-                        <h4>🛒 معلومات الموردين</h4>
-                        <div class="detail-grid">
-                            <div class="detail-item">
-                                <span class="detail-label">مدة الشحن:</span>
-                                <span class="detail-value">${product.suppliers.shipping_days}</span>
-                            </div>
-                            <div class="detail-item">
-                                <span class="detail-label">حد الأدنى للطلب:</span>
-                                <span class="detail-value">${product.suppliers.min_order}</span>
-                            </div>
-                        </div>
-                    </div>
-                `;
-                
-                return card;
-            }
-
-            function showLoading(show) {
-                const btnText = elements.analyzeBtn.querySelector('.btn-text');
-                const spinner = elements.analyzeBtn.querySelector('.loading-spinner');
-                
-                if (show) {
-                    btnText.textContent = 'جاري التحليل بالذكاء الاصطناعي...';
-                    spinner.style.display = 'block';
-                    elements.analyzeBtn.disabled = true;
-                    elements.loadingSection.style.display = 'block';
-                } else {
-                    btnText.textContent = '🔍 ابدأ التحليل الذكي';
-                    spinner.style.display = 'none';
-                    elements.analyzeBtn.disabled = false;
-                    elements.loadingSection.style.display = 'none';
-                }
-            }
-
-            function showResults() {
-                elements.resultsSection.style.display = 'block';
-            }
-
-            function hideResults() {
-                elements.resultsSection.style.display = 'none';
-            }
-
-            function showError(message) {
-                elements.errorMessage.textContent = message;
-                elements.errorSection.style.display = 'block';
-            }
-
-            function hideError() {
-                elements.errorSection.style.display = 'none';
-            }
-
-            // اختبار اتصال API عند التحميل
-            window.addEventListener('load', async () => {
-                try {
-                    const response = await fetch(API_BASE_URL + '/api/health');
-                    if (!response.ok) throw new Error('الخادم غير متاح');
-                    console.log('✅ النظام يعمل بشكل صحيح');
-                } catch (error) {
-                    console.warn('⚠️ تعذر الاتصال بالخادم:', error.message);
-                }
-            });
-        </script>
-    </body>
-    </html>
-    """
+@app.route('/static/<path:name>')
+def serve_static(name):
+    asset = frontend_assets.get(name)
+    if asset is None:
+        return jsonify({
+            "success": False,
+            "error": "الملف غير موجود"
+        }), 404
+    # الروابط التي تحمل رقم النسخة لا تتغير أبداً ويمكن تخزينها لمدة طويلة
+    versioned = request.args.get('v') == asset.version
+    return send_static_asset(asset, IMMUTABLE_CACHE_CONTROL if versioned else REVALIDATE_CACHE_CONTROL)
+
+def client_key():
+    """هوية العميل للحد من الطلبات: مفتاح API إن وُجد وإلا عنوان IP"""
+    api_key = request.headers.get('X-API-Key', '')
+    authorization = request.headers.get('Authorization', '')
+    if not api_key and authorization.startswith('Bearer '):
+        api_key = authorization[7:]
+    if api_key:
+        # لا نخزن المفتاح نفسه في قاعدة العدادات
+        return "key:" + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+    if RATE_LIMIT_TRUST_PROXY and request.access_route:
+        return f"ip:{request.access_route[0]}"
+    return f"ip:{request.remote_addr}"
+
+def too_many_requests(retry_after, error):
+    seconds = max(1, math.ceil(retry_after))
+    response = jsonify({
+        "success": False,
+        "error": error,
+        "retry_after": seconds
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+def check_rate_limit(cost=1):
+    """رد 429 إذا تجاوز العميل حده، وإلا None"""
+    allowed, retry_after = rate_limiter.acquire(client_key(), cost)
+    if allowed:
+        return None
+    ADMISSION_TOTAL.inc(outcome="rate_limited")
+    logger.warning("⚠️ تجاوز حد الطلبات للعميل %s", client_key())
+    return too_many_requests(retry_after, "تم تجاوز الحد المسموح من الطلبات، يرجى المحاولة لاحقاً")
+
+def service_overloaded(error):
+    return too_many_requests(error.retry_after, "الخدمة مشغولة حالياً، يرجى المحاولة لاحقاً")
 
 # API Routes
 @app.route('/api/analyze', methods=['POST'])
 def api_analyze():
+    try:
+        limited = check_rate_limit()
+        if limited is not None:
+            return limited
+        
+        with tracer.span("parse_request") as span:
+            parse_started = time.perf_counter()
+            data = request.get_json() or {}
+            query = data.get('query', '').strip()
+            country = data.get('country', 'sa')
+            platform = data.get('platform', 'all')
+            
+            if not query:
+                return jsonify({
+                    "success": False,
+                    "error": "يرجى إدخال مجال المنتجات للبحث"
+                }), 400
+            
+            # fields=name_ar,profit_analysis لإرجاع الحقول التي يعرضها العميل فقط
+            fields = parse_fields(request.args.get('fields') or data.get('fields'))
+            labels = metric_labels(country, platform)
+            span.set(**labels)
+            STAGE_SECONDS.observe(time.perf_counter() - parse_started, stage="parse_request", **labels)
+        
+        logger.info("طلب تحليل: %s - %s - %s", query, country, platform)
+        if query_stats is not None:
+            query_stats.record(query, country)
+        
+        # وضع البث: إرسال كل منتج فور جاهزيته (NDJSON أو SSE)
+        accept = request.headers.get('Accept', '')
+        if data.get('stream') or 'text/event-stream' in accept or 'application/x-ndjson' in accept:
+            return stream_analysis(query, country, platform, sse='text/event-stream' in accept, fields=fields)
+        
+        # البحث والتحليل
+        products = analyzer.search_products(query, country, platform)
+        # stale: نتيجة قديمة من الكاش لأن OpenRouter غير متاح حالياً
+        stale = any(product.get('stale') for product in products)
+        products = project_products(products, fields)
+        
+        with stage("serialize", country, platform):
+            return jsonify({
+                "success": True,
+                "query": query,
+                "country": country,
+                "platform": platform,
+                "products_count": len(products),
+                "products": products,
+                "stale": stale,
+                "timestamp": datetime.now().isoformat()
+            })
+        
+    except OverloadedError as e:
+        return service_overloaded(e)
+    except Exception as e:
+        logger.error("خطأ في التحليل: %s", e)
+        return jsonify({
+            "success": False,
+            "error": f"حدث خطأ في النظام: {str(e)}"
+        }), 500
+
+def stream_analysis(query, country, platform, sse=False, fields=None):
+    """رد متدفق: حدث meta ثم حدث لكل منتج ثم حدث done"""
+    def encode(event):
+        payload = app.json.dumps(event)
+        if sse:
+            return f"event: {event['type']}\ndata: {payload}\n\n"
+        return payload + "\n"
+    
+    def generate():
+        yield encode({"type": "meta", "query": query, "country": country, "platform": platform})
+        count = 0
+        stale = False
+        try:
+            for product in analyzer.stream_products(query, country, platform):
+                count += 1
+                stale = stale or bool(product.get('stale'))
+                if fields:
+                    product = project_products([product], fields)[0]
+                yield encode({"type": "product", "index": count, "product": product})
+        except OverloadedError as e:
+            yield encode({"type": "error", "error": "الخدمة مشغولة حالياً، يرجى المحاولة لاحقاً",
+                          "retry_after": max(1, math.ceil(e.retry_after))})
+            return
+        except Exception as e:
+            logger.error("خطأ في التحليل: %s", e)
+            yield encode({"type": "error", "error": f"حدث خطأ في النظام: {str(e)}"})
+            return
+        yield encode({"type": "done", "products_count": count, "stale": stale,
+                      "timestamp": datetime.now().isoformat()})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if sse else 'application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def api_analyze_batch():
     try:
         data = request.get_json() or {}
-        query = data.get('query', '').strip()
-        country = data.get('country', 'sa')
-        platform = data.get('platform', 'all')
+        jobs = data.get('jobs')
         
-        if not query:
+        if not isinstance(jobs, list) or not jobs:
             return jsonify({
                 "success": False,
-                "error": "يرجى إدخال مجال المنتجات للبحث"
+                "error": "يرجى إرسال قائمة المهام في الحقل jobs"
+            }), 400
+        if len(jobs) > BATCH_MAX_JOBS:
+            return jsonify({
+                "success": False,
+                "error": f"الحد الأقصى لعدد المهام في الدفعة هو {BATCH_MAX_JOBS}"
             }), 400
         
-        logger.info(f"طلب تحليل: {query} - {country} - {platform}")
+        # كل مهمة في الدفعة تُحسب كطلب من حد العميل، والدفعة الأكبر من الدلو تستهلكه كله
+        # (المهام نفسها تمر بعد ذلك على بوابة OpenRouter وميزانية tokens)
+        limited = check_rate_limit(cost=min(len(jobs), rate_limiter.max_cost))
+        if limited is not None:
+            return limited
         
-        # البحث والتحليل
-        products = analyzer.search_products(query, country, platform)
+        try:
+            concurrency = int(data.get('concurrency') or BATCH_DEFAULT_CONCURRENCY)
+        except (TypeError, ValueError):
+            concurrency = BATCH_DEFAULT_CONCURRENCY
+        
+        logger.info("طلب تحليل جماعي: %s مهمة بتزامن %s", len(jobs), concurrency)
+        
+        fields = parse_fields(request.args.get('fields') or data.get('fields'))
+        
+        def project(result):
+            if fields and "products" in result:
+                result["products"] = project_products(result["products"], fields)
+            return result
+        
+        # وضع البث: نتيجة كل مهمة فور انتهائها مع رقمها في الدفعة
+        if data.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            def generate():
+                failed = 0
+                for result in batch_runner.iter_results(jobs, concurrency):
+                    failed += result["status"] != "ok"
+                    yield app.json.dumps({"type": "job", **project(result)}) + "\n"
+                yield app.json.dumps({
+                    "type": "done",
+                    "jobs_count": len(jobs),
+                    "failed_count": failed,
+                    "timestamp": datetime.now().isoformat()
+                }) + "\n"
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='application/x-ndjson',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
+        results = [project(result) for result in batch_runner.run(jobs, concurrency)]
+        return jsonify({
+            "success": True,
+            "jobs_count": len(jobs),
+            "failed_count": sum(1 for result in results if result["status"] != "ok"),
+            "results": results,
+            "timestamp": datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error("خطأ في التحليل الجماعي: %s", e)
+        return jsonify({
+            "success": False,
+            "error": f"حدث خطأ في النظام: {str(e)}"
+        }), 500
+
+def _optional_float(name):
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"المعامل {name} يجب أن يكون رقماً")
+
+@app.route('/api/catalog', methods=['GET'])
+def api_catalog():
+    """بحث فوري في كتالوج المنتجات المحللة سابقاً مع فلترة بالهامش والسعر والمنافسة (بدون طلب OpenRouter)"""
+    if product_catalog is None:
+        return jsonify({"success": False, "error": "كتالوج المنتجات غير مفعل"}), 404
+    try:
+        query = request.args.get('q', '').strip()
+        country = request.args.get('country', 'sa')
+        platform = request.args.get('platform', 'all')
+        limit = request.args.get('limit', '20')
+        if not limit.isdigit() or not 0 < int(limit) <= CATALOG_SEARCH_MAX_LIMIT:
+            raise ValueError(f"limit يجب أن يكون بين 1 و {CATALOG_SEARCH_MAX_LIMIT}")
+
+        with stage("catalog_search", country, platform):
+            products = product_catalog.search(
+                query, country, platform,
+                limit=int(limit),
+                min_margin=_optional_float('min_margin'),
+                max_price=_optional_float('max_price'),
+                max_competition=_optional_float('max_competition'),
+            )
+
         return jsonify({
             "success": True,
             "query": query,
             "country": country,
             "platform": platform,
+            "engine": product_catalog.engine,
             "products_count": len(products),
-            "products": products,
+            "products": project_products(products, parse_fields(request.args.get('fields'))),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logger.error("خطأ في البحث في الكتالوج: %s", e)
+        return jsonify({
+            "success": False,
+            "error": f"حدث خطأ في النظام: {str(e)}"
+        }), 500
+
+@app.route('/api/score', methods=['POST'])
+def api_score():
+    """تقييم وترتيب آلاف المنتجات المرشحة: هامش الربح والعائد ونقطة التعادل الإعلانية"""
+    try:
+        limited = check_rate_limit()
+        if limited is not None:
+            return limited
+        
+        data = request.get_json() or {}
+        # أعمدة {"purchase_price": [...], ...} أو قائمة منتجات products
+        columns = data.get('columns')
+        if columns is None and data.get('products') is not None:
+            columns = columns_from_rows(data['products'])
+        if not isinstance(columns, dict) or not columns.get('purchase_price'):
+            return jsonify({
+                "success": False,
+                "error": "يرجى إرسال المنتجات كأعمدة في الحقل columns أو كقائمة في الحقل products"
+            }), 400
+        count = len(columns['purchase_price'])
+        if count > SCORE_MAX_CANDIDATES:
+            return jsonify({
+                "success": False,
+                "error": f"الحد الأقصى لعدد المنتجات في الطلب هو {SCORE_MAX_CANDIDATES}"
+            }), 400
+        
+        with stage("score", data.get('country'), data.get('platform')):
+            results = score_columns(columns, data.get('weights'))
+        order = results.pop("order")
+        top = data.get('top')
+        if isinstance(top, int) and top > 0:
+            order = order[:top]
+        
+        return jsonify({
+            "success": True,
+            "count": count,
+            "engine": SCORING_ENGINE,
+            "order": order,
+            "results": results,
             "timestamp": datetime.now().isoformat()
         })
         
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logger.error("خطأ في تقييم المنتجات: %s", e)
+        return jsonify({
+            "success": False,
+            "error": f"حدث خطأ في النظام: {str(e)}"
+        }), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def api_create_job():
+    try:
+        data = request.get_json() or {}
+        query = data.get('query', '').strip()
+        country = data.get('country', 'sa')
+        platform = data.get('platform', 'all')
+        
+        if not query:
+            return jsonify({
+                "success": False,
+                "error": "يرجى إدخال مجال المنتجات للبحث"
+            }), 400
+        
+        limited = check_rate_limit()
+        if limited is not None:
+            return limited
+        
+        job_id = job_queue.submit(query, country, platform)
+        logger.info("مهمة تحليل جديدة %s: %s - %s - %s", job_id, query, country, platform)
+        
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status": JobStore.QUEUED,
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
+        
     except Exception as e:
-        logger.error(f"خطأ في التحليل: {str(e)}")
+        logger.error("خطأ في إنشاء المهمة: %s", e)
         return jsonify({
             "success": False,
             "error": f"حدث خطأ في النظام: {str(e)}"
         }), 500
 
+@app.route('/api/jobs/<job_id>')
+def api_get_job(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "المهمة غير موجودة"
+        }), 404
+    return jsonify({"success": True, **serialize_job(job)})
+
+@app.before_request
+def start_job_workers():
+    """عمال مهام الخلفية تبدأ مع أول طلب في كل عملية (بعد fork في gunicorn) وليس عند استيراد الوحدة"""
+    job_queue.start()
+
+@app.before_request
+def start_request():
+    """بداية قياس زمن الطلب وتتبعه، وتشغيل البروفايلر إن طُلب"""
+    g.request_started = time.perf_counter()
+    trace_id, parent_id, sampled = parse_trace_header(
+        request.headers.get('X-Trace-Id'), request.headers.get('traceparent'))
+    g.trace_span, g.trace_tokens = tracer.start_trace(
+        f"{request.method} {request.path}",
+        trace_id=trace_id,
+        parent_id=parent_id,
+        force=sampled or request.headers.get('X-Trace') == '1',
+    )
+    if PROFILE_MODE == 'all' or (PROFILE_MODE == 'header' and request.headers.get('X-Profile') == '1'):
+        g.profiler = SamplingProfiler(interval=PROFILE_INTERVAL_MS / 1000).start()
+
+@app.after_request
+def add_trace_headers(response):
+    """رقم التتبع في ترويسة الرد، وملف البروفايل (collapsed stacks) إن كان مفعلاً"""
+    trace_id = current_trace_id()
+    if trace_id:
+        response.headers['X-Trace-Id'] = trace_id
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        path = profiler.dump(os.path.join(PROFILE_DIR, f"{trace_id or int(time.time() * 1000)}.folded"))
+        response.headers['X-Profile-File'] = os.path.basename(path)
+        logger.info("🔥 تم حفظ البروفايل: %s", path)
+    return response
+
+@app.teardown_request
+def end_request_trace(error=None):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        tracer.end_trace(span, g.pop('trace_tokens'), error)
+
+@app.after_request
+def record_request_metrics(response):
+    """عدد الطلبات وزمن بناء الرد لكل مسار (يُسجل بعد الضغط، ولردود البث حتى إرسال الترويسات فقط)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """ضغط ردود JSON الكبيرة حسب Accept-Encoding"""
+    if (COMPRESS_MIN_BYTES <= 0 or response.direct_passthrough or response.is_streamed
+            or response.status_code != 200 or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/api/health')
 def health_check():
     return jsonify({
         "status": "running",
         "service": "Smart Product Analyzer",
         "timestamp": datetime.now().isoformat(),
-        "openrouter_available": bool(OPENROUTER_API_KEY)
+        "openrouter_available": bool(OPENROUTER_API_KEY),
+        "cache": result_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "catalog": product_catalog.stats() if product_catalog is not None else None,
+        "coalescing": analyzer.inflight.stats(),
+        "circuit_breaker": openrouter_client.breaker.snapshot(),
+        "models": model_router.stats(),
+        "cache_warming": cache_warmer.stats(),
+        "admission": {
+            "rate_limit": rate_limiter.stats(),
+            "upstream": upstream_gate.stats(),
+            "token_budget": token_budget.stats()
+        },
+        "jobs": job_queue.stats()
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """مقاييس كل عمال gunicorn بصيغة Prometheus"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.cli.command("warm-cache")
+@click.option("--country", "countries", multiple=True, help="السوق (يمكن تكراره)، الافتراضي WARM_COUNTRIES")
+@click.option("--query", "queries", multiple=True, help="استعلام محدد بدلاً من القائمة الساخنة (يمكن تكراره)")
+@click.option("--platform", "platforms", multiple=True, help="المنصة (يمكن تكراره)، الافتراضي كل المنصات")
+@click.option("--no-stats", is_flag=True, help="تجاهل الاستعلامات الأكثر طلباً من السجل")
+@click.option("--force", is_flag=True, help="إعادة التحليل حتى للمدخلات الصالحة")
+@click.option("--dry-run", is_flag=True, help="عرض الاستعلامات فقط بدون تحليل")
+def warm_cache_command(countries, queries, platforms, no_stats, force, dry_run):
+    """تسخين كاش النتائج يدوياً للاستعلامات الساخنة"""
+    countries = list(countries) or cache_warmer.countries
+    if queries:
+        targets = [(query, country) for country in countries for query in queries]
+    else:
+        targets = cache_warmer.targets(countries, from_stats=not no_stats)
+    for query, country in targets:
+        click.echo(f"{country}\t{query}")
+    if dry_run:
+        return
+    if not OPENROUTER_API_KEY:
+        raise click.ClickException("OPENROUTER_API_KEY غير مضبوط، لا يمكن تسخين الكاش")
+    summary = cache_warmer.warm(targets, force=force, platforms=list(platforms) or None)
+    click.echo(json.dumps(summary, ensure_ascii=False))
+
 if __name__ == '__main__':
+    job_queue.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+# المحرك غير المتزامن: عامل واحد يخدم طلبات LLM متعددة في نفس الوقت
+# التشغيل: uvicorn async_app:asgi_app --host 0.0.0.0 --port 5000
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime
+
+import app as sync_app
+from cache import make_cache_key
+from http_client import AsyncOpenRouterClient, CircuitBreaker, CircuitOpenError, OpenRouterError
+from product_model import json_default
+from ratelimit import BudgetExceededError, OverloadedError
+from singleflight import AsyncSingleFlight
+from tracing import current_trace_id, parse_trace_header
+
+logger = logging.getLogger(__name__)
+
+ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_POOL_SIZE", "100"))
+
+
+class AsyncSmartProductAnalyzer(sync_app.SmartProductAnalyzer):
+    """نسخة asyncio من المحلل تشارك بناء الطلب وتحليل الرد مع النسخة المتزامنة
+
+    قراءة وكتابة الكاش والكتالوج والميزانية (وقد تكون في SQLite) تعمل في خيوط asyncio.to_thread
+    حتى لا توقف حلقة الأحداث.
+    """
+
+    def __init__(self, cache=None, client=None, gate=None, semantic=None, catalog=None, prompts=None,
+                 token_budget=None, router=None):
+        super().__init__(cache=cache, client=client or AsyncOpenRouterClient(), gate=gate, semantic=semantic,
+                         catalog=catalog, prompts=prompts, token_budget=token_budget, router=router)
+        self.inflight = AsyncSingleFlight()
+        self._refresh_tasks = set()
+        self._loop = None
+
+    async def search_products(self, query, country, platform):
+        """بحث ذكي في منصات متعددة"""
+        logger.info("بحث عن: %s في %s للسوق %s", query, platform, country)
+
+        if platform == 'all' and sync_app.OPENROUTER_API_KEY:
+            return await self._search_all_platforms(query, country)
+
+        cache_key = make_cache_key(query, country, platform)
+        self._loop = asyncio.get_running_loop()
+        cached_products = await asyncio.to_thread(self.cached_products, cache_key, query, country, platform)
+        if cached_products is not None:
+            return cached_products
+
+        return await self.inflight.do(cache_key, self._analyze_uncached, query, country, platform, cache_key)
+
+    async def _search_all_platforms(self, query, country):
+        """توزيع البحث على كل المنصات بالتوازي داخل حلقة الأحداث"""
+        platforms = self.fanout_platforms
+        outcomes = await asyncio.gather(
+            *(self.search_products(query, country, p) for p in platforms),
+            return_exceptions=True,
+        )
+        results = {}
+        overloaded = None
+        for platform, outcome in zip(platforms, outcomes):
+            if isinstance(outcome, OverloadedError):
+                overloaded = outcome
+            elif isinstance(outcome, Exception):
+                logger.warning("⚠️ فشل البحث في %s: %s", platform, outcome)
+            else:
+                results[platform] = outcome
+
+        if not results:
+            if overloaded is not None:
+                raise overloaded
+            self.record_fallback(country, 'all', "all_platforms_failed")
+            return self.generate_sample_data(query, country, 'all')
+        return self.merge_platform_results(results)
+
+    def schedule_refresh(self, query, country, platform):
+        """تحديث مدخل الكاش في الخلفية كمهمة asyncio، مرة واحدة لكل مفتاح في نفس الوقت"""
+        # يُستدعى من خيط قراءة الكاش، فالمهمة تُنشأ داخل حلقة الأحداث
+        self._loop.call_soon_threadsafe(self._start_refresh, query, country, platform)
+
+    def _start_refresh(self, query, country, platform):
+        cache_key = make_cache_key(query, country, platform)
+        if cache_key in self._refreshing:
+            return
+        self._refreshing.add(cache_key)
+        sync_app.REVALIDATIONS_TOTAL.inc()
+        task = self._loop.create_task(self._refresh(query, country, platform, cache_key))
+        # مرجع للمهمة حتى لا تُجمع قبل انتهائها
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh(self, query, country, platform, cache_key):
+        try:
+            await self.inflight.do(cache_key, self._analyze_uncached, query, country, platform, cache_key)
+        except Exception as e:
+            logger.warning("⚠️ فشل تحديث الكاش في الخلفية: %s", e)
+        finally:
+            self._refreshing.discard(cache_key)
+
+    def upstream_slot(self):
+        return self.gate.admit_async() if self.gate is not None else nullcontext()
+
+    async def _analyze_uncached(self, query, country, platform, cache_key):
+        """التحليل الفعلي عند عدم وجود النتيجة في الكاش"""
+        try:
+            if sync_app.OPENROUTER_API_KEY:
+                async with self.upstream_slot():
+                    ai_products = await self.analyze_with_ai(query, country, platform)
+                if ai_products:
+                    sync_app.RESULTS_TOTAL.inc(source="ai", **sync_app.metric_labels(country, platform))
+                    await asyncio.to_thread(self.store_products, cache_key, query, country, platform, ai_products)
+                    return ai_products
+                logger.warning("⚠️ الذكاء الاصطناعي return None, استخدام البيانات التجريبية")
+        except BudgetExceededError as e:
+            return await asyncio.to_thread(self.budget_exhausted, e, query, country, platform)
+        except OverloadedError as e:
+            return await asyncio.to_thread(self.shed_load, e, query, country, platform)
+        except Exception as e:
+            logger.warning("⚠️ فشل التحليل بالذكاء الاصطناعي: %s", e)
+
+        return await asyncio.to_thread(
+            self.fallback_products, query, country, platform,
+            "ai_unavailable" if sync_app.OPENROUTER_API_KEY else "no_api_key")
+
+    @asynccontextmanager
+    async def token_usage(self, data, country, platform):
+        """نفس token_usage مع الحجز والتسوية في خيط"""
+        call = await asyncio.to_thread(self.reserve_tokens, data)
+        try:
+            yield call
+        finally:
+            await asyncio.to_thread(self.settle_tokens, call, data, country, platform)
+
+    async def analyze_with_ai(self, query, country, platform):
+        """تحليل المنتجات باستخدام OpenRouter API بدون حجز العامل"""
+        try:
+            if not sync_app.OPENROUTER_API_KEY:
+                logger.warning("⚠️ OpenRouter API Key غير مضبوط")
+                return None
+
+            headers, data = self.build_ai_request(query, country, platform)
+            async with self.token_usage(data, country, platform) as call:
+                with sync_app.stage("openrouter", country, platform):
+                    call["response"] = result = await self.router.complete_async(
+                        self.client.chat_completion, data, headers, allow_hedge=call["allow_hedge"])
+            return self.handle_ai_result(result, query, country, platform)
+
+        except BudgetExceededError:
+            raise
+        except CircuitOpenError as e:
+            logger.warning("⚡ قاطع الدائرة مفتوح، تخطي OpenRouter مؤقتاً")
+            self.record_upstream_error(e)
+            return None
+        except OpenRouterError as e:
+            logger.error("❌ OpenRouter API error: %s", e)
+            self.record_upstream_error(e)
+            return None
+        except Exception as e:
+            logger.error("❌ OpenRouter connection error: %s", e)
+            self.record_upstream_error(e)
+            return None
+
+
+class AnalyzerASGIApp:
+    """تطبيق ASGI بسيط بنفس عقود /api/analyze و /api/health في تطبيق Flask"""
+
+    CORS_HEADERS = [
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-allow-headers", b"Content-Type, X-Trace-Id, traceparent, X-API-Key, Authorization"),
+        (b"access-control-expose-headers", b"X-Trace-Id, Retry-After"),
+        (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    ]
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        trace_id, parent_id, sampled = parse_trace_header(headers.get("x-trace-id"), headers.get("traceparent"))
+        span, tokens = sync_app.tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            trace_id=trace_id,
+            parent_id=parent_id,
+            force=sampled or headers.get("x-trace") == "1",
+        )
+        error = None
+        try:
+            await self._dispatch(scope, receive, send)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            sync_app.tracer.end_trace(span, tokens, error)
+
+    async def _dispatch(self, scope, receive, send):
+        method = scope["method"]
+        path = scope["path"]
+        if method == "OPTIONS":
+            await self._send(send, 204, b"", b"text/plain")
+        elif path == "/api/analyze" and method == "POST":
+            allowed, retry_after = await asyncio.to_thread(sync_app.rate_limiter.acquire, self.client_key(scope))
+            if not allowed:
+                sync_app.ADMISSION_TOTAL.inc(outcome="rate_limited")
+                await self._send_too_many(send, retry_after, "تم تجاوز الحد المسموح من الطلبات، يرجى المحاولة لاحقاً")
+                return
+            try:
+                status, payload = await self.analyze(await self._read_body(receive))
+            except OverloadedError as e:
+                await self._send_too_many(send, e.retry_after, "الخدمة مشغولة حالياً، يرجى المحاولة لاحقاً")
+                return
+            await self._send_json(send, status, payload)
+        elif path == "/api/health" and method == "GET":
+            await self._send_json(send, 200, await asyncio.to_thread(self.health))
+        elif path == "/metrics" and method == "GET":
+            body = sync_app.metrics_registry.render().encode("utf-8")
+            await self._send(send, 200, body, sync_app.METRICS_CONTENT_TYPE.encode())
+        elif path == "/" and method == "GET":
+            await self._send_asset(send, sync_app.frontend_index)
+        elif path.startswith("/static/") and path[8:] in sync_app.frontend_assets and method == "GET":
+            await self._send_asset(send, sync_app.frontend_assets[path[8:]])
+        else:
+            await self._send_json(send, 404, {"success": False, "error": "Not Found"})
+
+    async def analyze(self, body):
+        try:
+            try:
+                data = json.loads(body or b"{}") or {}
+            except ValueError:
+                data = {}
+            query = str(data.get('query', '')).strip()
+            country = data.get('country', 'sa')
+            platform = data.get('platform', 'all')
+
+            if not query:
+                return 400, {
+                    "success": False,
+                    "error": "يرجى إدخال مجال المنتجات للبحث"
+                }
+
+            logger.info("طلب تحليل: %s - %s - %s", query, country, platform)
+            if sync_app.query_stats is not None:
+                await asyncio.to_thread(sync_app.query_stats.record, query, country)
+            products = await self.analyzer.search_products(query, country, platform)
+
+            return 200, {
+                "success": True,
+                "query": query,
+                "country": country,
+                "platform": platform,
+                "products_count": len(products),
+                "products": products,
+                "stale": any(product.get("stale") for product in products),
+                "timestamp": datetime.now().isoformat()
+            }
+        except OverloadedError:
+            raise
+        except Exception as e:
+            logger.error("خطأ في التحليل: %s", e)
+            return 500, {
+                "success": False,
+                "error": f"حدث خطأ في النظام: {str(e)}"
+            }
+
+    def health(self):
+        return {
+            "status": "running",
+            "service": "Smart Product Analyzer",
+            "engine": "asyncio",
+            "timestamp": datetime.now().isoformat(),
+            "openrouter_available": bool(sync_app.OPENROUTER_API_KEY),
+            "cache": self.analyzer.cache.stats() if self.analyzer.cache is not None else None,
+            "semantic_cache": self.analyzer.semantic.stats() if self.analyzer.semantic is not None else None,
+            "catalog": self.analyzer.catalog.stats() if self.analyzer.catalog is not None else None,
+            "coalescing": self.analyzer.inflight.stats(),
+            "circuit_breaker": self.analyzer.client.breaker.snapshot(),
+            "models": self.analyzer.router.stats(),
+            "admission": {
+                "rate_limit": sync_app.rate_limiter.stats(),
+                "upstream": self.analyzer.gate.stats() if self.analyzer.gate is not None else None,
+                "token_budget": self.analyzer.token_budget.stats() if self.analyzer.token_budget is not None else None
+            }
+        }
+
+    @staticmethod
+    def client_key(scope):
+        """نفس client_key في تطبيق Flask من ترويسات ASGI"""
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        api_key = headers.get("x-api-key", "")
+        authorization = headers.get("authorization", "")
+        if not api_key and authorization.startswith("Bearer "):
+            api_key = authorization[7:]
+        if api_key:
+            return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+        forwarded = headers.get("x-forwarded-for", "")
+        if sync_app.RATE_LIMIT_TRUST_PROXY and forwarded:
+            return f"ip:{forwarded.split(',')[0].strip()}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else None}"
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.analyzer.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _send_json(self, send, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=json_default).encode("utf-8")
+        await self._send(send, status, body, b"application/json")
+
+    async def _send_too_many(self, send, retry_after, error):
+        seconds = max(1, math.ceil(retry_after))
+        body = json.dumps({"success": False, "error": error, "retry_after": seconds}, ensure_ascii=False).encode("utf-8")
+        await self._send(send, 429, body, b"application/json", [(b"retry-after", str(seconds).encode())])
+
+    async def _send_asset(self, send, asset):
+        await self._send(send, 200, asset.body, asset.content_type.encode())
+
+    async def _send(self, send, status, body, content_type, extra_headers=()):
+        headers = [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-trace-id", (current_trace_id() or "").encode()),
+        ] + self.CORS_HEADERS + list(extra_headers)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_async_analyzer():
+    """إنشاء المحلل غير المتزامن بنفس إعدادات تطبيق Flask"""
+    client = AsyncOpenRouterClient(
+        url=sync_app.OPENROUTER_API_URL,
+        pool_size=ASYNC_POOL_SIZE,
+        connect_timeout=sync_app.OPENROUTER_CONNECT_TIMEOUT,
+        read_timeout=sync_app.OPENROUTER_READ_TIMEOUT,
+        max_retries=sync_app.OPENROUTER_MAX_RETRIES,
+        breaker=CircuitBreaker(
+            failure_threshold=sync_app.CIRCUIT_FAILURE_THRESHOLD,
+            recovery_timeout=sync_app.CIRCUIT_RECOVERY_SECONDS,
+        ),
+    )
+    return AsyncSmartProductAnalyzer(
+        cache=sync_app.result_cache, client=client, gate=sync_app.upstream_gate, semantic=sync_app.semantic_cache,
+        catalog=sync_app.product_catalog, prompts=sync_app.prompt_builder, token_budget=sync_app.token_budget,
+        router=sync_app.model_router)
+
+
+async_analyzer = create_async_analyzer()
+asgi_app = AnalyzerASGIApp(async_analyzer)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRunner:
+    """تنفيذ مجموعة تحليلات بالتوازي مع حد أقصى للتزامن في كل دفعة"""
+
+    def __init__(self, analyzer, max_workers=16):
+        self.analyzer = analyzer
+        self.max_workers = max_workers
+        # مجمع خيوط مشترك بين كل الدفعات حتى لا يتجاوز العامل عدد خيوط محدد
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+
+    @staticmethod
+    def normalize_job(job):
+        """قبول المهمة ككائن {query, country, platform} أو كقائمة [query, country, platform]"""
+        if isinstance(job, (list, tuple)):
+            job = dict(zip(("query", "country", "platform"), job))
+        if not isinstance(job, dict):
+            job = {}
+        return {
+            "query": str(job.get("query") or "").strip(),
+            "country": job.get("country") or "sa",
+            "platform": job.get("platform") or "all",
+        }
+
+    def _run_job(self, index, job):
+        job = self.normalize_job(job)
+        result = {"index": index, **job}
+        if not job["query"]:
+            result.update(status="error", error="يرجى إدخال مجال المنتجات للبحث")
+            return result
+        try:
+            products = self.analyzer.search_products(job["query"], job["country"], job["platform"])
+            result.update(status="ok", products_count=len(products), products=products)
+        except Exception as e:
+            # فشل مهمة واحدة لا يوقف بقية الدفعة
+            logger.error("❌ فشل تحليل المهمة %s: %s", index, e)
+            result.update(status="error", error=f"حدث خطأ في النظام: {str(e)}")
+        return result
+
+    def iter_results(self, jobs, concurrency):
+        """مولد يرجع نتيجة كل مهمة فور انتهائها (بترتيب الانتهاء)"""
+        concurrency = max(1, min(concurrency, self.max_workers))
+        pending = {}
+        position = 0
+        while position < len(jobs) or pending:
+            while position < len(jobs) and len(pending) < concurrency:
+                # نسخة من سياق الطلب (رقم التتبع) لكل مهمة
+                future = self.executor.submit(contextvars.copy_context().run, self._run_job, position, jobs[position])
+                pending[future] = position
+                position += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                yield future.result()
+
+    def run(self, jobs, concurrency):
+        """تنفيذ الدفعة كاملة وإرجاع النتائج بنفس ترتيب المهام"""
+        results = [None] * len(jobs)
+        for result in self.iter_results(jobs, concurrency):
+            results[result["index"]] = result
+        return results
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# قياس الطلبات في الثانية لكل عامل: Flask المتزامن مقابل محرك asyncio
+# التشغيل: python benchmarks/async_engine_bench.py --latency 0.2 --requests 200 --concurrency 100
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openrouter_stub import start_stub  # noqa: E402
+
+
+def bench_sync(sync_app, total):
+    """عامل gunicorn متزامن: طلب واحد في كل مرة"""
+    client = sync_app.app.test_client()
+    started = time.perf_counter()
+    for i in range(total):
+        response = client.post("/api/analyze", json={"query": f"sync-{i}", "country": "sa", "platform": "amazon"})
+        assert response.status_code == 200
+    return total / (time.perf_counter() - started)
+
+
+async def bench_async(asgi_app, total, concurrency):
+    """عامل ASGI واحد بعدد طلبات متزامنة محدود"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        body = json.dumps({"query": f"async-{i}", "country": "sa", "platform": "amazon"}).encode()
+        scope = {"type": "http", "method": "POST", "path": "/api/analyze"}
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        async with semaphore:
+            await asgi_app(scope, receive, send)
+        assert sent[0]["status"] == 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async analysis engine benchmark")
+    parser.add_argument("--latency", type=float, default=0.2, help="زمن رد الخادم المحاكي بالثواني")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    server, url = start_stub(latency=args.latency)
+    os.environ["OPENROUTER_API_URL"] = url
+    os.environ["ASYNC_POOL_SIZE"] = str(args.concurrency)
+    # كل الطلبات من نفس العميل وتتجاوز حد المعدل الافتراضي
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+
+    import app as sync_app
+    import async_app
+
+    sync_app.OPENROUTER_API_KEY = "benchmark"
+    sync_requests = max(1, min(args.requests, int(5 / max(args.latency, 0.001))))
+    sync_rps = bench_sync(sync_app, sync_requests)
+    async_rps = asyncio.run(bench_async(async_app.asgi_app, args.requests, args.concurrency))
+    server.shutdown()
+
+    print(f"upstream latency      : {args.latency * 1000:.0f} ms")
+    print(f"sync Flask worker     : {sync_rps:8.1f} req/s ({sync_requests} requests)")
+    print(f"asyncio ASGI worker   : {async_rps:8.1f} req/s ({args.requests} requests, concurrency {args.concurrency})")
+    print(f"speed-up              : {async_rps / sync_rps:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
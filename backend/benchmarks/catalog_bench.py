@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# زمن البحث في كتالوج المنتجات (FTS5 مقابل LIKE) حسب عدد المنتجات المفهرسة
+# التشغيل: python benchmarks/catalog_bench.py --sizes 1000,10000,100000
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import ProductCatalog  # noqa: E402
+
+NOUNS = ["ساعة", "سماعة", "حقيبة", "مصباح", "شاحن", "كاميرا", "حذاء", "عطر", "غطاء", "مجفف",
+         "لعبة", "كابل", "مكبر", "قهوة", "سجادة", "وسادة", "منظم", "زجاجة", "مرآة", "فرشاة"]
+ADJECTIVES = ["ذكية", "لاسلكية", "رياضية", "محمولة", "مضيئة", "صغيرة", "فاخرة", "مغناطيسية", "قابلة للطي",
+              "للأطفال", "للسيارة", "للمطبخ", "مقاومة للماء"]
+PLATFORMS = ["amazon", "aliexpress", "noon"]
+COMPETITION = ["منخفض", "متوسط", "عالي"]
+
+
+def make_products(count, rng):
+    for i in range(count):
+        name = f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {i}"
+        price = rng.randint(20, 500)
+        yield rng.choice(PLATFORMS), {
+            "id": f"bench-{i}",
+            "name_ar": name,
+            "name_en": f"Product {i}",
+            "category": rng.choice(NOUNS),
+            "profit_analysis": {
+                "purchase_price": price, "suggested_price": price * 2,
+                "profit_margin": f"{rng.randint(5, 60)}%", "currency": "ريال",
+            },
+            "market_analysis": {"competition": rng.choice(COMPETITION)},
+        }
+
+
+def timings(fn, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product catalog search benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(7)
+    queries = [f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)}" for _ in range(args.queries)]
+    print(f"{'products':>10}{'index s':>9}{'fts5 p50':>10}{'fts5 p99':>10}{'like p50':>10}{'like p99':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (int(s) for s in args.sizes.split(",")):
+            catalog = ProductCatalog(os.path.join(directory, f"catalog-{size}.sqlite3"), max_products=size)
+            started = time.perf_counter()
+            batch = {}
+            for platform, product in make_products(size, rng):
+                batch.setdefault(platform, []).append(product)
+                if len(batch[platform]) == 500:
+                    catalog.add(batch.pop(platform), "sa", platform)
+            for platform, products in batch.items():
+                catalog.add(products, "sa", platform)
+            indexed = time.perf_counter() - started
+
+            def search(query):
+                catalog.search(query, "sa", "all", limit=10, min_margin=20)
+
+            fts = timings(search, queries)
+            catalog.fts = False
+            like = timings(search, queries)
+            print(f"{size:>10}{indexed:>9.2f}{fts[0]:>10.2f}{fts[1]:>10.2f}{like[0]:>10.2f}{like[1]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
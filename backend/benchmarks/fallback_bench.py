@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# قياس مسار البيانات التجريبية (fallback) قبل وبعد القوالب المحسوبة مسبقاً
+# التشغيل: python benchmarks/fallback_bench.py --seconds 3
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_generate_sample_data(query, country, platform):
+    """نسخة generate_sample_data قبل القوالب المحسوبة مسبقاً (للمقارنة فقط)"""
+    products = []
+
+    for i in range(5):
+        base_price = 100 if country == 'sa' else 500
+        currency = 'ريال' if country == 'sa' else 'جنيه'
+
+        product = {
+            "id": f"{platform}-{i+1}",
+            "name_ar": f"{query} الذكي #{i+1}",
+            "name_en": f"Smart {query} #{i+1}",
+            "image": f"https://picsum.photos/300/200?random={i}",
+            "short_description": f"أحدث {query} في السوق بتقنيات متطورة وتصميم عصري",
+            "category": query,
+            "difficulty": "⭐" * (i % 3 + 1),
+            "why_win": "طلب مرتفع وتكلفة منخفضة وهامش ربح عالي",
+            "target": "شباب ومراهقين" if i % 2 == 0 else "عائلات ومحترفين",
+            "age_range": "18-35" if i % 2 == 0 else "25-45",
+            "gender": "ذكر" if i % 3 == 0 else "أنثى" if i % 3 == 1 else "كلا",
+            "interests": ["تسوق", "موضة", "تقنية", "لياقة بدنية"],
+            "problem": "يحل مشكلة الحاجة لمنتج عملي بجودة عالية وسعر معقول",
+
+            "profit_analysis": {
+                "purchase_price": base_price + (i * 20),
+                "suggested_price": (base_price + (i * 20)) * 2,
+                "profit_margin": "45%",
+                "total_costs": (base_price + (i * 20)) * 0.3,
+                "net_profit": (base_price + (i * 20)) * 0.7,
+                "currency": currency
+            },
+
+            "suppliers": {
+                "local": [
+                    {
+                        "name": "مورد محلي #1",
+                        "contact": "0551234567",
+                        "link": "#"
+                    }
+                ],
+                "international": [
+                    {
+                        "name": "AliExpress",
+                        "link": "https://aliexpress.com",
+                        "min_order": "1 قطعة"
+                    }
+                ],
+                "shipping_days": "7-14 يوم",
+                "min_order": "1 قطعة"
+            },
+
+            "marketing": {
+                "platform": "تيك توك وإنستغرام",
+                "ad_copy": f"🔥 اكتشف أفضل {query} في السوق! 🔥\nجودة ممتازة ⭐ سعر لا يُنافس 🎯 توصيل سريع 🚚",
+                "video_idea": "عرض عملي للمنتج مع مقارنة الأسعار والجودة",
+                "hashtags": [f"#{query}", "#تسوق", "#عروض", "#جودة"],
+                "ad_budget": f"{50 + i * 10} {currency}/يوم"
+            },
+
+            "market_analysis": {
+                "competition": "منخفض" if i % 3 == 0 else "متوسط" if i % 3 == 1 else "عالي",
+                "demand": "مستمر" if i % 2 == 0 else "موسمي",
+                "unique_point": "جودة عالية وسعر تنافسي وتصميم مميز",
+                "growth_prediction": f"+{15 + i * 5}% خلال 2024"
+            },
+
+            "tips": [
+                "ركز على التسويق عبر منصات الفيديو القصيرة",
+                "التقط صور احترافية للمنتج من زوايا متعددة",
+                "قدم ضمان مجاني لأول 30 يوم",
+                "استخدم التوصيل السريع كعامل تمييز"
+            ],
+
+            "timestamp": datetime.now().isoformat(),
+            "source": platform,
+            "country": country,
+            "analyzed_by": "sample"
+        }
+        products.append(product)
+
+    return products
+
+
+def rate(fn, seconds):
+    """عدد الاستدعاءات في الثانية خلال مدة محددة"""
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        fn(calls)
+        calls += 1
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample-data fallback path benchmark")
+    parser.add_argument("--seconds", type=float, default=3.0, help="مدة كل قياس بالثواني")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("JOB_WORKERS", "0")
+    # الطلبات المتتالية من نفس العميل تتجاوز حد المعدل الافتراضي
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    import app as sync_app
+
+    sync_app.OPENROUTER_API_KEY = ""
+    analyzer = sync_app.analyzer
+    client = sync_app.app.test_client()
+    countries = ("sa", "eg", "ae", "global")
+
+    def generate_legacy(i):
+        legacy_generate_sample_data(f"منتج {i % 50}", countries[i % 4], "amazon")
+
+    def generate_templates(i):
+        analyzer.generate_sample_data(f"منتج {i % 50}", countries[i % 4], "amazon")
+
+    def request(i):
+        response = client.post("/api/analyze", json={"query": f"منتج {i % 50}", "country": countries[i % 4]})
+        assert response.status_code == 200
+
+    legacy_generate = rate(generate_legacy, args.seconds)
+    template_generate = rate(generate_templates, args.seconds)
+
+    current = analyzer.generate_sample_data
+    analyzer.generate_sample_data = legacy_generate_sample_data
+    legacy_requests = rate(request, args.seconds)
+    analyzer.generate_sample_data = current
+    template_requests = rate(request, args.seconds)
+
+    print(f"generate_sample_data  before: {legacy_generate:10.0f} calls/s   after: {template_generate:10.0f} calls/s"
+          f"   ({template_generate / legacy_generate:.2f}x)")
+    print(f"/api/analyze fallback before: {legacy_requests:10.0f} req/s     after: {template_requests:10.0f} req/s"
+          f"   ({template_requests / legacy_requests:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# اختبار حمل لـ /api/analyze و /api/health مع خادم OpenRouter محاكي (بدون استهلاك الـ API المدفوع)
+# التشغيل (التطبيق داخل نفس العملية):
+#   python benchmarks/load_test.py --scenarios ai,fallback,stream,health --requests 300 --concurrency 16
+# التشغيل على خادم خارجي (مثلاً gunicorn مع OPENROUTER_API_URL يشير إلى openrouter_stub.py):
+#   python benchmarks/load_test.py --url http://127.0.0.1:5000 --scenarios ai,health
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openrouter_stub import PRODUCTS_COMPLETION, start_stub  # noqa: E402
+
+SCENARIOS = ("ai", "fallback", "stream", "health")
+
+
+def percentile(values, fraction):
+    """النسبة المئوية بطريقة nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class LoadResult:
+    """أزمنة ونتائج كل طلبات سيناريو واحد"""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.first_byte = []
+        self.errors = 0
+        self.analyzed = 0
+        self.fallbacks = 0
+        self.elapsed = 0.0
+
+    def record(self, latency, ok, fallback=None, first_byte=None):
+        with self.lock:
+            self.latencies.append(latency)
+            if first_byte is not None:
+                self.first_byte.append(first_byte)
+            if not ok:
+                self.errors += 1
+            elif fallback is not None:
+                self.analyzed += 1
+                self.fallbacks += fallback
+
+    def summary(self):
+        count = len(self.latencies)
+        return {
+            "scenario": self.scenario,
+            "requests": count,
+            "errors": self.errors,
+            "throughput_rps": round(count / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(self.latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(self.latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 2),
+            "max_ms": round(max(self.latencies, default=0) * 1000, 2),
+            "ttfb_p50_ms": round(percentile(self.first_byte, 0.50) * 1000, 2) if self.first_byte else None,
+            "fallback_rate": round(self.fallbacks / self.analyzed, 3) if self.analyzed else None,
+        }
+
+
+def is_fallback(products):
+    """الرد يعتبر fallback إذا لم يأت أي منتج من تحليل الذكاء الاصطناعي"""
+    return not any(product.get("source") == "ai-analysis" for product in products)
+
+
+class LoadGenerator:
+    """إرسال الطلبات من عدة خيوط بتزامن محدد، كل خيط بجلسة HTTP خاصة به"""
+
+    def __init__(self, base_url, concurrency, platform, query_pool):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.platform = platform
+        self.query_pool = query_pool
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _query(self, scenario, index):
+        # بدون query_pool كل طلب باستعلام جديد حتى لا يخفي الكاش زمن المسار الفعلي
+        if self.query_pool:
+            return f"منتج {index % self.query_pool}"
+        return f"{scenario} منتج {index}-{time.monotonic_ns()}"
+
+    def _one(self, scenario, index, result):
+        started = time.perf_counter()
+        try:
+            if scenario == "health":
+                response = self._session().get(f"{self.base_url}/api/health", timeout=60)
+                result.record(time.perf_counter() - started, response.status_code == 200)
+                return
+
+            body = {"query": self._query(scenario, index), "country": "sa", "platform": self.platform}
+            if scenario == "stream":
+                self._one_stream(body, started, result)
+                return
+            response = self._session().post(f"{self.base_url}/api/analyze", json=body, timeout=60)
+            ok = response.status_code == 200
+            products = response.json().get("products", []) if ok else []
+            result.record(time.perf_counter() - started, ok, fallback=is_fallback(products) if ok else None)
+        except (requests.RequestException, ValueError):
+            result.record(time.perf_counter() - started, False)
+
+    def _one_stream(self, body, started, result):
+        body["stream"] = True
+        first_byte = None
+        products = []
+        with self._session().post(f"{self.base_url}/api/analyze", json=body, timeout=60, stream=True) as response:
+            ok = response.status_code == 200
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "product":
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    products.append(event["product"])
+                elif event.get("type") == "error":
+                    ok = False
+        result.record(time.perf_counter() - started, ok, fallback=is_fallback(products) if ok else None,
+                      first_byte=first_byte)
+
+    def run(self, scenario, total):
+        result = LoadResult(scenario)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for future in [executor.submit(self._one, scenario, i, result) for i in range(total)]:
+                future.result()
+        result.elapsed = time.perf_counter() - started
+        return result
+
+
+def start_app_server(sync_app):
+    """تشغيل تطبيق Flask داخل نفس العملية على منفذ عشوائي"""
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, sync_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for /api/analyze and /api/health")
+    parser.add_argument("--url", help="خادم خارجي بدلاً من تشغيل التطبيق داخل هذه العملية")
+    parser.add_argument("--scenarios", default="ai,fallback,health", help=f"من {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=300, help="عدد الطلبات لكل سيناريو")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--platform", default="amazon")
+    parser.add_argument("--query-pool", type=int, default=0, help="عدد الاستعلامات المختلفة (0 = كل طلب جديد)")
+    parser.add_argument("--latency", type=float, default=0.2, help="زمن رد الخادم المحاكي بالثواني")
+    parser.add_argument("--latency-jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة أخطاء الخادم المحاكي")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--json", action="store_true", help="طباعة النتائج كـ JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="فشل (exit 1) إذا تجاوز p95 هذا الحد")
+    parser.add_argument("--max-fallback-rate", type=float, help="فشل (exit 1) إذا تجاوزت نسبة fallback في ai هذا الحد")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"سيناريو غير معروف: {', '.join(sorted(unknown))}")
+
+    stub = sync_app = app_server = None
+    if args.url:
+        base_url = args.url
+    else:
+        stub, stub_url = start_stub(
+            latency=args.latency,
+            latency_jitter=args.latency_jitter,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            content=PRODUCTS_COMPLETION,
+        )
+        os.environ["OPENROUTER_API_URL"] = stub_url
+        os.environ.setdefault("JOB_WORKERS", "0")
+        os.environ.setdefault("METRICS_DIR", "")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        # كل الطلبات من نفس العميل وتتجاوز حد المعدل الافتراضي
+        os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+        logging.disable(logging.CRITICAL)
+        import app as sync_app
+
+        app_server, base_url = start_app_server(sync_app)
+
+    generator = LoadGenerator(base_url, args.concurrency, args.platform, args.query_pool)
+    summaries = []
+    for scenario in scenarios:
+        if sync_app is not None:
+            # مسار البيانات التجريبية = بدون مفتاح API، وبكاش فارغ في بداية كل سيناريو
+            sync_app.OPENROUTER_API_KEY = "" if scenario == "fallback" else "load-test"
+            sync_app.result_cache.clear()
+            if sync_app.semantic_cache is not None:
+                sync_app.semantic_cache.clear()
+            if sync_app.product_catalog is not None:
+                sync_app.product_catalog.clear()
+        upstream_before = stub.config.stats() if stub is not None else None
+        summary = generator.run(scenario, args.requests).summary()
+        if stub is not None and scenario in ("ai", "stream"):
+            # طلبات الخادم المحاكي تشمل إعادة المحاولة بعد الأخطاء
+            upstream_after = stub.config.stats()
+            summary["upstream"] = {key: upstream_after[key] - upstream_before[key] for key in upstream_after}
+        summaries.append(summary)
+
+    if app_server is not None:
+        app_server.shutdown()
+    if stub is not None:
+        stub.shutdown()
+
+    if args.json:
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'scenario':<10}{'reqs':>6}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'max ms':>9}{'ttfb p50':>10}{'fallback':>10}")
+        for s in summaries:
+            ttfb = f"{s['ttfb_p50_ms']:.1f}" if s["ttfb_p50_ms"] is not None else "-"
+            fallback = f"{s['fallback_rate']:.1%}" if s["fallback_rate"] is not None else "-"
+            print(f"{s['scenario']:<10}{s['requests']:>6}{s['errors']:>8}{s['throughput_rps']:>9.1f}"
+                  f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}"
+                  f"{ttfb:>10}{fallback:>10}")
+
+    failed = False
+    for s in summaries:
+        if args.max_p95_ms is not None and s["p95_ms"] > args.max_p95_ms:
+            print(f"FAIL: {s['scenario']} p95 {s['p95_ms']} ms > {args.max_p95_ms} ms")
+            failed = True
+        if (args.max_fallback_rate is not None and s["scenario"] == "ai"
+                and s["fallback_rate"] is not None and s["fallback_rate"] > args.max_fallback_rate):
+            print(f"FAIL: ai fallback rate {s['fallback_rate']} > {args.max_fallback_rate}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
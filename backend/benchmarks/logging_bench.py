@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# قياس تكلفة التسجيل في مسار رد الذكاء الاصطناعي: print و f-strings المتزامنة مقابل السجل المؤجل عبر الطابور،
+# مرة بالكتابة في ملف محلي سريع ومرة في مخرج بطيء (write-latency لكل كتابة، مثل pipe أو طرفية ممتلئة)
+# التشغيل: python benchmarks/logging_bench.py --seconds 3 --threads 4 --write-latency 0.0002
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+AI_TEXT = json.dumps({"products": [
+    {
+        "name_ar": f"ساعة ذكية رياضية #{i}",
+        "name_en": f"Smart sport watch #{i}",
+        "short_description": "ساعة مقاومة للماء مع تتبع اللياقة ومراقبة النوم",
+        "category": "إلكترونيات",
+        "why_win": "طلب مرتفع على منتجات اللياقة مع هامش ربح جيد",
+        "profit_analysis": {"purchase_price": 80, "suggested_price": 199, "currency": "ريال"},
+        "tips": ["صور احترافية", "فيديو قصير", "ضمان مجاني"],
+    }
+    for i in range(3)
+]}, ensure_ascii=False)
+RESULT = {"choices": [{"message": {"content": AI_TEXT}}]}
+
+
+def legacy_handle_ai_result(sync_app, logger, result, query, country, platform):
+    """نسخة handle_ai_result قبل التعديل: f-strings و print لكل رد (للمقارنة فقط)"""
+    ai_text = result['choices'][0]['message']['content']
+    logger.info(f"✅ OpenRouter API responded successfully")
+
+    print("=== OpenRouter Response ===")
+    print(ai_text[:500])
+    print("========================")
+
+    with sync_app.stage("parse_ai_response", country, platform):
+        return sync_app.analyzer.parse_ai_response(ai_text, query, country, platform)
+
+
+class SlowStream:
+    """ملف ينتظر latency ثانية في كل كتابة (الانتظار يحرر GIL كما في الكتابة الحاجبة الحقيقية)"""
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, text):
+        time.sleep(self.latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def rate(fn, seconds, threads):
+    """عدد الاستدعاءات في الثانية من عدة خيوط، مع انتظار تفريغ السجل"""
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        while time.perf_counter() < deadline:
+            fn(counts[index])
+            counts[index] += 1
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts), started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path logging benchmark")
+    parser.add_argument("--seconds", type=float, default=3.0, help="مدة كل قياس بالثواني")
+    parser.add_argument("--threads", type=int, default=4, help="عدد خيوط الطلبات المتزامنة")
+    parser.add_argument("--write-latency", type=float, default=0.0002, help="زمن كل كتابة في المخرج البطيء")
+    args = parser.parse_args()
+
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("METRICS_DIR", "")
+    import app as sync_app
+    from log_config import configure_logging
+    from tracing import TraceIdFilter
+
+    analyzer = sync_app.analyzer
+    logger = logging.getLogger("app")
+    stdout = sys.stdout
+
+    def legacy(i):
+        logger.info(f"بحث عن: منتج {i % 50} في amazon للسوق sa")
+        legacy_handle_ai_result(sync_app, logger, RESULT, f"منتج {i % 50}", "sa", "amazon")
+
+    def current(i):
+        logger.info("بحث عن: %s في %s للسوق %s", f"منتج {i % 50}", "amazon", "sa")
+        analyzer.handle_ai_result(RESULT, f"منتج {i % 50}", "sa", "amazon")
+
+    scenarios = [
+        ("before: print + f-string, sync, INFO", legacy, dict(level="INFO", use_queue=False)),
+        ("before: print + f-string, sync, WARNING", legacy, dict(level="WARNING", use_queue=False)),
+        ("after: text, sync handler, INFO", current, dict(level="INFO", use_queue=False)),
+        ("after: text, queued, INFO", current, dict(level="INFO")),
+        ("after: json, queued, INFO", current, dict(level="INFO", fmt="json")),
+        ("after: json, queued, WARNING", current, dict(level="WARNING", fmt="json")),
+    ]
+
+    # السجل و stdout يكتبان في ملف حقيقي بدلاً من الطرفية، مباشرة أو عبر SlowStream
+    sinks = [("file", 0.0), (f"slow {args.write_latency * 1e6:.0f}us", args.write_latency)]
+    with tempfile.TemporaryDirectory() as directory:
+        for sink, latency in sinks:
+            results = []
+            for name, fn, options in scenarios:
+                with open(os.path.join(directory, "out.log"), "w", encoding="utf-8") as out:
+                    stream = SlowStream(out, latency) if latency else out
+                    sys.stdout = stream
+                    listener = configure_logging(stream=stream, filters=[TraceIdFilter()], **options)
+                    calls, started = rate(fn, args.seconds, args.threads)
+                    finished = time.perf_counter()
+                    if listener is not None:
+                        # ما تبقى في الطابور يُكتب بعد انتهاء الطلبات (تأخر خيط المستمع عن الطلبات)
+                        listener.stop()
+                    drained = time.perf_counter()
+                    out.flush()
+                    sys.stdout = stdout
+                    results.append((name, calls / (finished - started), calls / (drained - started),
+                                    drained - finished, out.tell()))
+
+            baseline = results[0][1]
+            # calls/s: ما أنجزته خيوط الطلبات، و with drain: حتى كتابة آخر سطر من الطابور
+            print(f"\nsink: {sink}")
+            print(f"{'scenario':<42}{'calls/s':>10}{'vs before':>11}{'with drain':>12}{'drain s':>9}{'log MB':>9}")
+            for name, per_second, with_drain, drain, size in results:
+                print(f"{name:<42}{per_second:>10.0f}{per_second / baseline:>10.2f}x{with_drain:>12.0f}"
+                      f"{drain:>9.2f}{size / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# زمن استدعاء OpenRouter مع نموذج ثابت مقابل توجيه لأسرع نموذج ثم مع الطلب الاحتياطي (hedging)،
+# على خادم محاكي لكل نموذج فيه زمن مختلف وذيل بطيء (tail_rate من الطلبات يتأخر tail_latency إضافية)
+# التشغيل: python benchmarks/model_routing_bench.py --requests 300 --concurrency 8
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openrouter_stub import PRODUCTS_COMPLETION, start_stub  # noqa: E402
+
+PROFILES = {
+    "openai/gpt-3.5-turbo": {"latency": 0.30, "latency_jitter": 0.10, "tail_rate": 0.03, "tail_latency": 1.5},
+    "anthropic/claude-3-haiku": {"latency": 0.15, "latency_jitter": 0.10, "tail_rate": 0.03, "tail_latency": 1.5},
+    "google/gemini-flash-1.5": {"latency": 0.20, "latency_jitter": 0.10, "tail_rate": 0.03, "tail_latency": 1.5},
+    # نموذج معطل: قاطعه يفتح بعد أول أخطاء ولا يُرسل له إلا طلب تجريبي كل فترة تعافي
+    "broken/model": {"latency": 0.05, "error_rate": 1.0},
+}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000  # noqa: E731
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model routing and hedged requests benchmark")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hedge-quantile", type=float, default=0.95)
+    args = parser.parse_args()
+
+    server, url = start_stub(content=PRODUCTS_COMPLETION, models=PROFILES)
+    os.environ["OPENROUTER_API_URL"] = url
+    os.environ.setdefault("JOB_WORKERS", "0")
+    logging.disable(logging.CRITICAL)
+    import app as sync_app
+    import async_app
+    from http_client import AsyncOpenRouterClient, CircuitBreaker, OpenRouterClient
+    from routing import ModelRouter
+
+    sync_app.OPENROUTER_API_KEY = "stub"
+    pool = list(PROFILES)
+    scenarios = [
+        ("fixed", ["openai/gpt-3.5-turbo"], False),
+        ("routed", pool, False),
+        ("routed+hedge", pool, True),
+    ]
+
+    def make_router(models, hedge):
+        return ModelRouter(models, hedge=hedge, hedge_quantile=args.hedge_quantile, hedge_min_samples=20,
+                           hedge_min_delay=0.0, hedge_workers=args.concurrency * 2, recovery_timeout=5.0)
+
+    # بدون إعادة محاولة حتى يظهر أثر التوجيه وحده، والقاطع العام بإعدادات التطبيق نفسها:
+    # أخطاء النموذج المعطل تصل إليه أيضاً وتفتحه إذا تتابعت دون نجاح من النماذج الأخرى بينها
+    def make_client(cls):
+        return cls(url=url, max_retries=0, pool_size=args.concurrency * 2,
+                   breaker=CircuitBreaker(failure_threshold=sync_app.CIRCUIT_FAILURE_THRESHOLD,
+                                          recovery_timeout=sync_app.CIRCUIT_RECOVERY_SECONDS))
+
+    print(f"{'engine':<7}{'scenario':<14}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'failed':>7}{'calls/req':>10}"
+          f"{'hedges':>8}{'won':>5}{'failover':>9}{'breaker':>9}  requests by model")
+    for name, models, hedge in scenarios:
+        router = make_router(models, hedge)
+        analyzer = sync_app.SmartProductAnalyzer(client=make_client(OpenRouterClient), router=router)
+        before = server.config.stats(), server.config.model_stats()
+
+        def one(i):
+            started = time.perf_counter()
+            products = analyzer.analyze_with_ai(f"منتج {i}", "sa", "amazon")
+            return time.perf_counter() - started, products is not None
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(one, range(args.requests)))
+        after = server.config.stats(), server.config.model_stats()
+        report("sync", name, results, router, analyzer.client.breaker, before, after, args.requests)
+
+    for name, models, hedge in scenarios:
+        router = make_router(models, hedge)
+        analyzer = async_app.AsyncSmartProductAnalyzer(client=make_client(AsyncOpenRouterClient), router=router)
+        before = server.config.stats(), server.config.model_stats()
+
+        async def run():
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(i):
+                async with semaphore:
+                    started = time.perf_counter()
+                    products = await analyzer.analyze_with_ai(f"منتج {i}", "sa", "amazon")
+                    return time.perf_counter() - started, products is not None
+
+            results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+            await analyzer.client.aclose()
+            return results
+
+        results = asyncio.run(run())
+        after = server.config.stats(), server.config.model_stats()
+        report("async", name, results, router, analyzer.client.breaker, before, after, args.requests)
+    server.shutdown()
+
+
+def report(engine, name, results, router, breaker, before, after, total):
+    p50, p95, p99 = percentiles([seconds for seconds, _ in results])
+    failed = sum(1 for _, ok in results if not ok)
+    (totals_before, models_before), (totals_after, models_after) = before, after
+    calls = totals_after["requests"] - totals_before["requests"]
+    by_model = {model: count - models_before.get(model, 0) for model, count in models_after.items()}
+    stats = router.stats()
+    hedging, failover = stats["hedging"], stats["failover"]
+    # breaker: الطلبات التي رفضها القاطع العام للعميل دون إرسالها
+    print(f"{engine:<7}{name:<14}{p50:>8.0f}{p95:>8.0f}{p99:>8.0f}{failed:>7}{calls / total:>10.2f}"
+          f"{hedging['sent']:>8}{hedging['won']:>5}{failover['won']:>4}/{failover['sent']:<4}"
+          f"{breaker.snapshot()['short_circuited']:>9}  "
+          + ", ".join(f"{model.split('/')[-1]}={count}" for model, count in by_model.items() if count))
+
+
+if __name__ == "__main__":
+    main()
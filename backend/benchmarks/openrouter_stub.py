@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# خادم محلي يحاكي https://openrouter.ai/api/v1/chat/completions لأغراض القياس
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_COMPLETION = "تحليل تجريبي من الخادم المحلي"
+# عد tokens تقريبي في الخادم المحاكي لحقل usage (مستقل عن تقدير التطبيق نفسه)
+STUB_CHARS_PER_TOKEN = 2.5
+
+# رد بصيغة PRODUCT_SCHEMA_PROMPT حتى يكتمل مسار الذكاء الاصطناعي بدون العودة للبيانات التجريبية
+PRODUCTS_COMPLETION = json.dumps({"products": [
+    {
+        "name_ar": f"منتج محاكى #{i + 1}",
+        "name_en": f"Stub product #{i + 1}",
+        "short_description": "منتج من الخادم المحاكي لأغراض القياس",
+        "category": "إلكترونيات",
+        "why_win": "طلب مرتفع وهامش ربح جيد",
+        "profit_analysis": {"purchase_price": 50 + i * 10, "suggested_price": 120 + i * 20, "currency": "ريال"},
+        "market_analysis": {"competition": "متوسط", "demand": "مستمر"},
+        "tips": ["صور احترافية", "فيديو قصير"],
+    }
+    for i in range(3)
+]}, ensure_ascii=False)
+
+
+class StubConfig:
+    """إعدادات سلوك الخادم المحاكي"""
+
+    def __init__(self, latency=0.2, content=SAMPLE_COMPLETION, chunk_size=40, chunk_delay=0.01,
+                 latency_jitter=0.0, error_rate=0.0, error_status=503, prompt_token_latency=0.0,
+                 tail_rate=0.0, tail_latency=0.0, models=None):
+        self.latency = latency
+        # زمن قراءة التعليمات لكل token (prefill) حتى يتأثر الزمن بحجم الطلب كما في النماذج الحقيقية
+        self.prompt_token_latency = prompt_token_latency
+        self.content = content
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        # زمن إضافي عشوائي بين 0 و latency_jitter لمحاكاة ذيل الأزمنة الطويلة
+        self.latency_jitter = latency_jitter
+        # نسبة الطلبات التي ترجع error_status بدلاً من الرد
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # نسبة الطلبات البطيئة جداً (tail_latency إضافية) لمحاكاة ذيل الأزمنة الذي يعالجه الطلب الاحتياطي
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        # إعدادات خاصة لكل نموذج: {"model": {"latency": 0.5, "error_rate": 0.1, ...}} تستبدل القيم العامة
+        self.models = models or {}
+        self.model_requests = {}
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.lock = threading.Lock()
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "prompt_tokens": self.prompt_tokens}
+
+    def model_stats(self):
+        """عدد الطلبات لكل نموذج (منفصل عن stats حتى تبقى عداداته أرقاماً يمكن طرحها مباشرة)"""
+        with self.lock:
+            return dict(self.model_requests)
+
+    def profile(self, model):
+        """قيمة كل إعداد زمن وأخطاء للنموذج المطلوب"""
+        overrides = self.models.get(model, {})
+        return {name: overrides.get(name, getattr(self, name))
+                for name in ("latency", "latency_jitter", "error_rate", "tail_rate", "tail_latency")}
+
+
+def _count_tokens(text):
+    return math.ceil(len(text) / STUB_CHARS_PER_TOKEN)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        config = self.server.config
+        with config.lock:
+            config.requests += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+        prompt_tokens = _count_tokens("".join(m.get("content") or "" for m in request_body.get("messages") or ()))
+        model = request_body.get("model")
+        profile = config.profile(model)
+        with config.lock:
+            config.prompt_tokens += prompt_tokens
+            config.model_requests[model] = config.model_requests.get(model, 0) + 1
+
+        delay = profile["latency"] + prompt_tokens * config.prompt_token_latency \
+            + random.uniform(0, profile["latency_jitter"])
+        if profile["tail_rate"] and random.random() < profile["tail_rate"]:
+            delay += profile["tail_latency"]
+        time.sleep(delay)
+        if profile["error_rate"] and random.random() < profile["error_rate"]:
+            with config.lock:
+                config.errors += 1
+            self._send_error(config.error_status)
+            return
+        if request_body.get("stream"):
+            self._send_stream(config)
+            return
+
+        body = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": config.content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": _count_tokens(config.content)},
+        }, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # العميل ألغى الطلب (مثل الطلب الخاسر في hedging)
+            self.close_connection = True
+
+    def _send_error(self, status):
+        body = json.dumps({"error": {"code": status, "message": "stub injected error"}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, config):
+        """إرسال الرد كأحداث SSE بنفس صيغة OpenRouter"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        content = config.content
+        for start in range(0, len(content), config.chunk_size):
+            delta = {"choices": [{"index": 0, "delta": {"content": content[start:start + config.chunk_size]}}]}
+            self._write_chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode("utf-8"))
+            time.sleep(config.chunk_delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        try:
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # العميل أغلق الاتصال مبكراً
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stub(host="127.0.0.1", port=0, **config):
+    """تشغيل الخادم في خيط خلفي وإرجاع (الخادم، رابط chat/completions)"""
+    server = _StubServer((host, port), _StubHandler)
+    server.config = StubConfig(**config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host}:{server.server_port}/api/v1/chat/completions"
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenRouter stub")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0)
+    parser.add_argument("--content", choices=("products", "text"), default="products")
+    args = parser.parse_args()
+    server, url = start_stub(
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        prompt_token_latency=args.prompt_token_latency,
+        content=PRODUCTS_COMPLETION if args.content == "products" else SAMPLE_COMPLETION,
+    )
+    print(f"OpenRouter stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# قياس ذاكرة 10 آلاف منتج: قواميس متداخلة (قبل) مقابل سجلات Product بـ __slots__ (بعد)
+# التشغيل: python benchmarks/product_memory_bench.py --products 10000
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VOCABULARY = {
+    "category": ["إلكترونيات", "أزياء", "منزل ومطبخ", "رياضة", "عناية شخصية"],
+    "why_win": ["طلب مرتفع وهامش ربح جيد", "منافسة قليلة ومراجعات ممتازة", "منتج موسمي سريع الانتشار"],
+    "target": ["شباب ومراهقين", "عائلات ومحترفين", "أمهات", "رياضيون"],
+    "age_range": ["18-35", "25-45", "30-55"],
+    "gender": ["ذكر", "أنثى", "كلا"],
+    "platform": ["تيك توك وإنستغرام", "سناب شات", "يوتيوب"],
+    "competition": ["منخفض", "متوسط", "عالي"],
+    "demand": ["مستمر", "موسمي", "متزايد"],
+    "interests": ["تسوق", "موضة", "تقنية", "لياقة بدنية", "طبخ", "سفر"],
+    "tips": ["صور احترافية", "فيديو قصير", "شحن مجاني", "ضمان استرجاع", "عروض الجمعة البيضاء"],
+}
+
+
+def ai_response(rng, response_index, per_response):
+    """رد نموذج بصيغة PRODUCT_SCHEMA_PROMPT، يُحلل بـ json.loads مستقل كما في الإنتاج"""
+    pick = lambda field: rng.choice(VOCABULARY[field])  # noqa: E731
+    products = []
+    for i in range(per_response):
+        price = rng.randint(20, 400)
+        products.append({
+            "name_ar": f"منتج {response_index}-{i}",
+            "name_en": f"Product {response_index}-{i}",
+            "short_description": f"وصف المنتج رقم {response_index}-{i} ومميزاته الأساسية",
+            "category": pick("category"), "why_win": pick("why_win"), "target": pick("target"),
+            "age_range": pick("age_range"), "gender": pick("gender"),
+            "interests": rng.sample(VOCABULARY["interests"], 3),
+            "problem": "يحل مشكلة الحاجة لمنتج عملي بجودة عالية وسعر معقول",
+            "difficulty": rng.randint(1, 5),
+            "profit_analysis": {"purchase_price": price, "suggested_price": price * 2, "total_costs": price * 0.3},
+            "marketing": {"platform": pick("platform"), "ad_copy": f"🔥 عرض خاص على المنتج {response_index}-{i}",
+                          "video_idea": "عرض عملي للمنتج مع مقارنة الأسعار", "hashtags": ["#تسوق", "#عروض"],
+                          "ad_budget": "50 ريال/يوم"},
+            "market_analysis": {"competition": pick("competition"), "demand": pick("demand"),
+                                "unique_point": "جودة عالية وسعر تنافسي", "growth_prediction": "+20% خلال 2024"},
+            "tips": rng.sample(VOCABULARY["tips"], 2),
+        })
+    return json.dumps({"products": products}, ensure_ascii=False)
+
+
+def dict_template(template):
+    """القالب بشكله السابق: قواميس للأقسام مع نفس الأجزاء المشتركة (suppliers وtips)"""
+    from product_model import Record
+    return {key: dict(value) if isinstance(value, Record) else value for key, value in template.items()}
+
+
+def measure(build):
+    """الذاكرة المحجوزة وعدد الكائنات التي يتتبعها GC للقائمة الناتجة فقط"""
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    products = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tracked = len(gc.get_objects()) - objects
+    count = len(products)
+    del products
+    # زمن البناء في تشغيلات منفصلة لأن tracemalloc يبطئ التخصيص
+    elapsed = float("inf")
+    for _ in range(3):
+        gc.collect()
+        started = time.perf_counter()
+        build()
+        elapsed = min(elapsed, time.perf_counter() - started)
+    return count, current, tracked, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product representation memory benchmark")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--per-response", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("JOB_WORKERS", "0")
+    import app as sync_app
+    from ai_parser import normalize_product, parse_products
+
+    analyzer = sync_app.analyzer
+    responses = args.products // args.per_response
+    templates = sync_app.sample_templates("sa", "amazon")
+    legacy_templates = [dict_template(template) for template in templates]
+    rng = random.Random(7)
+    texts = [ai_response(rng, r, args.per_response) for r in range(responses)]
+
+    def ai_dicts():
+        products = []
+        for text in texts:
+            for i, raw in enumerate(parse_products(text)):
+                template = legacy_templates[i % len(legacy_templates)]
+                product = normalize_product(raw, template)
+                product.update(id=f"{template['source']}-{i + 1}", analyzed_by="openrouter", source="ai-analysis")
+                products.append(product)
+        return products
+
+    def ai_records():
+        products = []
+        for text in texts:
+            for i, raw in enumerate(parse_products(text)):
+                products.append(analyzer._ai_product(raw, templates[i % len(templates)], i))
+        return products
+
+    def legacy_generate_sample_data(query):
+        """generate_sample_data بالقواميس كما كانت قبل سجلات Product (للمقارنة فقط)"""
+        with sync_app.stage("generate_sample_data", "sa", "amazon"):
+            timestamp = datetime.now().isoformat()
+            ad_copy = f"🔥 اكتشف أفضل {query} في السوق! 🔥\nجودة ممتازة ⭐ سعر لا يُنافس 🎯 توصيل سريع 🚚"
+            short_description = f"أحدث {query} في السوق بتقنيات متطورة وتصميم عصري"
+            products = []
+            for i, template in enumerate(legacy_templates):
+                product = dict(template)
+                product["name_ar"] = f"{query} الذكي #{i+1}"
+                product["name_en"] = f"Smart {query} #{i+1}"
+                product["short_description"] = short_description
+                product["category"] = query
+                marketing = dict(template["marketing"])
+                marketing["ad_copy"] = ad_copy
+                marketing["hashtags"] = [f"#{query}", *sync_app.SAMPLE_HASHTAGS]
+                product["marketing"] = marketing
+                product["timestamp"] = timestamp
+                product["analyzed_by"] = "sample"
+                products.append(product)
+        return products
+
+    def sample_dicts():
+        products = []
+        for r in range(responses):
+            products += legacy_generate_sample_data(f"منتج {r}")
+        return products[:args.products]
+
+    def sample_records():
+        products = []
+        for r in range(responses):
+            products += analyzer.generate_sample_data(f"منتج {r}", "sa", "amazon")
+        return products[:args.products]
+
+    # نتيجة نموذج النسختين متطابقة عند التسلسل
+    assert json.loads(sync_app.app.json.dumps(ai_records()[:50])) == json.loads(json.dumps(ai_dicts()[:50]))
+
+    print(f"{'path':<14}{'model':<10}{'MiB':>8}{'KiB/product':>13}{'gc objects':>12}{'build ms':>10}")
+    for name, before, after in (("ai-analysis", ai_dicts, ai_records), ("sample", sample_dicts, sample_records)):
+        results = []
+        for model, build in (("dicts", before), ("records", after)):
+            count, current, tracked, elapsed = measure(build)
+            results.append(current)
+            print(f"{name:<14}{model:<10}{current / 2 ** 20:>8.2f}{current / count / 1024:>13.2f}{tracked:>12}"
+                  f"{elapsed * 1000:>10.1f}")
+        print(f"{'':<14}{'saving':<10}{(1 - results[1] / results[0]) * 100:>7.0f}%")
+
+
+if __name__ == "__main__":
+    main()
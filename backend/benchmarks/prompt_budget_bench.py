@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# زمن استدعاء OpenRouter حسب حجم التعليمات (الخادم المحاكي يحسب زمن قراءة لكل token)،
+# وعدد الطلبات التي تتسع لها ميزانية tokens في الدقيقة قبل العودة للنتائج القديمة أو التجريبية
+# التشغيل: python benchmarks/prompt_budget_bench.py --requests 30 --prompt-token-latency 0.0005
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openrouter_stub import PRODUCTS_COMPLETION, start_stub  # noqa: E402
+
+LEGACY_SYSTEM = """أنت محلل منتجات اقتصادي خبير في السوق العربي.
+قدم تحليلات واقعية وقابلة للتنفيذ للمنتجات الرابحة.
+أرجع البيانات في شكل منظم وجاهز للبرمجة."""
+LEGACY_USER = """
+قم بتحليل فرص الربح للمنتج: {query}
+للأسواق العربية خاصة: {country} على المنصة: {platform}
+
+المطلوب تحليل 3 منتجات مقترحة مع البيانات التالية لكل منتج:
+- اسم عربي للمنتج
+- اسم إنجليزي للمنتج
+- وصف قصير
+- فئة المنتج
+- سبب الربحية
+- الجمهور المستهدف
+- الفئة العمرية
+- الاهتمامات
+- المشكلة التي يحلها
+- تحليل ربحي (سعر شراء، سعر بيع، هامش ربح)
+- نصائح تسويقية
+- تحليل السوق
+- نصائح الخبراء
+
+يجب أن تكون البيانات واقعية وقابلة للتنفيذ في السوق العربي.
+"""
+
+FIELD_SETS = {
+    "full": None,
+    "core": ("name_ar", "name_en", "short_description", "category", "why_win", "profit_analysis",
+             "market_analysis"),
+    "minimal": ("name_ar", "name_en", "profit_analysis"),
+}
+
+
+class LegacyPrompt:
+    """التعليمات السابقة كما كانت في build_ai_request (للمقارنة فقط)"""
+
+    temperature = 0.7
+    max_tokens = 2000
+
+    def messages(self, query, country, platform_name):
+        from ai_parser import PRODUCT_SCHEMA_PROMPT
+        user = LEGACY_USER.format(query=query, country=country, platform=platform_name) + PRODUCT_SCHEMA_PROMPT
+        return [{"role": "system", "content": LEGACY_SYSTEM}, {"role": "user", "content": user}]
+
+
+def latencies(analyzer, requests):
+    samples = []
+    for i in range(requests):
+        started = time.perf_counter()
+        analyzer.analyze_with_ai(f"سماعات لاسلكية {i}", "sa", "amazon")
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt size and token budget benchmark")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0005)
+    parser.add_argument("--budget", type=int, default=20000, help="tokens per minute for the budget run")
+    args = parser.parse_args()
+
+    server, url = start_stub(latency=args.latency, prompt_token_latency=args.prompt_token_latency,
+                             content=PRODUCTS_COMPLETION)
+    os.environ["OPENROUTER_API_URL"] = url
+    os.environ.setdefault("JOB_WORKERS", "0")
+    logging.disable(logging.CRITICAL)
+    import app as sync_app
+    from prompts import PromptBuilder, estimate_messages_tokens
+    from ratelimit import MemoryAdmissionStore, TokenBudget
+
+    sync_app.OPENROUTER_API_KEY = "stub"
+    variants = [("legacy", 3, LegacyPrompt())]
+    variants += [(name, 3, PromptBuilder(product_count=3, fields=fields)) for name, fields in FIELD_SETS.items()]
+    variants += [("full", count, PromptBuilder(product_count=count)) for count in (1, 5)]
+
+    print(f"{'prompt':<9}{'products':>9}{'prompt tok':>11}{'max_tokens':>11}{'reserved':>9}"
+          f"{'p50 ms':>8}{'p95 ms':>8}{'req/min @budget':>16}")
+    for name, count, prompts in variants:
+        analyzer = sync_app.SmartProductAnalyzer(client=sync_app.openrouter_client, prompts=prompts)
+        prompt_tokens = estimate_messages_tokens(prompts.messages("سماعات لاسلكية", "sa", "أمازون"))
+        reserved = prompt_tokens + prompts.max_tokens
+        p50, p95 = latencies(analyzer, args.requests)
+        print(f"{name:<9}{count:>9}{prompt_tokens:>11}{prompts.max_tokens:>11}{reserved:>9}"
+              f"{p50:>8.1f}{p95:>8.1f}{args.budget // reserved:>16}")
+
+    # نفاد الميزانية: الطلبات بعد الحد تُخدم من البيانات التجريبية بدون استدعاء OpenRouter
+    budget = TokenBudget(MemoryAdmissionStore(), per_minute=args.budget)
+    analyzer = sync_app.SmartProductAnalyzer(client=sync_app.openrouter_client, token_budget=budget)
+    before = server.config.stats()["requests"]
+    sources = {}
+    for i in range(args.requests):
+        products = analyzer._analyze_uncached(f"منتج الميزانية {i}", "sa", "amazon", f"budget-{i}")
+        source = products[0]["source"] if products else "none"
+        sources[source] = sources.get(source, 0) + 1
+    print(f"\nbudget {args.budget} tokens/min, {args.requests} requests: "
+          f"{server.config.stats()['requests'] - before} upstream calls, results by source {sources}")
+    print(f"budget stats: {budget.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
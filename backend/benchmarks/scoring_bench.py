@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# مقارنة تقييم المنتجات المرشحة: منتج منتج كقواميس مقابل تمريرة numpy واحدة على الأعمدة
+# التشغيل: python benchmarks/scoring_bench.py --sizes 1000,10000,100000
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scoring  # noqa: E402
+
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        purchase_price = rng.uniform(10, 500)
+        rows.append({
+            "purchase_price": purchase_price,
+            "suggested_price": purchase_price * rng.uniform(0.8, 3.0),
+            "costs": purchase_price * rng.uniform(0.0, 0.5),
+            "shipping_days": rng.randint(2, 30),
+            "ad_budget": rng.uniform(0, 200),
+            "competition": rng.choice(["منخفض", "متوسط", "عالي"]),
+        })
+    return rows
+
+
+def per_dict(rows):
+    """المسار القديم: حساب كل منتج في قاموسه ثم الترتيب"""
+    weights = scoring._weights(None)
+    scored = []
+    for row in rows:
+        result = scoring._row_score(
+            row["purchase_price"], row["suggested_price"], row["costs"], row["shipping_days"],
+            row["ad_budget"], scoring.competition_level(row["competition"]), weights,
+        )
+        scored.append(dict(row, score=result[0], net_profit=result[1], profit_margin=result[2], roi=result[3]))
+    scored.sort(key=lambda product: -product["score"])
+    return scored
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk profitability scoring benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if scoring.np is None:
+        print("numpy is not installed, only the per-dict path is available")
+        return
+
+    print(f"{'products':>10}{'per-dict ms':>14}{'numpy ms':>11}{'numpy+convert ms':>18}{'speedup':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        rows = make_rows(size)
+        columns = scoring.columns_from_rows(rows)
+        # الأعمدة المرسلة لـ /api/score تصل بنفس هذا الشكل (قوائم JSON)
+        legacy = best_of(lambda: per_dict(rows), args.repeat)
+        vectorized = best_of(lambda: scoring.score_columns(columns), args.repeat)
+        converted = best_of(lambda: scoring.score_columns(scoring.columns_from_rows(rows)), args.repeat)
+        print(f"{size:>10}{legacy * 1000:>14.1f}{vectorized * 1000:>11.1f}{converted * 1000:>18.1f}"
+              f"{legacy / vectorized:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# قياس حجم رد /api/analyze على الشبكة وزمن التسلسل لكل رد
+# التشغيل: python benchmarks/serialization_bench.py --iterations 2000
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def per_call_us(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/analyze serialization and compression benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("JOB_WORKERS", "0")
+    import app as sync_app
+    from compression import SUPPORTED_ENCODINGS, compress
+    from flask.json.provider import DefaultJSONProvider
+    from serialization import FastJSONProvider, project_products
+
+    products = sync_app.analyzer.generate_sample_data("ساعة ذكية", "sa", "amazon")
+
+    def payload(items):
+        return {
+            "success": True,
+            "query": "ساعة ذكية",
+            "country": "sa",
+            "platform": "amazon",
+            "products_count": len(items),
+            "products": items,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    full = payload(products)
+    projected = payload(project_products(products, ["name_ar", "profit_analysis"]))
+
+    providers = [("flask default", DefaultJSONProvider(sync_app.app))]
+    providers.append(("stdlib json", FastJSONProvider(sync_app.app, encoder="json")))
+    try:
+        providers.append(("orjson", FastJSONProvider(sync_app.app, encoder="orjson")))
+    except RuntimeError:
+        print("orjson not installed, skipping")
+
+    def encode(provider, obj):
+        if isinstance(provider, FastJSONProvider):
+            return provider.dumps_bytes(obj)
+        return provider.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    print(f"{'encoder':<15}{'payload':<12}{'µs/response':>12}{'raw bytes':>11}"
+          + "".join(f"{encoding + ' bytes':>12}{encoding + ' µs':>10}" for encoding in SUPPORTED_ENCODINGS))
+    for name, provider in providers:
+        for label, obj in (("full", full), ("fields=2", projected)):
+            body = encode(provider, obj)
+            serialize_us = per_call_us(lambda: encode(provider, obj), args.iterations)
+            row = f"{name:<15}{label:<12}{serialize_us:>12.1f}{len(body):>11}"
+            for encoding in SUPPORTED_ENCODINGS:
+                compress_us = per_call_us(lambda: compress(body, encoding), max(1, args.iterations // 10))
+                row += f"{len(compress(body, encoding)):>12}{compress_us:>10.1f}"
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# collector محلي يستقبل خطوات التتبع من TRACE_EXPORT=http://127.0.0.1:8098/spans
+# ويطبع كل طلب كشجرة خطوات مع أزمنتها، ويحفظ الخطوات الخام في ملف JSON Lines
+import argparse
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TraceStore:
+    """تجميع الخطوات حسب رقم التتبع حتى تصل الخطوة الجذرية"""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.lock = threading.Lock()
+        self.pending = defaultdict(list)
+
+    def add(self, spans):
+        finished = []
+        with self.lock:
+            if self.output:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    for span in spans:
+                        f.write(json.dumps(span, ensure_ascii=False) + "\n")
+            for span in spans:
+                self.pending[span["trace_id"]].append(span)
+                if span["parent_id"] is None:
+                    finished.append(self.pending.pop(span["trace_id"]))
+        for trace in finished:
+            print(format_trace(trace), flush=True)
+
+
+def format_trace(spans):
+    """شجرة الخطوات: كل خطوة تحت الخطوة الأم مرتبة حسب وقت البداية"""
+    children = defaultdict(list)
+    for span in spans:
+        children[span["parent_id"]].append(span)
+    lines = []
+
+    def walk(span, depth):
+        attributes = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+        error = f" ERROR={span['error']}" if span.get("error") else ""
+        lines.append(f"{'  ' * depth}{span['name']:<{40 - 2 * depth}} {span['duration_ms']:>9.2f} ms  {attributes}{error}")
+        for child in sorted(children.get(span["span_id"], []), key=lambda s: s["start_time"]):
+            walk(child, depth + 1)
+
+    for root in children.get(None, []):
+        lines.append(f"trace {root['trace_id']}")
+        walk(root, 1)
+    return "\n".join(lines)
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            spans = json.loads(self.rfile.read(length) or b"{}").get("spans", [])
+        except ValueError:
+            spans = []
+        self.server.store.add(spans)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_collector(host="127.0.0.1", port=0, output=None):
+    """تشغيل الـ collector في خيط خلفي وإرجاع (الخادم، رابط الإرسال)"""
+    server = ThreadingHTTPServer((host, port), _CollectorHandler)
+    server.daemon_threads = True
+    server.store = TraceStore(output)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/spans"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local trace collector")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--output", default="traces.jsonl")
+    args = parser.parse_args()
+    server, url = start_collector(port=args.port, output=args.output)
+    print(f"Trace collector listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
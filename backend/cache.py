@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from product_model import json_default
+
+
+def make_cache_key(query, country, platform):
+    """مفتاح موحد للكاش من (الاستعلام، السوق، المنصة)"""
+    normalized_query = " ".join(str(query or "").split()).lower()
+    normalized_country = str(country or "").strip().lower()
+    normalized_platform = str(platform or "").strip().lower()
+    return f"{normalized_query}|{normalized_country}|{normalized_platform}"
+
+
+class MemoryCacheBackend:
+    """تخزين داخل العملية مع إخلاء LRU"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        """يحفظ القيمة ويرجع عدد العناصر التي تم إخلاؤها"""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """تخزين مشترك في ملف SQLite بين عمال gunicorn"""
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+
+    def _connection(self):
+        # اتصال مستقل لكل خيط لأن اتصالات SQLite لا تُشارك بين الخيوط
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        """يحفظ القيمة ويرجع عدد العناصر التي تم إخلاؤها"""
+        conn = self._connection()
+        payload = json.dumps(value, ensure_ascii=False, default=json_default)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, time.time()),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            evicted = max(0, count - self.max_entries)
+            if evicted:
+                conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access ASC LIMIT ?)",
+                    (evicted,),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM results")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+# حالات المدخل حسب عمره
+FRESH = "fresh"
+STALE = "stale"  # بعد المدة الأساسية وقبل الحد الأقصى: يُقدَّم ويُحدَّث في الخلفية
+EXPIRED = "expired"  # بعد الحد الأقصى: يُقدَّم فقط إذا فشل التحليل الجديد
+
+
+class ResultCache:
+    """كاش نتائج التحليل مع مدة صلاحية لكل عنصر وعدادات الإصابة
+
+    كل مدخل صالح ttl_seconds، ثم يُقدَّم قديماً لمدة stale_seconds مع تحديثه في الخلفية،
+    ثم يبقى stale_if_error_seconds أخرى لتقديمه فقط عند فشل OpenRouter.
+    """
+
+    def __init__(self, backend, ttl_seconds=900, stale_seconds=0, stale_if_error_seconds=0):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.stale_if_error_seconds = stale_if_error_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.stale_if_error = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _entry(self, key):
+        """(القيمة، الحالة، نهاية الصلاحية الأساسية) أو None، بدون التأثير على العدادات"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        now = time.time()
+        if expires_at <= now:
+            self.backend.delete(key)
+            with self._lock:
+                self.expirations += 1
+            return None
+        # expires_at المخزن هو نهاية آخر نافذة (stale-if-error)
+        hard_until = expires_at - self.stale_if_error_seconds
+        fresh_until = hard_until - self.stale_seconds
+        state = FRESH if now < fresh_until else STALE if now < hard_until else EXPIRED
+        return value, state, fresh_until
+
+    def lookup(self, key):
+        """(القيمة، FRESH أو STALE) أو None، والمدخل بعد الحد الأقصى يعتبر غير موجود"""
+        # القيم المرجعة مشتركة بين الطلبات ويجب عدم تعديلها
+        entry = self._entry(key)
+        with self._lock:
+            if entry is None or entry[1] == EXPIRED:
+                self.misses += 1
+                return None
+            if entry[1] == STALE:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+        return entry[0], entry[1]
+
+    def peek(self, key):
+        """(القيمة، الحالة) أو None مثل lookup، بدون التأثير على عدادات الإصابة"""
+        entry = self._entry(key)
+        if entry is None or entry[1] == EXPIRED:
+            return None
+        return entry[0], entry[1]
+
+    def get(self, key):
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else None
+
+    def get_stale(self, key):
+        """آخر قيمة محفوظة حتى بعد الحد الأقصى (لتقديمها عند فشل التحليل الجديد)"""
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        with self._lock:
+            self.stale_if_error += 1
+        return entry[0]
+
+    def expires_in(self, key):
+        """الثواني المتبقية من الصلاحية الأساسية أو None، بدون التأثير على عدادات الإصابة"""
+        entry = self._entry(key)
+        if entry is None or entry[1] != FRESH:
+            return None
+        return entry[2] - time.time()
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.time() + ttl + self.stale_seconds + self.stale_if_error_seconds
+        evicted = self.backend.set(key, value, expires_at)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "entries": len(self.backend),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "stale_if_error": self.stale_if_error,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def create_cache(backend_name="memory", ttl_seconds=900, max_entries=1024, sqlite_path="analyzer_cache.sqlite3",
+                 stale_seconds=0, stale_if_error_seconds=0):
+    """إنشاء الكاش حسب نوع التخزين المطلوب"""
+    if backend_name == "sqlite":
+        backend = SQLiteCacheBackend(sqlite_path, max_entries=max_entries)
+    elif backend_name == "memory":
+        backend = MemoryCacheBackend(max_entries=max_entries)
+    else:
+        raise ValueError(f"نوع كاش غير مدعوم: {backend_name}")
+    return ResultCache(
+        backend, ttl_seconds=ttl_seconds, stale_seconds=stale_seconds, stale_if_error_seconds=stale_if_error_seconds)
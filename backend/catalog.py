@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from product_model import Product, json_default
+from scoring import competition_level
+from semantic_cache import normalization_stages
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_key TEXT NOT NULL UNIQUE,
+    country TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    name_ar TEXT NOT NULL,
+    name_en TEXT NOT NULL,
+    category TEXT NOT NULL,
+    terms TEXT NOT NULL,
+    margin REAL,
+    price REAL,
+    competition INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_catalog_margin ON catalog_products(country, platform, margin);
+CREATE INDEX IF NOT EXISTS idx_catalog_price ON catalog_products(country, platform, price);
+CREATE INDEX IF NOT EXISTS idx_catalog_competition ON catalog_products(country, platform, competition);
+CREATE INDEX IF NOT EXISTS idx_catalog_updated_at ON catalog_products(updated_at);
+"""
+
+# فهرس نصي خارجي المحتوى: النص نفسه في catalog_products والمشغلات تبقي الفهرس متزامناً معه
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+    terms, content='catalog_products', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS catalog_fts_insert AFTER INSERT ON catalog_products BEGIN
+    INSERT INTO catalog_fts(rowid, terms) VALUES (new.id, new.terms);
+END;
+CREATE TRIGGER IF NOT EXISTS catalog_fts_delete AFTER DELETE ON catalog_products BEGIN
+    INSERT INTO catalog_fts(catalog_fts, rowid, terms) VALUES ('delete', old.id, old.terms);
+END;
+"""
+
+
+def index_terms(text):
+    """كلمات الفهرسة بعد توحيد الحروف والتجذيع الخفيف (نفس قواعد الكاش الدلالي)، فتتطابق الصيغ المختلفة"""
+    return dict(normalization_stages(text))["stemming"]
+
+
+def _number(value):
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _numeric_columns(product):
+    """(هامش الربح، سعر البيع، مستوى المنافسة) للفلترة والترتيب، وNone للقيمة غير الصالحة"""
+    profit = product.get("profit_analysis") or {}
+    try:
+        competition = int(competition_level((product.get("market_analysis") or {}).get("competition")))
+    except (TypeError, ValueError):
+        competition = None
+    return _number(profit.get("profit_margin")), _number(profit.get("suggested_price")), competition
+
+
+class ProductCatalog:
+    """كتالوج دائم لكل المنتجات التي حللها الذكاء الاصطناعي، يجيب البحث المحلي قبل طلب تحليل جديد
+
+    البحث النصي بـ FTS5 على الأسماء العربية والإنجليزية والفئة، مع فهارس رقمية للهامش والسعر والمنافسة.
+    """
+
+    def __init__(self, path, min_results=5, max_results=10, max_age=7 * 86400, max_products=100000,
+                 mmap_size=256 * 1024 * 1024):
+        self.path = path
+        self.min_results = min_results
+        self.max_results = max_results
+        self.max_age = max_age
+        self.max_products = max_products
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.added = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            # نسخة SQLite بدون FTS5: البحث بـ LIKE على عمود terms (أبطأ لكن بنفس النتائج تقريباً)
+            logger.warning("⚠️ FTS5 غير متوفر، البحث في الكتالوج بـ LIKE: %s", e)
+            self.fts = False
+
+    @property
+    def engine(self):
+        return "fts5" if self.fts else "like"
+
+    def _connection(self):
+        # اتصال مستقل لكل خيط لأن اتصالات SQLite لا تُشارك بين الخيوط
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # قراءة صفحات القاعدة من الذاكرة المشتركة بدلاً من نسخها لكل اتصال
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    def add(self, products, country, platform):
+        """إضافة نتيجة تحليل جديدة للكتالوج (تحديث المنتج إذا كان موجوداً)، ويرجع عدد المنتجات المضافة"""
+        now = time.time()
+        rows = []
+        for product in products:
+            product = Product.of(product)
+            name_ar = str(product.get("name_ar") or "")
+            name_en = str(product.get("name_en") or "")
+            category = str(product.get("category") or "")
+            name_terms = index_terms(name_en or name_ar)
+            if not name_terms:
+                continue
+            margin, price, competition = _numeric_columns(product)
+            rows.append((
+                f"{country}|{platform}|{name_terms}", country, platform, name_ar, name_en, category,
+                index_terms(f"{name_ar} {name_en} {category}"), margin, price, competition,
+                json.dumps(product, ensure_ascii=False, default=json_default), now,
+            ))
+        if not rows:
+            return 0
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # حذف ثم إدراج (بدلاً من UPDATE) حتى يأخذ المنتج المحدث رقماً جديداً ويبقى الحذف بالرقم صحيحاً
+                conn.executemany("DELETE FROM catalog_products WHERE product_key = ?", [(row[0],) for row in rows])
+                conn.executemany(
+                    "INSERT INTO catalog_products (product_key, country, platform, name_ar, name_en, category, "
+                    "terms, margin, price, competition, data, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                conn.execute("DELETE FROM catalog_products WHERE id <= ?", (last_id - self.max_products,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # فشل الفهرسة لا يفشل التحليل نفسه
+            logger.error("❌ خطأ في تحديث كتالوج المنتجات: %s", e)
+            return 0
+        with self._lock:
+            self.added += len(rows)
+        return len(rows)
+
+    def search(self, query, country, platform="all", limit=10, min_margin=None, max_price=None,
+               max_competition=None, max_age=None):
+        """منتجات الكتالوج المطابقة لكل كلمات الاستعلام مع الفلاتر الرقمية، الأكثر صلة ثم الأعلى هامشاً"""
+        terms = index_terms(query).split()
+        conditions = ["p.country = ?"]
+        params = [country]
+        if platform and platform != "all":
+            conditions.append("p.platform = ?")
+            params.append(platform)
+        for condition, value in (("p.margin >= ?", min_margin), ("p.price <= ?", max_price),
+                                 ("p.competition <= ?", max_competition)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if max_age is not None:
+            conditions.append("p.updated_at >= ?")
+            params.append(time.time() - max_age)
+
+        if terms and self.fts:
+            # كل كلمة مطلوبة مع مطابقة البادئة، والكلمات بعد التوحيد حروف وأرقام فقط فلا تحتاج تهريباً
+            sql = ("SELECT p.name_ar, p.name_en, p.data FROM catalog_fts JOIN catalog_products p "
+                   "ON p.id = catalog_fts.rowid WHERE catalog_fts MATCH ? AND " + " AND ".join(conditions) +
+                   " ORDER BY bm25(catalog_fts), p.margin DESC LIMIT ?")
+            params.insert(0, " ".join(f'"{term}"*' for term in terms))
+        else:
+            conditions += ["p.terms LIKE ?"] * len(terms)
+            params += [f"%{term}%" for term in terms]
+            sql = ("SELECT p.name_ar, p.name_en, p.data FROM catalog_products p WHERE " + " AND ".join(conditions) +
+                   " ORDER BY p.margin DESC LIMIT ?")
+        # نفس المنتج قد يكون مفهرساً لأكثر من منصة، فنجلب أكثر من المطلوب ثم نزيل المكرر
+        params.append(limit * 3 if not platform or platform == "all" else limit)
+        rows = self._connection().execute(sql, params).fetchall()
+
+        products = []
+        seen = set()
+        for name_ar, name_en, data in rows:
+            key = " ".join((name_en or name_ar).lower().split())
+            if key in seen:
+                continue
+            seen.add(key)
+            products.append(Product.from_mapping(json.loads(data)))
+            if len(products) >= limit:
+                break
+        return products
+
+    def lookup(self, query, country, platform):
+        """نتيجة البحث من الكتالوج إن غطت الاستعلام بعدد كافٍ من المنتجات الحديثة، وإلا None (فجوة تغطية)"""
+        try:
+            products = self.search(query, country, platform, limit=self.max_results, max_age=self.max_age)
+        except sqlite3.Error as e:
+            logger.error("❌ خطأ في البحث في كتالوج المنتجات: %s", e)
+            products = []
+        covered = len(products) >= self.min_results
+        with self._lock:
+            self.lookups += 1
+            self.hits += covered
+        return products if covered else None
+
+    def clear(self):
+        self._connection().execute("DELETE FROM catalog_products")
+
+    def stats(self):
+        count = self._connection().execute("SELECT COUNT(*) FROM catalog_products").fetchone()[0]
+        with self._lock:
+            return {
+                "engine": self.engine,
+                "products": count,
+                "added": self.added,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "gaps": self.lookups - self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            }
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+try:
+    import brotli
+except ImportError:  # ضغط brotli اختياري
+    brotli = None
+
+# الترميزات المدعومة بترتيب الأفضلية
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding, available=SUPPORTED_ENCODINGS):
+    """أفضل ترميز يقبله العميل من الترميزات المتاحة، أو None بدون ضغط"""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.partition(";")
+        # gzip;q=0 تعني أن العميل يرفض هذا الترميز صراحة
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    for encoding in available:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(body, encoding, level=None):
+    """ضغط المحتوى بالترميز المطلوب (مستوى افتراضي سريع للردود الديناميكية)"""
+    if encoding == "br":
+        return brotli.compress(body, quality=4 if level is None else level)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6 if level is None else level)
+    return body
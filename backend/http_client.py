@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # المحرك غير المتزامن اختياري
+    httpx = None
+
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# رموز الحالة التي تستحق إعادة المحاولة
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class OpenRouterError(Exception):
+    """خطأ في الاتصال بـ OpenRouter أو رد غير ناجح"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(OpenRouterError):
+    """القاطع مفتوح ولن يتم إرسال الطلب"""
+
+
+class RequestCancelledError(OpenRouterError):
+    """ألغى المستدعي الطلب قبل محاولته التالية (مثل فوز طلب آخر في hedging)"""
+
+
+class CircuitBreaker:
+    """قاطع دائرة: يوقف الطلبات مؤقتاً بعد تكرار الفشل"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.total_failures = 0
+        self.short_circuited = 0
+
+    def allow_request(self):
+        """هل يسمح القاطع بإرسال طلب الآن؟"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self.short_circuited += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN:
+                # طلب تجريبي واحد فقط لفحص تعافي الخدمة
+                if self._trial_in_flight:
+                    self.short_circuited += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.total_failures += 1
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """تحرير الطلب التجريبي المحجوز إذا انتهى بدون نجاح أو فشل (إلغاء أو تخطٍ)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            state = self._state
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "total_failures": self.total_failures,
+                "short_circuited": self.short_circuited,
+                "retry_in_seconds": round(retry_in, 1),
+            }
+
+
+class _RetryingClient:
+    """منطق إعادة المحاولة المشترك بين العميل المتزامن وغير المتزامن"""
+
+    def __init__(self, url, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max, breaker):
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+    def _ensure_allowed(self):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("OpenRouter circuit breaker is open")
+
+    @contextmanager
+    def _breaker_call(self):
+        """طلب واحد بكل محاولاته: القاطع يُفحص مرة قبله ويُسجل له نجاح أو فشل واحد"""
+        self._ensure_allowed()
+        try:
+            yield
+        except RequestCancelledError:
+            # لم تُعرف نتيجة الطلب، فلا يُسجل نجاح أو فشل
+            self.breaker.release_trial()
+            raise
+        except OpenRouterError:
+            raise
+        except BaseException:
+            # خروج بدون نتيجة مسجلة (إلغاء أو خطأ غير متوقع) لا يترك الطلب التجريبي محجوزاً
+            self.breaker.release_trial()
+            raise
+
+    def _retries_exhausted(self, error):
+        self.breaker.record_failure()
+        return error
+
+    @staticmethod
+    def _check_cancelled(cancel):
+        if cancel is not None and cancel.is_set():
+            raise RequestCancelledError("request cancelled")
+
+    @staticmethod
+    def _pause(delay, cancel):
+        """انتظار ما قبل إعادة المحاولة، وينتهي فوراً إذا أُلغي الطلب أثناءه"""
+        if cancel is None:
+            time.sleep(delay)
+        elif cancel.wait(delay):
+            raise RequestCancelledError("request cancelled")
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """مدة الانتظار قبل المحاولة التالية (full jitter)"""
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _connection_failed(self, error):
+        return OpenRouterError(f"connection error: {error}")
+
+    def _response_failed(self, response):
+        """يرجع (الخطأ، Retry-After) للأخطاء القابلة لإعادة المحاولة ويرفع غيرها"""
+        error = OpenRouterError(
+            f"{response.status_code} - {response.text[:200]}",
+            status_code=response.status_code,
+        )
+        if response.status_code not in RETRYABLE_STATUS_CODES:
+            # أخطاء الطلب نفسه (مثل 400/401) لا تعني أن الخدمة معطلة
+            self.breaker.record_success()
+            raise error
+        value = response.headers.get("Retry-After")
+        try:
+            retry_after = float(value) if value is not None else None
+        except ValueError:
+            retry_after = None
+        return error, retry_after
+
+
+class OpenRouterClient(_RetryingClient):
+    """عميل HTTP مشترك لـ OpenRouter مع تجميع الاتصالات وإعادة المحاولة"""
+
+    def __init__(self, url=OPENROUTER_CHAT_URL, pool_size=10, connect_timeout=5, read_timeout=30,
+                 max_retries=2, backoff_base=0.5, backoff_max=4.0, breaker=None):
+        super().__init__(url, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max, breaker)
+
+        # جلسة واحدة بإتصالات keep-alive يعاد استخدامها بين الطلبات
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def chat_completion(self, payload, headers, cancel=None):
+        """إرسال طلب chat/completions وإرجاع JSON الرد
+
+        cancel (threading.Event اختياري) يوقف إعادة المحاولة عندما لا يعود الرد مطلوباً، فيرفع
+        RequestCancelledError قبل المحاولة التالية بدلاً من إرسالها (الطلب الجاري نفسه لا يمكن إيقافه).
+        """
+        last_error = None
+        with self._breaker_call():
+            for attempt in range(self.max_retries + 1):
+                self._check_cancelled(cancel)
+                retry_after = None
+                try:
+                    response = self.session.post(
+                        self.url,
+                        headers=headers,
+                        json=payload,
+                        timeout=(self.connect_timeout, self.read_timeout),
+                    )
+                except requests.RequestException as e:
+                    last_error = self._connection_failed(e)
+                else:
+                    if response.status_code == 200:
+                        self.breaker.record_success()
+                        return response.json()
+                    last_error, retry_after = self._response_failed(response)
+
+                if attempt < self.max_retries:
+                    self._pause(self._backoff_delay(attempt, retry_after), cancel)
+
+            raise self._retries_exhausted(last_error)
+
+    def stream_chat_completion(self, payload, headers):
+        """طلب chat/completions بوضع stream وإرجاع مولد لأجزاء النص فور وصولها"""
+        payload = dict(payload, stream=True)
+        last_error = None
+        with self._breaker_call():
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    response = self.session.post(
+                        self.url,
+                        headers=headers,
+                        json=payload,
+                        timeout=(self.connect_timeout, self.read_timeout),
+                        stream=True,
+                    )
+                except requests.RequestException as e:
+                    last_error = self._connection_failed(e)
+                else:
+                    if response.status_code == 200:
+                        # إعادة المحاولة ممكنة فقط قبل وصول أول جزء من الرد
+                        self.breaker.record_success()
+                        return self._iter_sse_deltas(response)
+                    try:
+                        last_error, retry_after = self._response_failed(response)
+                    finally:
+                        response.close()
+
+                if attempt < self.max_retries:
+                    time.sleep(self._backoff_delay(attempt, retry_after))
+
+            raise self._retries_exhausted(last_error)
+
+    @staticmethod
+    def _iter_sse_deltas(response):
+        """قراءة أحداث SSE من OpenRouter واستخراج delta.content"""
+        try:
+            for line in response.iter_lines(decode_unicode=False):
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    # نكمل القراءة حتى نهاية الرد ليعود الاتصال إلى المجمع
+                    continue
+                try:
+                    chunk = json.loads(data)
+                    delta = chunk["choices"][0].get("delta") or {}
+                except (ValueError, KeyError, IndexError):
+                    continue
+                content = delta.get("content")
+                if content:
+                    yield content
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOpenRouterClient(_RetryingClient):
+    """النسخة غير المتزامنة من العميل مبنية على httpx.AsyncClient"""
+
+    def __init__(self, url=OPENROUTER_CHAT_URL, pool_size=100, connect_timeout=5, read_timeout=30,
+                 max_retries=2, backoff_base=0.5, backoff_max=4.0, breaker=None):
+        if httpx is None:
+            raise RuntimeError("httpx is required for the async analysis engine")
+        super().__init__(url, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max, breaker)
+        self.session = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def chat_completion(self, payload, headers):
+        """إرسال طلب chat/completions وإرجاع JSON الرد"""
+        last_error = None
+        with self._breaker_call():
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    response = await self.session.post(self.url, headers=headers, json=payload)
+                except httpx.HTTPError as e:
+                    last_error = self._connection_failed(e)
+                else:
+                    if response.status_code == 200:
+                        self.breaker.record_success()
+                        return response.json()
+                    last_error, retry_after = self._response_failed(response)
+
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+
+            raise self._retries_exhausted(last_error)
+
+    async def aclose(self):
+        await self.session.aclose()
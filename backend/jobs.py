@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from product_model import json_default
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """تخزين مهام التحليل في SQLite حتى تبقى بعد إعادة تشغيل العامل"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                query TEXT NOT NULL,
+                country TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+
+    def _connection(self):
+        # اتصال مستقل لكل خيط لأن اتصالات SQLite لا تُشارك بين الخيوط
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, query, country, platform):
+        job_id = uuid.uuid4().hex
+        self._connection().execute(
+            "INSERT INTO jobs (id, status, query, country, platform, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, self.QUEUED, query, country, platform, time.time()),
+        )
+        return job_id
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def claim_next(self):
+        """حجز أقدم مهمة في الانتظار بشكل ذري بين العمال والعمليات"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (self.QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            started_at = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (self.RUNNING, started_at, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job.update(status=self.RUNNING, started_at=started_at)
+        return job
+
+    def complete(self, job_id, result):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+            (self.DONE, json.dumps(result, ensure_ascii=False, default=json_default), time.time(), job_id),
+        )
+
+    def fail(self, job_id, error):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (self.FAILED, error, time.time(), job_id),
+        )
+
+    def requeue_stale(self, stale_after):
+        """إعادة المهام العالقة في حالة running (عامل توقف أثناء التنفيذ) إلى الانتظار"""
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+            (self.QUEUED, self.RUNNING, time.time() - stale_after),
+        )
+        return cursor.rowcount
+
+    def purge_finished(self, older_than):
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (self.DONE, self.FAILED, time.time() - older_than),
+        )
+        return cursor.rowcount
+
+    def counts(self):
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {self.QUEUED: 0, self.RUNNING: 0, self.DONE: 0, self.FAILED: 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def oldest_queued_age(self):
+        row = self._connection().execute(
+            "SELECT MIN(created_at) FROM jobs WHERE status = ?", (self.QUEUED,)
+        ).fetchone()
+        return time.time() - row[0] if row[0] is not None else 0.0
+
+
+class JobQueue:
+    """مجمع عمال يسحب مهام التحليل من المخزن وينفذها في الخلفية"""
+
+    def __init__(self, store, analyzer, workers=2, poll_interval=0.5, stale_after=600, retention=86400,
+                 observer=None):
+        self.store = store
+        self.analyzer = analyzer
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retention = retention
+        # observer(outcome, wait_seconds) لكل مهمة منتهية (لمقاييس Prometheus)
+        self.observer = observer
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def start(self):
+        """تشغيل العمال مرة واحدة في هذه العملية (آمن للاستدعاء من عدة خيوط)"""
+        if self._threads or self.workers <= 0:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            try:
+                requeued = self.store.requeue_stale(self.stale_after)
+            except sqlite3.Error as e:
+                logger.error("❌ خطأ في إعادة المهام العالقة: %s", e)
+                requeued = 0
+            if requeued:
+                logger.warning("♻️ إعادة %s مهمة عالقة إلى قائمة الانتظار", requeued)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, query, country, platform):
+        job_id = self.store.create(query, country, platform)
+        self._wakeup.set()
+        return job_id
+
+    def _worker_loop(self):
+        last_maintenance = 0.0
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next()
+            except sqlite3.Error as e:
+                logger.error("❌ خطأ في قراءة قائمة المهام: %s", e)
+                job = None
+
+            if job is None:
+                # لا توجد مهام: صيانة دورية ثم انتظار مهمة جديدة
+                if time.time() - last_maintenance > 60:
+                    last_maintenance = time.time()
+                    self._maintenance()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._execute(job)
+            except Exception as e:
+                # خطأ غير متوقع لا يوقف العامل، والمهمة تعود للطابور بعد stale_after
+                logger.error("❌ خطأ غير متوقع في عامل المهام أثناء المهمة %s: %s", job["id"], e)
+
+    def _maintenance(self):
+        try:
+            self.store.requeue_stale(self.stale_after)
+            self.store.purge_finished(self.retention)
+        except sqlite3.Error as e:
+            logger.error("❌ خطأ في صيانة قائمة المهام: %s", e)
+
+    def _execute(self, job):
+        wait_seconds = job["started_at"] - job["created_at"]
+        with self._lock:
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        error = None
+        try:
+            products = self.analyzer.search_products(job["query"], job["country"], job["platform"])
+        except Exception as e:
+            logger.error("❌ فشل تنفيذ المهمة %s: %s", job['id'], e)
+            error = f"حدث خطأ في النظام: {str(e)}"
+
+        try:
+            if error is None:
+                self.store.complete(job["id"], {"products_count": len(products), "products": products})
+            else:
+                self.store.fail(job["id"], error)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            # المهمة تبقى running وتعود للطابور بعد stale_after
+            logger.error("❌ تعذر حفظ نتيجة المهمة %s: %s", job['id'], e)
+            return
+        with self._lock:
+            self.processed += 1
+            if error is not None:
+                self.failed += 1
+        if self.observer is not None:
+            self.observer(JobStore.DONE if error is None else JobStore.FAILED, wait_seconds)
+
+    def stats(self):
+        counts = self.store.counts()
+        with self._lock:
+            processed = self.processed
+            return {
+                "workers": len(self._threads),
+                "queue_depth": counts[JobStore.QUEUED],
+                "running": counts[JobStore.RUNNING],
+                "done": counts[JobStore.DONE],
+                "failed": counts[JobStore.FAILED],
+                "oldest_queued_seconds": round(self.store.oldest_queued_age(), 3),
+                "processed": processed,
+                "avg_wait_seconds": round(self.total_wait_seconds / processed, 3) if processed else 0.0,
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+def serialize_job(job):
+    """تحويل سجل المهمة إلى رد API"""
+    def iso(timestamp):
+        return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+    payload = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "query": job["query"],
+        "country": job["country"],
+        "platform": job["platform"],
+        "created_at": iso(job["created_at"]),
+        "started_at": iso(job["started_at"]),
+        "finished_at": iso(job["finished_at"]),
+    }
+    if job["status"] == JobStore.DONE and job["result"]:
+        payload.update(json.loads(job["result"]))
+    if job["status"] == JobStore.FAILED:
+        payload["error"] = job["error"]
+    return payload
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"
+
+# خصائص LogRecord القياسية، وما عداها (extra=...) يضاف كحقول في سطر JSON
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "trace_id"}
+
+
+class JSONFormatter(logging.Formatter):
+    """سطر JSON لكل رسالة: الوقت والمستوى والمصدر ورقم التتبع والحقول الإضافية"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", None),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """تمرير نسبة rate فقط من الرسائل (لسجلات المحتوى الكبيرة مثل ردود الذكاء الاصطناعي)"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """يضع السجل في الطابور كما هو، والتنسيق والكتابة يتمان في خيط المستمع وليس في خيط الطلب"""
+
+    def prepare(self, record):
+        return record
+
+
+def parse_module_levels(value):
+    """LOG_LEVELS بصيغة http_client=WARNING,payloads=DEBUG"""
+    levels = {}
+    for item in (value or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level="INFO", fmt="text", module_levels=None, use_queue=True, filters=(), stream=None):
+    """ضبط السجل الجذري: نص أو JSON، مع طابور ومستويات لكل وحدة
+
+    الطابور ينقل انتظار الكتابة (stderr بطيء أو pipe ممتلئ) من خيط الطلب إلى خيط المستمع، لكنه لا يقلل
+    تكلفة التنسيق على المعالج لأن المستمع يعمل في نفس العملية (GIL)، ومع مخرج أبطأ من السجلات يتأخر المستمع.
+    filters تُطبق في خيط الطلب قبل وضع السجل في الطابور (مثل رقم التتبع من contextvars).
+    يرجع QueueListener أو None.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(level.upper())
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = None
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        front = _DeferredQueueHandler(log_queue)
+        listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+
+        @atexit.register
+        def stop_listener():
+            # تفريغ ما تبقى في الطابور قبل خروج العملية
+            if listener._thread is not None:
+                listener.stop()
+
+        if hasattr(os, "register_at_fork"):
+            # خيط المستمع لا ينتقل إلى عمليات العمال بعد fork، فنبدأ مستمعاً جديداً بطابور جديد
+            def restart_listener():
+                fresh_queue = queue.SimpleQueue()
+                front.queue = listener.queue = fresh_queue
+                listener._thread = None
+                listener.start()
+
+            os.register_at_fork(after_in_child=restart_listener)
+    else:
+        front = handler
+
+    for log_filter in filters:
+        front.addFilter(log_filter)
+    root.addHandler(front)
+    return listener
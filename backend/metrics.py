@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # غير متوفر على ويندوز، والقفل بين العمليات يصبح بدون أثر
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# حدود الهيستوجرام بالثواني: من قراءة الكاش (أجزاء من الملي ثانية) حتى استدعاء OpenRouter (عشرات الثواني)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_FILE_PREFIX = "metrics-"
+_ARCHIVE_FILE = "metrics-archive.json"
+
+
+class Counter:
+    """عداد تراكمي بتسميات (labels)"""
+
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            values = self.registry.values[self.name]
+            values[key] = values.get(key, 0) + amount
+            self.registry.dirty = True
+
+
+class Histogram(Counter):
+    """توزيع زمني: عدد الملاحظات في كل حد + المجموع + العدد"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            values = self.registry.values[self.name]
+            state = values.get(key)
+            if state is None:
+                # [عدد كل حد..., +Inf, المجموع]
+                state = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+            self.registry.dirty = True
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Gauge:
+    """قيمة لحظية تُقرأ بـ collect() عند عرض /metrics
+
+    للقيم الموجودة في مصدر مشترك بين العمليات (مثل قاعدة SQLite)، فلا تُكتب في ملفات العمليات ولا تُجمع بينها.
+    collect يرجع رقماً، أو قاموساً من قيم التسميات (tuple أو نص لتسمية واحدة) إلى الأرقام.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, documentation, labelnames, collect):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            # تعذر قراءة المصدر لا يمنع عرض بقية المقاييس
+            logger.warning("⚠️ تعذر قراءة المقياس %s: %s", self.name, e)
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [[[str(part) for part in (key if isinstance(key, tuple) else (key,))], value]
+                for key, value in values.items()]
+
+
+class MetricsRegistry:
+    """سجل مقاييس بصيغة Prometheus يعمل مع عدة عمليات (عمال gunicorn)
+
+    كل عملية تكتب لقطة من قيمها في ملف خاص بها داخل directory، و /metrics يجمع كل الملفات.
+    بدون directory تبقى المقاييس داخل العملية الحالية فقط.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.values = {}
+        self.dirty = False
+        self.pid = os.getpid()
+        self._flusher = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._archive_dead_processes()
+            # مع preload في gunicorn يُنشأ السجل في العملية الأم، وكل عامل يبدأ بقيم وملف خاص به
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames, collect))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"المقياس مسجل مسبقاً: {metric.name}")
+        self.metrics[metric.name] = metric
+        self.values[metric.name] = {}
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value] for key, value in values.items()]
+                for name, values in self.values.items()
+            }
+
+    # ---- التخزين المشترك بين العمليات ----
+
+    def _process_path(self, pid=None):
+        return os.path.join(self.directory, f"{_FILE_PREFIX}{pid or self.pid}.json")
+
+    @contextmanager
+    def _directory_lock(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        # الكتابة في ملف مؤقت ثم استبداله حتى لا يقرأ /metrics ملفاً نصف مكتوب
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def flush(self):
+        """كتابة قيم هذه العملية في ملفها"""
+        if not self.directory:
+            return
+        with self.lock:
+            self.dirty = False
+        self._write_atomic(self._process_path(), self.snapshot())
+
+    def _reset_after_fork(self):
+        # القفل قد يكون محجوزاً في خيط آخر لحظة fork، لذلك ننشئ قفلاً جديداً
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.values = {name: {} for name in self.metrics}
+        self.dirty = False
+        started = self._flusher is not None
+        self._flusher = None
+        if started:
+            self.start()
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _archive_dead_processes(self):
+        """دمج ملفات العمليات المنتهية في ملف أرشيف حتى لا تنقص العدادات عند استبدال العمال"""
+        with self._directory_lock(exclusive=True):
+            archive_path = os.path.join(self.directory, _ARCHIVE_FILE)
+            archive = self._read(archive_path)
+            dead = []
+            for name in os.listdir(self.directory):
+                if not name.startswith(_FILE_PREFIX) or not name.endswith(".json") or name == _ARCHIVE_FILE:
+                    continue
+                try:
+                    pid = int(name[len(_FILE_PREFIX):-len(".json")])
+                except ValueError:
+                    continue
+                # ملف بنفس رقم هذه العملية يعود لعملية سابقة انتهت وأُعيد استخدام رقمها
+                if pid != self.pid and self._pid_alive(pid):
+                    continue
+                path = os.path.join(self.directory, name)
+                archive = self._merge([archive, self._read(path)])
+                dead.append(path)
+            if dead:
+                self._write_atomic(archive_path, archive)
+                for path in dead:
+                    os.remove(path)
+
+    def start(self):
+        """خيط خلفي يكتب القيم كل flush_interval ثانية"""
+        if not self.directory or self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                if self.dirty:
+                    self.flush()
+            except OSError as e:
+                logger.warning("⚠️ فشل حفظ المقاييس: %s", e)
+
+    @staticmethod
+    def _merge(snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                target = merged.setdefault(name, {})
+                for key, value in samples:
+                    key = tuple(key)
+                    current = target.get(key)
+                    if current is None:
+                        target[key] = list(value) if isinstance(value, list) else value
+                    elif isinstance(value, list):
+                        target[key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        target[key] = current + value
+        return {name: [[list(key), value] for key, value in samples.items()] for name, samples in merged.items()}
+
+    def collect(self):
+        """قيم كل العمليات مجمعة"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        with self._directory_lock(exclusive=False):
+            snapshots = [
+                self._read(os.path.join(self.directory, name))
+                for name in os.listdir(self.directory)
+                if name.startswith(_FILE_PREFIX) and name.endswith(".json")
+            ]
+        return self._merge(snapshots)
+
+    # ---- صيغة Prometheus النصية ----
+
+    @staticmethod
+    def _format_labels(names, values, extra=None):
+        pairs = list(zip(names, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float):
+            if math.isinf(value):
+                return "+Inf"
+            return repr(value)
+        return str(value)
+
+    def render(self):
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            samples = metric.samples() if metric.kind == "gauge" else collected.get(name, [])
+            for key, value in sorted(samples, key=lambda sample: sample[0]):
+                labels = metric.labelnames
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{self._format_labels(labels, key)} {self._format_value(value)}")
+                    continue
+                # الحدود تراكمية في صيغة Prometheus
+                for bound, count in zip(metric.buckets + (math.inf,), value[:-1]):
+                    bucket_labels = self._format_labels(labels, key, ("le", self._format_value(float(bound))))
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(f"{name}_sum{self._format_labels(labels, key)} {self._format_value(value[-1])}")
+                lines.append(f"{name}_count{self._format_labels(labels, key)} {value[-2]}")
+        return "\n".join(lines) + "\n"
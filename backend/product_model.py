@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import dataclasses
+import sys
+from collections.abc import Mapping
+from operator import attrgetter
+
+# النصوص الأطول من هذا (الوصف ونص الإعلان) نادراً ما تتكرر بين المنتجات فلا فائدة من توحيدها
+INTERN_MAX_LENGTH = 256
+# قيمة source للمنتجات الناتجة عن تحليل الذكاء الاصطناعي (البيانات التجريبية تحمل اسم المنصة)
+AI_SOURCE = "ai-analysis"
+
+
+def _compact(value):
+    """توحيد النصوص المتكررة وتحويل القوائم إلى tuple (أصغر وللقراءة فقط)"""
+    if type(value) is str:
+        return sys.intern(value) if len(value) <= INTERN_MAX_LENGTH else value
+    if type(value) is list:
+        return tuple(_compact(item) for item in value)
+    # tuple والسجلات والقواميس المجمدة مشتركة أصلاً (قوالب البيانات التجريبية) فتبقى كما هي
+    return value
+
+
+class Record(Mapping):
+    """سجل للقراءة فقط بحقول ثابتة في __slots__ بدل قاموس لكل كائن، ويُقرأ كقاموس عادي
+
+    السجلات dataclasses فيسلسلها orjson مباشرة بنفس مفاتيح وترتيب القاموس الأصلي،
+    والحقول الإضافية (مثل platforms وstale) تُضاف على نسخة dict(product, ...) كما كانت.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+    SECTIONS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._INDEX = {name: position for position, name in enumerate(cls.FIELDS)}
+        # قراءة كل الحقول دفعة واحدة كـ tuple (أسرع من getattr لكل حقل)
+        cls._values = attrgetter(*cls.FIELDS)
+
+    @classmethod
+    def from_mapping(cls, values):
+        """سجل من قاموس: الأقسام المتداخلة تصبح سجلات والحقول الناقصة None"""
+        # المقارنة بدون بناء مجموعة جديدة، والفرق يُحسب فقط عند الخطأ
+        if not values.keys() <= cls._INDEX.keys():
+            unknown = values.keys() - cls._INDEX.keys()
+            raise ValueError(f"حقول غير معروفة في {cls.__name__}: {', '.join(sorted(map(str, unknown)))}")
+        sections = cls.SECTIONS
+        converted = []
+        for name in cls.FIELDS:
+            value = values.get(name)
+            if name in sections:
+                value = sections[name].of(value)
+            elif type(value) is str:
+                # المسار الأكثر تكراراً بدون استدعاء _compact
+                if len(value) <= INTERN_MAX_LENGTH:
+                    value = sys.intern(value)
+            elif type(value) is list:
+                value = _compact(value)
+            converted.append(value)
+        return cls(*converted)
+
+    @classmethod
+    def of(cls, value):
+        """السجل كما هو إن كان من نفس النوع، وإلا سجل جديد من القاموس"""
+        # فحص النوع المباشر أولاً لأن isinstance مع فئات Mapping المجردة بطيء
+        if type(value) is cls or not isinstance(value, (dict, Mapping)):
+            return value
+        return cls.from_mapping(value)
+
+    def replace(self, **changes):
+        """نسخة بحقول معدلة، والحقول غير المعدلة مشتركة مع الأصل"""
+        values = list(self._values(self))
+        index = self._INDEX
+        sections = self.SECTIONS
+        for key, value in changes.items():
+            position = index.get(key)
+            if position is None:
+                raise ValueError(f"حقل غير معروف في {type(self).__name__}: {key}")
+            values[position] = sections[key].of(value) if key in sections else _compact(value)
+        return type(self)(*values)
+
+    def filler(self, *names):
+        """دالة تبني نسخاً من السجل بقيم جديدة للحقول names بنفس ترتيبها، للمسارات التي تتكرر في كل طلب
+
+        أسرع من replace لأن مواضع الحقول تُحسب مرة واحدة، والقيم تُخزن كما هي بدون تحويل الأقسام
+        أو توحيد النصوص (على المستدعي تمرير سجلات وtuple جاهزة). بقية الحقول مشتركة مع السجل.
+        """
+        cls = type(self)
+        unknown = set(names) - cls._INDEX.keys()
+        if unknown:
+            raise ValueError(f"حقول غير معروفة في {cls.__name__}: {', '.join(sorted(unknown))}")
+        base = self._values(self)
+        positions = tuple(cls._INDEX[name] for name in names)
+
+        def fill(*values):
+            row = list(base)
+            for position, value in zip(positions, values):
+                row[position] = value
+            return cls(*row)
+
+        return fill
+
+    def __getitem__(self, key):
+        if key in self._INDEX:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._INDEX else default
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def to_dict(self):
+        """قاموس سطحي بنفس ترتيب المفاتيح، والأقسام المتداخلة تبقى سجلات"""
+        return dict(zip(self.FIELDS, self._values(self)))
+
+    def to_plain(self):
+        """قاموس بأقسام قواميس أيضاً، للكود الذي ينسخ الأقسام بـ dict() (أبطأ بكثير على السجلات)"""
+        sections = self.SECTIONS
+        return {name: value.to_plain() if name in sections and value is not None else value
+                for name, value in zip(self.FIELDS, self._values(self))}
+
+
+def _record(name, fields, sections=None, doc=None):
+    # بدون تعليقات أنواع: make_dataclass يقبل أسماء الحقول فقط
+    return dataclasses.make_dataclass(
+        name, fields, bases=(Record,), eq=False, slots=True,
+        namespace={"FIELDS": fields, "SECTIONS": sections or {}, "__doc__": doc, "__module__": __name__},
+    )
+
+
+ProfitAnalysis = _record("ProfitAnalysis", (
+    "purchase_price", "suggested_price", "profit_margin", "total_costs", "net_profit", "currency",
+))
+Marketing = _record("Marketing", ("platform", "ad_copy", "video_idea", "hashtags", "ad_budget"))
+MarketAnalysis = _record("MarketAnalysis", ("competition", "demand", "unique_point", "growth_prediction"))
+Product = _record(
+    "Product",
+    (
+        "id", "name_ar", "name_en", "image", "short_description", "category", "difficulty",
+        "why_win", "target", "age_range", "gender", "interests", "problem",
+        "profit_analysis", "suppliers", "marketing", "market_analysis", "tips",
+        "timestamp", "source", "country", "analyzed_by",
+    ),
+    sections={"profit_analysis": ProfitAnalysis, "marketing": Marketing, "market_analysis": MarketAnalysis},
+    doc="منتج واحد بنفس مفاتيح وترتيب JSON الذي يعرضه createProductCard في الواجهة",
+)
+
+
+def json_default(obj):
+    """دالة default لـ json.dumps: السجلات تُسلسل كقواميس (orjson يسلسلها مباشرة)"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
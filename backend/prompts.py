@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import re
+from functools import lru_cache
+
+from ai_parser import PRODUCT_SCHEMA_FIELDS, REQUIRED_SCHEMA_FIELDS, schema_prompt
+
+try:
+    import tiktoken
+except ImportError:  # العد الدقيق اختياري، والبديل تقدير من عدد الحروف
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# ترميز نماذج gpt-3.5/gpt-4 (النماذج الأخرى على OpenRouter قريبة منه بما يكفي للتقدير)
+TOKENIZER_ENCODING = "cl100k_base"
+# متوسط الحروف لكل token عند التقدير بدون tiktoken: العربية تتجزأ أكثر بكثير من الإنجليزية
+ARABIC_CHARS_PER_TOKEN = 2.0
+OTHER_CHARS_PER_TOKEN = 3.5
+# حمل صيغة المحادثة لكل رسالة وللرد كله
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+_ARABIC_RE = re.compile(r"[؀-ۿݐ-ݿﭐ-﷿ﹰ-﻿]")
+
+# tokens المتوقعة لكل حقل في منتج واحد من رد النموذج (مع المفتاح وعلامات JSON)
+OUTPUT_TOKENS = {
+    "name_ar": 16,
+    "name_en": 12,
+    "short_description": 40,
+    "category": 10,
+    "why_win": 30,
+    "target": 16,
+    "age_range": 10,
+    "gender": 8,
+    "interests": 24,
+    "problem": 40,
+    "difficulty": 6,
+    "profit_analysis": 30,
+    "marketing": 110,
+    "market_analysis": 60,
+    "tips": 40,
+}
+# الأقواس والفواصل بين المنتجات، و {"products": [...]} حول الرد كله
+PRODUCT_OVERHEAD_TOKENS = 4
+RESPONSE_OVERHEAD_TOKENS = 8
+
+SYSTEM_PROMPT = "أنت محلل منتجات خبير في السوق العربي. قدم تحليلات واقعية وقابلة للتنفيذ."
+USER_PROMPT = "حلل فرص الربح لـ {count} منتجات مقترحة في مجال: {query}\nالسوق: {country}، المنصة: {platform}\n"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        # ملفات الترميز تُحمّل من الإنترنت أول مرة، وبدونها نعود للتقدير
+        logger.warning("⚠️ تعذر تحميل ترميز %s، تقدير tokens من عدد الحروف: %s", TOKENIZER_ENCODING, e)
+        return None
+
+
+def estimate_tokens(text):
+    """عدد tokens النص: بـ tiktoken إن توفر وإلا تقدير من عدد الحروف العربية وغيرها"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    arabic = len(_ARABIC_RE.findall(text))
+    return math.ceil(arabic / ARABIC_CHARS_PER_TOKEN + (len(text) - arabic) / OTHER_CHARS_PER_TOKEN)
+
+
+def estimate_messages_tokens(messages):
+    """tokens رسائل المحادثة كما يحسبها النموذج (المحتوى + حمل كل رسالة)"""
+    return sum(MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content")) for message in messages) \
+        + REPLY_OVERHEAD_TOKENS
+
+
+def parse_prompt_fields(value):
+    """قائمة الحقول من نص مفصول بفواصل (فارغ = كل الحقول)"""
+    return tuple(name.strip() for name in (value or "").split(",") if name.strip()) or None
+
+
+class PromptBuilder:
+    """رسائل طلب التحليل بالحقول المطلوبة فقط، مع max_tokens على قدر عدد المنتجات وحقولها
+
+    تعليمات الصيغة تُبنى مرة واحدة لمجموعة الحقول، والمتغير في كل طلب الاستعلام والسوق والمنصة فقط.
+    """
+
+    def __init__(self, product_count=3, fields=None, temperature=0.7, max_tokens=2000, output_margin=1.25,
+                 max_query_chars=200):
+        unknown = set(fields or ()) - PRODUCT_SCHEMA_FIELDS.keys()
+        if unknown:
+            raise ValueError(f"حقول غير معروفة في تعليمات النموذج: {', '.join(sorted(unknown))}")
+        selected = set(fields or PRODUCT_SCHEMA_FIELDS) | set(REQUIRED_SCHEMA_FIELDS)
+        self.fields = tuple(name for name in PRODUCT_SCHEMA_FIELDS if name in selected)
+        self.product_count = max(1, product_count)
+        self.temperature = temperature
+        self.max_tokens_cap = max_tokens
+        self.output_margin = output_margin
+        self.max_query_chars = max_query_chars
+        self.schema = schema_prompt(self.fields)
+        self.max_tokens = self.output_tokens(self.product_count)
+
+    def output_tokens(self, count):
+        """حد tokens الرد لعدد المنتجات: مجموع حقولها مع هامش للردود الأطول من المتوقع"""
+        per_product = PRODUCT_OVERHEAD_TOKENS + sum(OUTPUT_TOKENS[name] for name in self.fields)
+        return min(self.max_tokens_cap, math.ceil(per_product * count * self.output_margin) + RESPONSE_OVERHEAD_TOKENS)
+
+    def messages(self, query, country, platform_name):
+        # الاستعلامات الطويلة جداً تُقص في التعليمات فقط (مفتاح الكاش يبقى على الاستعلام الكامل)
+        query = " ".join(str(query).split())[:self.max_query_chars]
+        user = USER_PROMPT.format(count=self.product_count, query=query, country=country, platform=platform_name)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user + self.schema},
+        ]
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+RUNNING = "running"
+WAITING = "waiting"
+REJECTED = "rejected"
+
+
+class OverloadedError(Exception):
+    """لا توجد خانة متاحة لاستدعاء OpenRouter والطابور ممتلئ"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BudgetExceededError(OverloadedError):
+    """نفدت ميزانية tokens الدقيقة الحالية لاستدعاءات OpenRouter"""
+
+
+class MemoryAdmissionStore:
+    """عدادات الحد من الطلبات داخل العملية الحالية فقط"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._holders = {}
+
+    def take(self, key, cost, rate, capacity, idle_after):
+        """سحب cost من دلو العميل، ويرجع (مسموح، ثواني الانتظار)"""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 10000:
+                # حذف دلاء العملاء الخاملين (ممتلئة بالكامل بعد idle_after)
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < idle_after}
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def _purge(self, lease):
+        now = time.time()
+        for holder, (_, updated_at) in list(self._holders.items()):
+            if now - updated_at > lease:
+                del self._holders[holder]
+
+    def _counts(self):
+        running = sum(1 for state, _ in self._holders.values() if state == RUNNING)
+        return running, len(self._holders) - running
+
+    def enter(self, holder, max_running, max_waiting, lease):
+        with self._lock:
+            self._purge(lease)
+            running, waiting = self._counts()
+            if running < max_running and waiting == 0:
+                state = RUNNING
+            elif waiting < max_waiting:
+                state = WAITING
+            else:
+                return REJECTED
+            self._holders[holder] = (state, time.time())
+            return state
+
+    def promote(self, holder, max_running, lease):
+        """نقل طلب منتظر إلى التنفيذ إذا تحررت خانة (الأقدم انتظاراً أولاً)"""
+        with self._lock:
+            self._purge(lease)
+            running, _ = self._counts()
+            waiting = sorted((t, h) for h, (s, t) in self._holders.items() if s == WAITING)
+            if running >= max_running or not waiting or waiting[0][1] != holder:
+                return False
+            self._holders[holder] = (RUNNING, time.time())
+            return True
+
+    def leave(self, holder):
+        with self._lock:
+            self._holders.pop(holder, None)
+
+    def gate_counts(self, lease):
+        with self._lock:
+            self._purge(lease)
+            return self._counts()
+
+
+class SQLiteAdmissionStore:
+    """عدادات مشتركة في ملف SQLite حتى تسري الحدود على كل عمال gunicorn معاً"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS upstream_slots (
+                holder TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+
+    def _connection(self):
+        # اتصال مستقل لكل خيط لأن اتصالات SQLite لا تُشارك بين الخيوط
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take(self, key, cost, rate, capacity, idle_after):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row is not None else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - idle_after,))
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    @staticmethod
+    def _counts(conn, lease):
+        # خانات العمال التي توقفت بدون تحريرها تنتهي بعد lease ثانية
+        conn.execute("DELETE FROM upstream_slots WHERE updated_at < ?", (time.time() - lease,))
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM upstream_slots GROUP BY state").fetchall())
+        return counts.get(RUNNING, 0), counts.get(WAITING, 0)
+
+    def enter(self, holder, max_running, max_waiting, lease):
+        with self._transaction() as conn:
+            running, waiting = self._counts(conn, lease)
+            if running < max_running and waiting == 0:
+                state = RUNNING
+            elif waiting < max_waiting:
+                state = WAITING
+            else:
+                return REJECTED
+            conn.execute(
+                "INSERT INTO upstream_slots (holder, state, updated_at) VALUES (?, ?, ?)",
+                (holder, state, time.time()),
+            )
+            return state
+
+    def promote(self, holder, max_running, lease):
+        with self._transaction() as conn:
+            running, _ = self._counts(conn, lease)
+            oldest = conn.execute(
+                "SELECT holder FROM upstream_slots WHERE state = ? ORDER BY updated_at LIMIT 1", (WAITING,)
+            ).fetchone()
+            if running >= max_running or oldest is None or oldest[0] != holder:
+                return False
+            conn.execute(
+                "UPDATE upstream_slots SET state = ?, updated_at = ? WHERE holder = ?",
+                (RUNNING, time.time(), holder),
+            )
+            return True
+
+    def leave(self, holder):
+        self._connection().execute("DELETE FROM upstream_slots WHERE holder = ?", (holder,))
+
+    def gate_counts(self, lease):
+        with self._transaction() as conn:
+            return self._counts(conn, lease)
+
+
+class RateLimiter:
+    """Token bucket لكل عميل: per_minute طلب في الدقيقة مع السماح بدفعة حتى burst"""
+
+    def __init__(self, store, per_minute=60, burst=20):
+        self.store = store
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    @property
+    def max_cost(self):
+        """أكبر تكلفة لطلب واحد يمكن قبولها (سعة الدلو)، وبلا حد إذا كان الحد معطلاً"""
+        return self.capacity if self.enabled else math.inf
+
+    def acquire(self, client_key, cost=1):
+        """يرجع (مسموح، ثواني الانتظار قبل إعادة المحاولة)"""
+        if not self.enabled:
+            return True, 0.0
+        if cost > self.capacity:
+            # لا يمكن قبوله أبداً، وعلى المستدعي رفضه قبل ذلك (max_cost) بدلاً من خصمه بالسعة
+            raise ValueError(f"cost {cost} exceeds the bucket capacity {self.capacity}")
+        allowed, retry_after = self.store.take(
+            client_key, cost, self.rate, self.capacity, idle_after=self.capacity / self.rate
+        )
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return allowed, retry_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "per_minute": round(self.rate * 60, 2),
+                "burst": self.capacity,
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
+
+
+class TokenBudget:
+    """ميزانية tokens في الدقيقة لكل استدعاءات OpenRouter، مشتركة بين العمال عبر نفس مخزن الحد من الطلبات
+
+    كل طلب يحجز أسوأ حالة (tokens الرسائل + max_tokens) قبل الإرسال، ثم يُرد غير المستخدم بعد الرد.
+    """
+
+    KEY = "budget:openrouter_tokens"
+
+    def __init__(self, store, per_minute=0):
+        self.store = store
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self._lock = threading.Lock()
+        self.reserved = 0
+        self.used = 0
+        self.exhausted = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _take(self, tokens):
+        return self.store.take(self.KEY, tokens, self.rate, self.capacity, idle_after=60.0)
+
+    def reserve(self, tokens):
+        """حجز tokens طلب واحد ويرجع المحجوز فعلاً، أو BudgetExceededError إذا نفدت الميزانية"""
+        if not self.enabled:
+            return 0
+        # طلب أكبر من الميزانية كلها يُحسب بالسعة الكاملة حتى لا يُرفض أبداً
+        tokens = min(tokens, self.capacity)
+        allowed, retry_after = self._take(tokens)
+        with self._lock:
+            if allowed:
+                self.reserved += tokens
+            else:
+                self.exhausted += 1
+        if not allowed:
+            raise BudgetExceededError("token budget exhausted for this minute", retry_after)
+        return tokens
+
+    def settle(self, reserved, used):
+        """تسجيل الاستهلاك الفعلي ورد الفرق بينه وبين المحجوز إلى الميزانية"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.used += used
+        unused = reserved - used
+        if unused > 0:
+            # سحب بقيمة سالبة يضيف الفرق للدلو (والسعة تُطبق في السحب التالي)
+            self._take(-unused)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "per_minute": self.capacity,
+                "reserved_tokens": self.reserved,
+                "used_tokens": self.used,
+                "exhausted": self.exhausted,
+            }
+
+
+class UpstreamGate:
+    """حد أقصى لاستدعاءات OpenRouter المتزامنة مع طابور انتظار محدود، ورفض الطلبات الزائدة"""
+
+    def __init__(self, store, max_inflight=8, max_queued=16, queue_timeout=10.0, lease=120.0,
+                 poll_interval=0.02, retry_after=5.0):
+        self.store = store
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.shed = 0
+
+    @property
+    def enabled(self):
+        return self.max_inflight > 0
+
+    def _enter(self):
+        holder = uuid.uuid4().hex
+        state = self.store.enter(holder, self.max_inflight, self.max_queued, self.lease)
+        if state == REJECTED:
+            self._shed("upstream queue is full")
+        return holder, state
+
+    def _shed(self, reason):
+        with self._lock:
+            self.shed += 1
+        raise OverloadedError(reason, self.retry_after)
+
+    def _admitted(self):
+        with self._lock:
+            self.admitted += 1
+
+    @contextmanager
+    def admit(self):
+        """خانة لاستدعاء OpenRouter، أو OverloadedError إذا امتلأ الطابور أو طال الانتظار"""
+        if not self.enabled:
+            yield
+            return
+        holder, state = self._enter()
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while state == WAITING:
+                if time.monotonic() >= deadline:
+                    self._shed("timed out waiting for an upstream slot")
+                time.sleep(self.poll_interval)
+                if self.store.promote(holder, self.max_inflight, self.lease):
+                    state = RUNNING
+            self._admitted()
+            yield
+        finally:
+            self.store.leave(holder)
+
+    @asynccontextmanager
+    async def admit_async(self):
+        """نفس admit لحلقة asyncio: الانتظار وعمليات المخزن (قد يكون SQLite) بدون حجز الحلقة"""
+        if not self.enabled:
+            yield
+            return
+        holder, state = await asyncio.to_thread(self._enter)
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while state == WAITING:
+                if time.monotonic() >= deadline:
+                    self._shed("timed out waiting for an upstream slot")
+                await asyncio.sleep(self.poll_interval)
+                if await asyncio.to_thread(self.store.promote, holder, self.max_inflight, self.lease):
+                    state = RUNNING
+            self._admitted()
+            yield
+        finally:
+            await asyncio.to_thread(self.store.leave, holder)
+
+    def stats(self):
+        running, waiting = self.store.gate_counts(self.lease) if self.enabled else (0, 0)
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_inflight": self.max_inflight,
+                "max_queued": self.max_queued,
+                "in_flight": running,
+                "queued": waiting,
+                "admitted": self.admitted,
+                "shed": self.shed,
+            }
+
+
+def create_admission_store(backend_name="sqlite", sqlite_path="analyzer_limits.sqlite3"):
+    """مخزن عدادات الحد من الطلبات حسب النوع المطلوب"""
+    if backend_name == "sqlite":
+        return SQLiteAdmissionStore(sqlite_path)
+    if backend_name == "memory":
+        return MemoryAdmissionStore()
+    raise ValueError(f"نوع مخزن غير مدعوم: {backend_name}")
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from http_client import CircuitBreaker, CircuitOpenError, RequestCancelledError
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+FAILOVER = "failover"
+
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1)]
+
+
+class ModelStats:
+    """زمن آخر الاستدعاءات الناجحة وأخطاء نموذج واحد، مع قاطع دائرة خاص به"""
+
+    def __init__(self, name, window, failure_threshold, recovery_timeout):
+        self.name = name
+        self.latencies = deque(maxlen=window)
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, recovery_timeout=recovery_timeout)
+        self.successes = 0
+        self.failures = 0
+        # طلب أول لنموذج بدون قياسات ما زال ينتظر نتيجته
+        self.probing = False
+
+    def quantile(self, q):
+        values = sorted(self.latencies)
+        return _quantile(values, q) if values else None
+
+    def snapshot(self):
+        values = sorted(self.latencies)
+        total = self.successes + self.failures
+        return {
+            "model": self.name,
+            "state": self.breaker.snapshot()["state"],
+            "requests": total,
+            "errors": self.failures,
+            "error_rate": round(self.failures / total, 4) if total else 0.0,
+            "samples": len(values),
+            "p50_ms": round(_quantile(values, 0.5) * 1000, 1) if values else None,
+            "p95_ms": round(_quantile(values, 0.95) * 1000, 1) if values else None,
+        }
+
+
+class _Race:
+    """طلب أصلي وطلب احتياطي: أول رد ناجح يفوز والآخر يُلغى أو يُهمل"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.winner = None
+        self.hedged = False
+        # يُضبط عند الفوز، فتتوقف المحاولة الخاسرة قبل إعادة محاولتها ولا تستهلك حصة OpenRouter مرة أخرى
+        self.cancel = threading.Event()
+
+    def claim(self, model):
+        with self.lock:
+            if self.winner is None:
+                self.winner = model
+                self.cancel.set()
+                return True
+            return False
+
+
+class ModelRouter:
+    """مجموعة نماذج OpenRouter: كل طلب يذهب لأسرع نموذج سليم حسب آخر window استدعاء له
+
+    مع hedge يُرسل طلب احتياطي لأسرع نموذج بديل إذا تجاوز الطلب الأول زمن hedge_quantile لنموذجه،
+    وأول رد ناجح يُعتمد. وإذا فشل الطلب الأصلي بدون طلب احتياطي يُعاد مرة واحدة لأسرع نموذج سليم آخر،
+    فلا يصل للمستخدم فشل طلب تجريبي لنموذج في فترة التعافي أو لنموذج جديد.
+    النماذج بدون قياسات تُجرب أولاً حتى تُعرف سرعتها.
+    """
+
+    def __init__(self, models, window=100, hedge_min_samples=20, failure_threshold=3, recovery_timeout=60.0,
+                 hedge=False, hedge_quantile=0.95, hedge_min_delay=0.5, hedge_workers=8, observer=None):
+        if not models:
+            raise ValueError("at least one model is required")
+        self.models = {name: ModelStats(name, window, failure_threshold, recovery_timeout) for name in models}
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge = hedge and len(self.models) > 1
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        # observer(model, role, outcome, seconds) لكل استدعاء (لمقاييس Prometheus)
+        self.observer = observer
+        self._lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.failovers_sent = 0
+        self.failovers_won = 0
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge") \
+            if self.hedge else None
+
+    @property
+    def default_model(self):
+        return next(iter(self.models))
+
+    @staticmethod
+    def _speed(stats):
+        # الوسيط يمثل السرعة الحالية دون أن يتأثر بطلب بطيء واحد، والنموذج الذي لم ينجح أبداً في الآخر
+        median = stats.quantile(0.5)
+        if median is not None:
+            return median
+        # النموذج الجديد يُجرب بطلب واحد فقط، وحتى تصل نتيجته تذهب الطلبات الأخرى للنماذج المعروفة
+        # (وإلا تصل كل الطلبات المتزامنة لنموذج معطل معاً وتفتح القاطع العام للعميل)
+        return math.inf if stats.failures or stats.probing else 0.0
+
+    def _ranked(self):
+        with self._lock:
+            return sorted(self.models.values(), key=self._speed)
+
+    def _picked(self, stats):
+        with self._lock:
+            if not stats.latencies:
+                stats.probing = True
+        return stats.name
+
+    def choose(self):
+        """أسرع نموذج يسمح قاطعه بطلب الآن، أو None إذا كانت كل النماذج معطلة"""
+        for stats in self._ranked():
+            if stats.breaker.allow_request():
+                return self._picked(stats)
+        return None
+
+    def _alternate(self, primary):
+        """أسرع نموذج سليم غير primary للطلب الاحتياطي أو البديل"""
+        # النماذج في فترة التعافي لا تُجرب بطلب احتياطي حتى لا يُحجز طلبها التجريبي دون إرساله
+        for stats in self._ranked():
+            if stats.name != primary and stats.breaker.snapshot()["state"] == CircuitBreaker.CLOSED:
+                return self._picked(stats)
+        return None
+
+    def hedge_delay(self, model):
+        """مهلة الطلب الاحتياطي: زمن hedge_quantile للنموذج بعد hedge_min_samples قياس، وإلا None"""
+        if not self.hedge:
+            return None
+        stats = self.models[model]
+        with self._lock:
+            if len(stats.latencies) < self.hedge_min_samples:
+                return None
+            return max(self.hedge_min_delay, stats.quantile(self.hedge_quantile))
+
+    def record_success(self, model, seconds, role=PRIMARY, outcome="success"):
+        """تسجيل استدعاء ناجح، وزمنه يدخل في ترتيب النماذج (للبث زمن أول منتج)"""
+        stats = self.models[model]
+        stats.breaker.record_success()
+        with self._lock:
+            stats.successes += 1
+            stats.probing = False
+            stats.latencies.append(seconds)
+        if self.observer is not None:
+            self.observer(model, role, outcome, seconds)
+
+    def record_failure(self, model, role=PRIMARY):
+        stats = self.models[model]
+        stats.breaker.record_failure()
+        with self._lock:
+            stats.failures += 1
+            stats.probing = False
+        if self.observer is not None:
+            self.observer(model, role, "error", None)
+
+    def release(self, model):
+        """تحرير الطلب التجريبي المحجوز للنموذج إذا لم يُرسل له الطلب أو أُلغي قبل نتيجته"""
+        stats = self.models[model]
+        stats.breaker.release_trial()
+        with self._lock:
+            stats.probing = False
+
+    def select(self):
+        """النموذج للطلب الأصلي، أو CircuitOpenError إذا كانت قواطع كل النماذج مفتوحة"""
+        model = self.choose()
+        if model is None:
+            raise CircuitOpenError("all OpenRouter models are unavailable")
+        return model
+
+    def _finish(self, race, model, role, started, error=None):
+        """تسجيل نتيجة محاولة داخل سباق، ويرجع True إن كانت الفائزة"""
+        seconds = time.perf_counter() - started
+        if error is not None:
+            if isinstance(error, RequestCancelledError):
+                # فاز الطلب الآخر قبل انتهاء محاولات هذا الطلب: بدون نتيجة تُحسب للنموذج
+                self.release(model)
+                if self.observer is not None:
+                    self.observer(model, role, "cancelled", None)
+            elif isinstance(error, CircuitOpenError):
+                # القاطع العام للعميل مفتوح: الطلب لم يصل للنموذج أصلاً
+                self.release(model)
+            else:
+                self.record_failure(model, role=role)
+            return False
+        won = race.claim(model)
+        self.record_success(model, seconds, role=role, outcome="success" if won else "lost")
+        if won and role != PRIMARY:
+            with self._lock:
+                if role == HEDGE:
+                    self.hedges_won += 1
+                else:
+                    self.failovers_won += 1
+        return won
+
+    def _attempt(self, send, race, model, role, payload, headers):
+        started = time.perf_counter()
+        try:
+            result = send(dict(payload, model=model), headers, cancel=race.cancel)
+        except Exception as e:
+            self._finish(race, model, role, started, e)
+            raise
+        self._finish(race, model, role, started)
+        return result
+
+    def _start_hedge(self, primary, allow_hedge):
+        """النموذج البديل للطلب الاحتياطي، أو None إن لم يوجد بديل سليم أو رفضت الميزانية"""
+        alternate = self._alternate(primary)
+        if alternate is None or (allow_hedge is not None and not allow_hedge()):
+            return None
+        with self._lock:
+            self.hedges_sent += 1
+        return alternate
+
+    def _failover(self, race, primary, error):
+        """النموذج البديل بعد فشل الطلب الأصلي، أو None إذا أُرسل طلب احتياطي أو كان القاطع العام مفتوحاً"""
+        if race.hedged or isinstance(error, CircuitOpenError):
+            return None
+        alternate = self._alternate(primary)
+        if alternate is not None:
+            with self._lock:
+                self.failovers_sent += 1
+        return alternate
+
+    def complete(self, send, payload, headers, allow_hedge=None):
+        """إرسال الطلب بـ send(payload, headers, cancel) لأسرع نموذج، مع طلب احتياطي عند التأخر وبديل عند الفشل
+
+        cancel حدث يُضبط عند فوز أحد الطلبين، وعلى send ألا يعيد المحاولة بعده (RequestCancelledError).
+        """
+        primary = self.select()
+        race = _Race()
+        try:
+            return self._send(send, race, primary, payload, headers, allow_hedge)
+        except Exception as e:
+            alternate = self._failover(race, primary, e)
+            if alternate is None:
+                raise
+        return self._attempt(send, race, alternate, FAILOVER, payload, headers)
+
+    def _send(self, send, race, primary, payload, headers, allow_hedge):
+        delay = self.hedge_delay(primary)
+        if delay is None:
+            return self._attempt(send, race, primary, PRIMARY, payload, headers)
+
+        # نسخة من السياق لكل محاولة حتى ينتقل التتبع ورقم الطلب إلى خيوطها
+        first = self._executor.submit(
+            contextvars.copy_context().run, self._attempt, send, race, primary, PRIMARY, payload, headers)
+        if wait([first], timeout=delay).done:
+            return first.result()
+        alternate = self._start_hedge(primary, allow_hedge)
+        if alternate is None:
+            return first.result()
+        race.hedged = True
+        second = self._executor.submit(
+            contextvars.copy_context().run, self._attempt, send, race, alternate, HEDGE, payload, headers)
+
+        models = {first: primary, second: alternate}
+        pending = set(models)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                elif models[future] == race.winner:
+                    # الطلب الجاري في خيط لا يمكن إيقافه، فنهمل رده ويُسجل زمنه عند انتهائه (lost)
+                    # ولا يعيد المحاولة بعد race.cancel، والذي لم يبدأ بعد يُلغى ولن يسجل نتيجة
+                    for other in pending:
+                        if other.cancel():
+                            self.release(models[other])
+                    return future.result()
+        raise error
+
+    async def _attempt_async(self, send, race, model, role, payload, headers):
+        started = time.perf_counter()
+        try:
+            result = await send(dict(payload, model=model), headers)
+        except asyncio.CancelledError:
+            self.release(model)
+            if self.observer is not None:
+                self.observer(model, role, "cancelled", None)
+            raise
+        except Exception as e:
+            self._finish(race, model, role, started, e)
+            raise
+        self._finish(race, model, role, started)
+        return result
+
+    async def complete_async(self, send, payload, headers, allow_hedge=None):
+        """نفس complete لحلقة asyncio: الطلب الخاسر يُلغى فعلاً ويُغلق اتصاله"""
+        primary = self.select()
+        race = _Race()
+        try:
+            return await self._send_async(send, race, primary, payload, headers, allow_hedge)
+        except Exception as e:
+            alternate = self._failover(race, primary, e)
+            if alternate is None:
+                raise
+        return await self._attempt_async(send, race, alternate, FAILOVER, payload, headers)
+
+    async def _send_async(self, send, race, primary, payload, headers, allow_hedge):
+        delay = self.hedge_delay(primary)
+        if delay is None:
+            return await self._attempt_async(send, race, primary, PRIMARY, payload, headers)
+
+        first = asyncio.ensure_future(self._attempt_async(send, race, primary, PRIMARY, payload, headers))
+        models = {first: primary}
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            # حجز ميزانية الطلب الاحتياطي قد يكتب في SQLite فيعمل في خيط
+            alternate = await asyncio.to_thread(self._start_hedge, primary, allow_hedge)
+            if alternate is None:
+                return await first
+            race.hedged = True
+            second = asyncio.ensure_future(self._attempt_async(send, race, alternate, HEDGE, payload, headers))
+            models[second] = alternate
+            pending.add(second)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # الإلغاء يصل للمهمة في دورة لاحقة من الحلقة، فيُحرر طلبها التجريبي الآن
+            for task in pending:
+                if task.cancel():
+                    self.release(models[task])
+
+    def stats(self):
+        with self._lock:
+            models = [stats.snapshot() for stats in self.models.values()]
+            return {
+                "models": models,
+                "hedging": {
+                    "enabled": self.hedge,
+                    "quantile": self.hedge_quantile,
+                    "sent": self.hedges_sent,
+                    "won": self.hedges_won,
+                },
+                "failover": {
+                    "sent": self.failovers_sent,
+                    "won": self.failovers_won,
+                },
+            }
+
+
+def parse_models(value):
+    """قائمة النماذج من نص مفصول بفواصل بدون تكرار"""
+    return list(dict.fromkeys(name.strip() for name in (value or "").split(",") if name.strip()))
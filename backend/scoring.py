@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+
+try:
+    import numpy as np
+except ImportError:  # numpy اختياري، والبديل هو حساب كل منتج على حدة
+    np = None
+
+ENGINE = "numpy" if np is not None else "python"
+
+# مستوى المنافسة: 0 منخفض، 1 متوسط، 2 عالي
+COMPETITION_LEVELS = {
+    "منخفض": 0, "متوسط": 1, "عالي": 2,
+    "low": 0, "medium": 1, "high": 2,
+}
+
+# الأعمدة المقبولة وقيمتها الافتراضية (None = إلزامي)
+COLUMNS = {
+    "purchase_price": None,
+    "suggested_price": None,
+    "costs": 0.0,           # تكاليف إضافية للقطعة: شحن ورسوم منصة وتغليف
+    "shipping_days": 0.0,
+    "ad_budget": 0.0,       # ميزانية الإعلان اليومية
+    "competition": 1,
+}
+
+# أماكن الأعمدة في منتج /api/analyze: (القسم، الحقل)
+PRODUCT_FIELDS = {
+    "purchase_price": ("profit_analysis", "purchase_price"),
+    "suggested_price": ("profit_analysis", "suggested_price"),
+    "costs": ("profit_analysis", "total_costs"),
+    "ad_budget": ("marketing", "ad_budget"),
+    "competition": ("market_analysis", "competition"),
+}
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+DEFAULT_WEIGHTS = {
+    "margin": 0.30,
+    "roi": 0.25,
+    "competition": 0.20,
+    "ad_efficiency": 0.15,
+    "shipping": 0.10,
+}
+
+
+def _weights(weights):
+    if weights is not None and not isinstance(weights, dict):
+        raise ValueError("weights يجب أن تكون كائن JSON")
+    merged = dict(DEFAULT_WEIGHTS)
+    for key, value in (weights or {}).items():
+        if key not in DEFAULT_WEIGHTS:
+            raise ValueError(f"وزن غير معروف: {key}")
+        merged[key] = float(value)
+    total = sum(merged.values())
+    if total <= 0:
+        raise ValueError("مجموع الأوزان يجب أن يكون أكبر من صفر")
+    return {key: value / total for key, value in merged.items()}
+
+
+def competition_level(value):
+    if isinstance(value, str):
+        level = COMPETITION_LEVELS.get(value.strip().lower())
+        if level is not None:
+            return level
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"مستوى منافسة غير معروف: {value}")
+    return min(2.0, max(0.0, float(value)))
+
+
+def _product_value(name, value):
+    """قيمة عمود من نص منتج التحليل: الميزانية مثل "60 ريال/يوم"، والمنافسة المعروفة فقط"""
+    if name == "ad_budget" and isinstance(value, str):
+        match = _NUMBER_RE.search(value.replace(",", ""))
+        return float(match.group()) if match else None
+    if name == "competition" and isinstance(value, str):
+        return value if value.strip().lower() in COMPETITION_LEVELS else None
+    return value
+
+
+def _flat_row(row):
+    """منتج /api/analyze (الأسعار داخل profit_analysis) إلى صف مسطح، والحقول المسطحة مقدمة عليه"""
+    if not isinstance(row.get("profit_analysis"), dict):
+        return row
+    flat = {}
+    for name, (section, field) in PRODUCT_FIELDS.items():
+        values = row.get(section)
+        value = _product_value(name, values.get(field)) if isinstance(values, dict) else None
+        if value is not None:
+            flat[name] = value
+    flat.update((name, row[name]) for name in COLUMNS if name in row)
+    return flat
+
+
+def columns_from_rows(rows):
+    """تحويل قائمة منتجات {purchase_price, suggested_price, ...} أو منتجات /api/analyze إلى أعمدة"""
+    if not isinstance(rows, list):
+        raise ValueError("products يجب أن تكون قائمة")
+    try:
+        rows = [_flat_row(row) for row in rows]
+    except AttributeError:
+        raise ValueError("كل منتج يجب أن يكون كائن JSON")
+    columns = {}
+    for name, default in COLUMNS.items():
+        try:
+            columns[name] = [row[name] if default is None else row.get(name, default) for row in rows]
+        except KeyError:
+            raise ValueError(f"الحقل {name} مطلوب في كل منتج")
+        except AttributeError:
+            raise ValueError("كل منتج يجب أن يكون كائن JSON")
+    return columns
+
+
+def _column(columns, name, count):
+    """قيم العمود بعد التحقق من طوله، أو None إذا لم يُرسل وله قيمة افتراضية"""
+    values = columns.get(name)
+    if values is None:
+        if COLUMNS[name] is None:
+            raise ValueError(f"العمود {name} مطلوب")
+        return None
+    if not isinstance(values, (list, tuple)) or len(values) != count:
+        raise ValueError(f"العمود {name} يجب أن يكون قائمة بطول purchase_price")
+    return values
+
+
+def _count(columns):
+    if not isinstance(columns, dict):
+        raise ValueError("columns يجب أن تكون كائن JSON")
+    purchase_price = columns.get("purchase_price")
+    if not isinstance(purchase_price, (list, tuple)):
+        raise ValueError("العمود purchase_price مطلوب")
+    return len(purchase_price)
+
+
+def _row_score(purchase_price, suggested_price, costs, shipping_days, ad_budget, competition, weights):
+    """تقييم منتج واحد (نفس معادلات score_columns)"""
+    net_profit = suggested_price - purchase_price - costs
+    margin = net_profit / suggested_price if suggested_price > 0 else math.nan
+    invested = purchase_price + costs
+    roi = net_profit / invested if invested > 0 else math.nan
+    # أقصى تكلفة إعلان لكل عملية بيع بدون خسارة، وعدد المبيعات اليومية اللازمة لتغطية الميزانية
+    break_even_ad_spend = max(net_profit, 0.0)
+    break_even_units = ad_budget / net_profit if net_profit > 0 else math.nan
+
+    margin_score = min(1.0, max(0.0, margin)) if margin == margin else 0.0
+    roi_score = roi / (1.0 + roi) if roi == roi and roi > 0 else 0.0
+    competition_score = 1.0 - competition / 2.0
+    ad_score = 1.0 / (1.0 + break_even_units / 10.0) if break_even_units == break_even_units else 0.0
+    shipping_score = 1.0 / (1.0 + max(shipping_days, 0.0) / 14.0)
+    score = (
+        weights["margin"] * margin_score
+        + weights["roi"] * roi_score
+        + weights["competition"] * competition_score
+        + weights["ad_efficiency"] * ad_score
+        + weights["shipping"] * shipping_score
+    )
+    return score, net_profit, margin, roi, break_even_ad_spend, break_even_units
+
+
+def _finite_or_none(value):
+    return value if math.isfinite(value) else None
+
+
+def score_rows(columns, weights=None):
+    """حساب التقييم منتجاً منتجاً بدون numpy، بنفس شكل نتيجة score_columns"""
+    weights = _weights(weights)
+    count = _count(columns)
+    values = {}
+    for name, default in COLUMNS.items():
+        column = _column(columns, name, count)
+        values[name] = column if column is not None else [default] * count
+    results = []
+    try:
+        for i in range(count):
+            results.append(_row_score(
+                float(values["purchase_price"][i]),
+                float(values["suggested_price"][i]),
+                float(values["costs"][i]),
+                float(values["shipping_days"][i]),
+                float(values["ad_budget"][i]),
+                competition_level(values["competition"][i]),
+                weights,
+            ))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"قيمة غير صالحة في المنتج رقم {len(results)}: {e}")
+    order = sorted(range(count), key=lambda i: -results[i][0])
+    ranks = [0] * count
+    for position, index in enumerate(order, start=1):
+        ranks[index] = position
+    scored = {"rank": ranks, "order": order}
+    for position, name in enumerate(("score", "net_profit", "profit_margin", "roi", "break_even_ad_spend",
+                                     "break_even_units")):
+        scored[name] = [_finite_or_none(row[position]) for row in results]
+    return scored
+
+
+def _array(columns, name, count):
+    values = _column(columns, name, count)
+    if values is None:
+        return np.full(count, float(COLUMNS[name]))
+    array = np.asarray(values)
+    if name == "competition" and array.dtype.kind == "U":
+        # تحويل القيم المختلفة فقط (عادة ثلاث) ثم توزيعها على كل الصفوف
+        labels, inverse = np.unique(array, return_inverse=True)
+        array = np.array([competition_level(label) for label in labels])[inverse]
+    try:
+        array = array.astype(np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"العمود {name} يجب أن يحتوي على أرقام فقط")
+    if name == "competition":
+        array = np.clip(array, 0.0, 2.0)
+    return array
+
+
+def _to_list(array):
+    """قائمة JSON: القيم غير المحدودة (قسمة على صفر) تصبح null"""
+    finite = np.isfinite(array)
+    if finite.all():
+        return array.tolist()
+    return np.where(finite, array, None).tolist()
+
+
+def score_columns(columns, weights=None):
+    """تقييم كل المنتجات في تمريرة واحدة على أعمدة numpy
+
+    يرجع أعمدة بنفس ترتيب المدخلات (score, rank, net_profit, profit_margin, roi,
+    break_even_ad_spend, break_even_units) و order = أرقام المنتجات من الأفضل للأسوأ.
+    """
+    if np is None:
+        return score_rows(columns, weights)
+    weights = _weights(weights)
+    count = _count(columns)
+    purchase_price = _array(columns, "purchase_price", count)
+    suggested_price = _array(columns, "suggested_price", count)
+    costs = _array(columns, "costs", count)
+    shipping_days = _array(columns, "shipping_days", count)
+    ad_budget = _array(columns, "ad_budget", count)
+    competition = _array(columns, "competition", count)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        net_profit = suggested_price - purchase_price - costs
+        margin = np.where(suggested_price > 0, net_profit / suggested_price, np.nan)
+        invested = purchase_price + costs
+        roi = np.where(invested > 0, net_profit / invested, np.nan)
+        break_even_ad_spend = np.maximum(net_profit, 0.0)
+        break_even_units = np.where(net_profit > 0, ad_budget / net_profit, np.nan)
+
+        score = weights["margin"] * np.nan_to_num(np.clip(margin, 0.0, 1.0), nan=0.0)
+        score += weights["roi"] * np.where(roi > 0, roi / (1.0 + roi), 0.0)
+        score += weights["competition"] * (1.0 - competition / 2.0)
+        score += weights["ad_efficiency"] * np.nan_to_num(1.0 / (1.0 + break_even_units / 10.0), nan=0.0)
+        score += weights["shipping"] / (1.0 + np.maximum(shipping_days, 0.0) / 14.0)
+
+    order = np.argsort(-score, kind="stable")
+    rank = np.empty(count, dtype=np.int64)
+    rank[order] = np.arange(1, count + 1)
+    return {
+        "score": _to_list(score),
+        "rank": rank.tolist(),
+        "net_profit": _to_list(net_profit),
+        "profit_margin": _to_list(margin),
+        "roi": _to_list(roi),
+        "break_even_ad_spend": _to_list(break_even_ad_spend),
+        "break_even_units": _to_list(break_even_units),
+        "order": order.tolist(),
+    }
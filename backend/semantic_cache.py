@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from cache import FRESH
+
+# التشكيل والتطويل
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_LETTER_FORMS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+})
+_TOKEN = re.compile(r"[a-z0-9]+|[\u0621-\u064a\u0660-\u0669\u0670-\u06d3\u0610-\u061a\u064b-\u065f]+")
+
+# ترتيب السوابق واللواحق مهم: الأطول أولاً (Light10)
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "ه", "ي")
+
+# مقابلات عربية لكلمات إنجليزية شائعة في الاستعلامات، مكتوبة بعد توحيد الحروف
+TRANSLITERATIONS = {
+    "smart": "ذكي",
+    "watch": "ساعه",
+    "phone": "هاتف",
+    "mobile": "جوال",
+    "case": "غطاء",
+    "cover": "غطاء",
+    "charger": "شاحن",
+    "cable": "كابل",
+    "headphone": "سماعه",
+    "headphones": "سماعه",
+    "earbuds": "سماعه",
+    "earphones": "سماعه",
+    "wireless": "لاسلكي",
+    "bluetooth": "بلوتوث",
+    "speaker": "مكبر",
+    "laptop": "لابتوب",
+    "bag": "حقيبه",
+    "backpack": "حقيبه",
+    "shoes": "حذاء",
+    "sneakers": "حذاء",
+    "perfume": "عطر",
+    "makeup": "مكياج",
+    "skincare": "بشره",
+    "hair": "شعر",
+    "dryer": "مجفف",
+    "kitchen": "مطبخ",
+    "coffee": "قهوه",
+    "lamp": "مصباح",
+    "light": "اضاءه",
+    "led": "اضاءه",
+    "toy": "لعبه",
+    "toys": "لعبه",
+    "kids": "اطفال",
+    "baby": "اطفال",
+    "car": "سياره",
+    "fitness": "لياقه",
+    "sport": "رياضي",
+    "sports": "رياضي",
+    "pet": "حيوان",
+    "camera": "كاميرا",
+    "gaming": "العاب",
+    "home": "منزل",
+    "men": "رجال",
+    "women": "نساء",
+}
+
+
+def _strip_diacritics(tokens):
+    return [_DIACRITICS.sub("", token) for token in tokens]
+
+
+def _unify_letters(tokens):
+    return [token.translate(_LETTER_FORMS) for token in tokens]
+
+
+def _transliterate(tokens):
+    result = []
+    for token in tokens:
+        # صيغة الجمع الإنجليزية البسيطة: watches -> watch
+        result.append(
+            TRANSLITERATIONS.get(token)
+            or (token.endswith("es") and TRANSLITERATIONS.get(token[:-2]))
+            or (token.endswith("s") and TRANSLITERATIONS.get(token[:-1]))
+            or token
+        )
+    return result
+
+
+def light_stem(token):
+    """تجذيع خفيف: حذف سابقة ولاحقة واحدة مع إبقاء حرفين على الأقل"""
+    if not "\u0621" <= token[:1] <= "\u06d3":
+        return token
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            token = token[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            return token[:-len(suffix)]
+    return token
+
+
+def _stem(tokens):
+    return [light_stem(token) for token in tokens]
+
+
+def _sort_words(tokens):
+    return sorted(tokens)
+
+
+# قواعد التوحيد بالترتيب، كل قاعدة تطبق على ناتج التي قبلها
+NORMALIZATION_RULES = (
+    ("diacritics", _strip_diacritics),
+    ("letter_forms", _unify_letters),
+    ("transliteration", _transliterate),
+    ("stemming", _stem),
+    ("word_order", _sort_words),
+)
+
+
+def normalization_stages(query):
+    """صيغة الاستعلام بعد كل قاعدة: [(اسم القاعدة، النص)] بنفس ترتيب NORMALIZATION_RULES"""
+    tokens = _TOKEN.findall(str(query or "").lower())
+    stages = []
+    for name, rule in NORMALIZATION_RULES:
+        tokens = rule(tokens)
+        stages.append((name, " ".join(tokens)))
+    return stages
+
+
+def char_ngrams(text, n=3):
+    """مجموعة n-grams الحرفية لكل كلمة مع حدود الكلمة (مستقلة عن ترتيب الكلمات)"""
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams.add(padded)
+        grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class _Entry:
+    __slots__ = ("key", "scope", "forms", "grams")
+
+    def __init__(self, key, scope, forms, grams):
+        self.key = key
+        self.scope = scope
+        self.forms = forms
+        self.grams = grams
+
+
+class SemanticIndex:
+    """فهرس محلي للاستعلامات المخزنة: تطابق الصيغ الموحدة وتشابه n-grams داخل نفس السوق والمنصة"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # (السوق، المنصة، القاعدة) -> الصيغة -> مفتاح الكاش
+        self._forms = defaultdict(dict)
+        # (السوق، المنصة) -> n-gram -> مفاتيح الكاش
+        self._postings = defaultdict(lambda: defaultdict(set))
+
+    def add(self, key, query, country, platform):
+        scope = (country, platform)
+        stages = normalization_stages(query)
+        entry = _Entry(key, scope, dict(stages), frozenset(char_ngrams(stages[-1][1])))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            for rule, form in entry.forms.items():
+                if form:
+                    self._forms[scope + (rule,)][form] = key
+            postings = self._postings[scope]
+            for gram in entry.grams:
+                postings[gram].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for rule, form in entry.forms.items():
+            forms = self._forms.get(entry.scope + (rule,))
+            if forms is not None and forms.get(form) == key:
+                del forms[form]
+        postings = self._postings[entry.scope]
+        for gram in entry.grams:
+            keys = postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del postings[gram]
+
+    def match(self, query, country, platform, threshold):
+        """أول قاعدة توحيد تطابق استعلاماً مخزناً، وإلا الأكثر تشابهاً فوق threshold
+
+        يرجع (مفتاح الكاش، القاعدة، درجة التشابه) أو None.
+        """
+        scope = (country, platform)
+        stages = normalization_stages(query)
+        with self._lock:
+            for rule, form in stages:
+                key = self._forms.get(scope + (rule,), {}).get(form)
+                if key is not None:
+                    self._entries.move_to_end(key)
+                    return key, rule, 1.0
+            if threshold > 1:
+                return None
+            grams = char_ngrams(stages[-1][1])
+            postings = self._postings.get(scope)
+            if not grams or not postings:
+                return None
+            shared = Counter()
+            for gram in grams:
+                shared.update(postings.get(gram, ()))
+            best = None
+            for key, common in shared.items():
+                # Jaccard = المشترك / الاتحاد
+                score = common / (len(grams) + len(self._entries[key].grams) - common)
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (key, score)
+            if best is None:
+                return None
+            self._entries.move_to_end(best[0])
+            return best[0], "similarity", round(best[1], 4)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteQueryLog:
+    """سجل دائم للاستعلامات المخزنة حتى يُبنى الفهرس بعد إعادة التشغيل ويتشاركه عمال gunicorn"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            """CREATE TABLE IF NOT EXISTS semantic_queries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                query TEXT NOT NULL,
+                country TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+
+    def _connection(self):
+        # اتصال مستقل لكل خيط لأن اتصالات SQLite لا تُشارك بين الخيوط
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, key, query, country, platform, max_entries):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # REPLACE يعطي الصف رقماً جديداً فيصل للعمال الآخرين في المزامنة التالية
+            cursor = conn.execute(
+                "INSERT OR REPLACE INTO semantic_queries (key, query, country, platform, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, query, country, platform, time.time()),
+            )
+            conn.execute("DELETE FROM semantic_queries WHERE id <= ?", (cursor.lastrowid - max_entries,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.lastrowid
+
+    def since(self, last_id):
+        """الاستعلامات المضافة بعد last_id بترتيب الإضافة"""
+        return self._connection().execute(
+            "SELECT id, key, query, country, platform FROM semantic_queries WHERE id > ? ORDER BY id", (last_id,)
+        ).fetchall()
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM semantic_queries WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM semantic_queries")
+
+
+class SemanticCache:
+    """إعادة استخدام تحليل محفوظ لاستعلام قريب (ساعة ذكية / ساعات ذكية / smart watch) بدلاً من استدعاء جديد"""
+
+    def __init__(self, cache, index, log=None, threshold=0.85, sync_interval=1.0):
+        self.cache = cache
+        self.index = index
+        self.log = log
+        self.threshold = threshold
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_id = 0
+        self._synced_at = 0.0
+        self.lookups = 0
+        self.misses = 0
+        self.rule_hits = Counter()
+        self._sync()
+
+    def _sync(self):
+        """إضافة الاستعلامات التي خزنتها العمليات الأخرى منذ آخر مزامنة"""
+        if self.log is None:
+            return
+        with self._sync_lock:
+            self._synced_at = time.monotonic()
+            for row_id, key, query, country, platform in self.log.since(self._last_id):
+                self.index.add(key, query, country, platform)
+                self._last_id = row_id
+
+    def lookup(self, query, country, platform):
+        """يرجع (المنتجات، القاعدة، درجة التشابه) أو None"""
+        if self.log is not None and time.monotonic() - self._synced_at >= self.sync_interval:
+            self._sync()
+        country, platform = str(country or "").strip().lower(), str(platform or "").strip().lower()
+        match = self.index.match(query, country, platform, self.threshold)
+        products = None
+        if match is not None:
+            # peek حتى لا تُحسب القراءة إصابة في عدادات كاش النتائج أيضاً
+            entry = self.cache.peek(match[0])
+            if entry is None:
+                # النتيجة انتهت صلاحيتها أو أُخليت من الكاش
+                self.discard(match[0])
+            elif entry[1] == FRESH:
+                # النتيجة القديمة (STALE) لا تُقدم لاستعلام آخر، وتُحدَّث عند طلب مفتاحها نفسه
+                products = entry[0]
+        with self._lock:
+            self.lookups += 1
+            if products is None:
+                self.misses += 1
+            else:
+                self.rule_hits[match[1]] += 1
+        if products is None:
+            return None
+        return products, match[1], match[2]
+
+    def add(self, key, query, country, platform):
+        country, platform = str(country or "").strip().lower(), str(platform or "").strip().lower()
+        self.index.add(key, query, country, platform)
+        if self.log is not None:
+            self.log.append(key, query, country, platform, self.index.max_entries)
+
+    def discard(self, key):
+        self.index.remove(key)
+        if self.log is not None:
+            self.log.delete(key)
+
+    def clear(self):
+        if self.log is not None:
+            self.log.clear()
+        with self._sync_lock:
+            self.index = SemanticIndex(self.index.max_entries)
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self.rule_hits.values())
+            return {
+                "entries": len(self.index),
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+                "rules": {
+                    rule: {
+                        "hits": self.rule_hits[rule],
+                        "hit_rate": round(self.rule_hits[rule] / self.lookups, 4) if self.lookups else 0.0,
+                    }
+                    for rule in [name for name, _ in NORMALIZATION_RULES] + ["similarity"]
+                },
+            }
+
+
+def create_semantic_cache(cache, backend_name="memory", threshold=0.85, max_entries=1024,
+                          sqlite_path="analyzer_semantic.sqlite3"):
+    """إنشاء الكاش الدلالي فوق كاش النتائج حسب نوع التخزين المطلوب"""
+    if backend_name == "sqlite":
+        log = SQLiteQueryLog(sqlite_path)
+    elif backend_name == "memory":
+        log = None
+    else:
+        raise ValueError(f"نوع كاش غير مدعوم: {backend_name}")
+    return SemanticCache(cache, SemanticIndex(max_entries=max_entries), log=log, threshold=threshold)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import json
+from collections.abc import Mapping
+
+from flask.json.provider import DefaultJSONProvider
+
+from product_model import Record
+
+try:
+    import orjson
+except ImportError:  # orjson اختياري، والبديل هو json القياسي
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """مزود JSON لـ jsonify: orjson إن توفر، بدون تهريب النص العربي وبدون ترتيب المفاتيح"""
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def __init__(self, app, encoder="auto"):
+        super().__init__(app)
+        if encoder not in ("auto", "orjson", "json"):
+            raise ValueError(f"مشفر JSON غير مدعوم: {encoder}")
+        if encoder == "orjson" and orjson is None:
+            raise RuntimeError("orjson is not installed")
+        self.use_orjson = orjson is not None and encoder != "json"
+
+    @staticmethod
+    def default(o):
+        # سجلات المنتجات تُسلسل بنفس شكل القاموس الأصلي
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+    @property
+    def encoder_name(self):
+        return "orjson" if self.use_orjson else "json"
+
+    def dumps_bytes(self, obj):
+        """تسلسل مباشر إلى bytes بدون المرور بسلسلة نصية وسيطة"""
+        if self.use_orjson:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            obj, default=self.default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and not kwargs.get("indent"):
+            return self.dumps_bytes(obj).decode("utf-8")
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", False)
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def parse_fields(value):
+    """قراءة معامل fields= كقائمة مسارات (مثل name_ar,profit_analysis.net_profit)"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return None
+    fields = [str(field).strip() for field in value if str(field).strip()]
+    return fields or None
+
+
+_MISSING = object()
+
+
+def project_product(product, fields):
+    """نسخة من المنتج تحتوي الحقول المطلوبة فقط، مع دعم الحقول المتداخلة بالنقطة"""
+    requested = set(fields)
+    projected = {}
+    for field in fields:
+        parts = field.split(".")
+        # الحقل الأب مطلوب كاملاً، فلا داعي لنسخ جزء منه (ولا نعدل الكائن الأصلي)
+        if any(".".join(parts[:i]) in requested for i in range(1, len(parts))):
+            continue
+        source = product
+        for part in parts:
+            source = source.get(part, _MISSING) if isinstance(source, Mapping) else _MISSING
+            if source is _MISSING:
+                break
+        if source is _MISSING:
+            continue
+        target = projected
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = source
+    return projected
+
+
+def project_products(products, fields):
+    if not fields:
+        return products
+    return [project_product(product, fields) for product in products]
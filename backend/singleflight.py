@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """دمج الطلبات المتزامنة لنفس المفتاح في استدعاء واحد"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """ينفذ fn مرة واحدة لكل مفتاح، والطلبات اللاحقة تنتظر نتيجة الطلب الأول"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+            }
+
+
+class AsyncSingleFlight:
+    """نسخة asyncio من SingleFlight داخل حلقة أحداث واحدة"""
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        """ينفذ الدالة غير المتزامنة fn مرة واحدة لكل مفتاح"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # مهمة مستقلة عن الطلب الأول حتى لا يلغي إغلاقه للاتصال النتيجة على بقية المنتظرين
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            self.executed += 1
+            task.add_done_callback(functools.partial(self._finished, key))
+        # shield حتى لا يلغي انسحاب أي منتظر (ومنهم الأول) الطلب المشترك
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # منع تحذير "exception was never retrieved" إذا انسحب كل المنتظرين
+            task.exception()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
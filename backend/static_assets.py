@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import mimetypes
+import os
+import re
+
+from compression import SUPPORTED_ENCODINGS, compress, negotiate_encoding
+
+# مدة التخزين للملفات ذات الروابط المرتبطة بالمحتوى (?v=hash)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_ASSET_REF_RE = re.compile(r'(href|src)="([\w.-]+\.(?:css|js))"')
+
+
+class StaticAsset:
+    """ملف ثابت محمل في الذاكرة مع ETag ونسخ مضغوطة محسوبة مسبقاً"""
+
+    def __init__(self, name, body, content_type=None):
+        self.name = name
+        self.body = body
+        self.content_type = content_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type.endswith("javascript"):
+            self.content_type += "; charset=utf-8"
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        # الملفات الثابتة تضغط مرة واحدة فقط لذلك نستخدم أعلى مستوى ضغط
+        self.encodings = {
+            encoding: compress(body, encoding, level=11 if encoding == "br" else 9)
+            for encoding in SUPPORTED_ENCODINGS
+        }
+
+    def select_encoding(self, accept_encoding):
+        """أفضل ترميز يقبله المتصفح: br ثم gzip ثم بدون ضغط"""
+        encoding = negotiate_encoding(accept_encoding, tuple(self.encodings))
+        if encoding is None:
+            return None, self.body
+        return encoding, self.encodings[encoding]
+
+
+def load_frontend(directory):
+    """تحميل ملفات الواجهة مرة واحدة عند التشغيل وربط index.html بنسخ الملفات المرتبطة بالمحتوى"""
+    assets = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name != "index.html" and os.path.isfile(path):
+            with open(path, "rb") as f:
+                assets[name] = StaticAsset(name, f.read())
+
+    with open(os.path.join(directory, "index.html"), encoding="utf-8") as f:
+        html = f.read()
+
+    def versioned(match):
+        asset = assets.get(match.group(2))
+        if asset is None:
+            return match.group(0)
+        return f'{match.group(1)}="/static/{asset.name}?v={asset.version}"'
+
+    index = StaticAsset("index.html", _ASSET_REF_RE.sub(versioned, html).encode("utf-8"))
+    return index, assets
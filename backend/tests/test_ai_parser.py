@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+
+from ai_parser import IncrementalProductParser, parse_products, repair_json
+
+PRODUCTS = [
+    {"name_ar": "سماعة", "name_en": "Headset", "tips": ["أ", "ب"]},
+    {"name_ar": "قلم \"ذكي\"", "name_en": "Smart {pen}", "profit_analysis": {"purchase_price": 10}},
+    {"name_ar": "كوب", "name_en": "Mug"},
+]
+DOCUMENT = json.dumps({"products": PRODUCTS}, ensure_ascii=False)
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalProductParser()
+    products = []
+    for i in range(0, len(text), size):
+        products += parser.feed(text[i:i + size])
+    return products + parser.finish()
+
+
+def test_repair_closes_open_string_and_brackets():
+    assert repair_json('{"products": [{"name_ar": "سما') == {"products": [{"name_ar": "سما"}]}
+
+
+def test_repair_handles_dangling_key_and_trailing_comma():
+    assert repair_json('{"a": 1, "b":') == {"a": 1, "b": None}
+    assert repair_json('{"a": [1, 2,') == {"a": [1, 2]}
+
+
+def test_repair_falls_back_to_last_complete_element():
+    assert repair_json('{"a": 1, "b": tr') == {"a": 1}
+
+
+def test_parse_products_plain_fenced_and_list_documents():
+    assert parse_products(DOCUMENT) == PRODUCTS
+    assert parse_products(f"```json\n{DOCUMENT}\n```") == PRODUCTS
+    assert parse_products("النتيجة: " + json.dumps(PRODUCTS, ensure_ascii=False)) == PRODUCTS
+    assert parse_products("") == []
+
+
+def test_parse_products_json_lines():
+    text = "\n".join(json.dumps(product, ensure_ascii=False) for product in PRODUCTS)
+    assert parse_products(text) == PRODUCTS
+
+
+def test_parse_products_truncated_keeps_complete_and_partial_product():
+    truncated = DOCUMENT[:DOCUMENT.index('"Mug"') + 3]
+    products = parse_products(truncated)
+    assert products[:2] == PRODUCTS[:2]
+    assert products[2]["name_ar"] == "كوب"
+
+
+def test_incremental_parser_emits_each_product_when_complete():
+    parser = IncrementalProductParser()
+    first_end = DOCUMENT.index("}", DOCUMENT.index('"tips"')) + 1
+    assert parser.feed(DOCUMENT[:first_end - 1]) == []
+    assert parser.feed(DOCUMENT[first_end - 1:first_end]) == PRODUCTS[:1]
+    assert parser.feed(DOCUMENT[first_end:]) == PRODUCTS[1:]
+    assert parser.finish() == []
+
+
+def test_incremental_parser_is_independent_of_chunk_boundaries():
+    for size in (1, 2, 7, 64, len(DOCUMENT)):
+        assert feed_in_chunks(DOCUMENT, size) == PRODUCTS
+
+
+def test_incremental_parser_ignores_nested_objects_and_braces_in_strings():
+    products = feed_in_chunks(DOCUMENT, 5)
+    assert products[1]["profit_analysis"] == {"purchase_price": 10}
+    assert len(products) == 3
+
+
+def test_incremental_parser_finish_salvages_truncated_product():
+    parser = IncrementalProductParser()
+    products = parser.feed('[{"name_ar": "أ"}, {"name_ar": "ب", "name_en": "B')
+    assert products == [{"name_ar": "أ"}]
+    assert parser.finish() == [{"name_ar": "ب", "name_en": "B"}]
+
+
+def test_incremental_parser_skips_objects_without_names():
+    assert feed_in_chunks('[{"x": 1}, {"name_en": "A"}]', 3) == [{"name_en": "A"}]
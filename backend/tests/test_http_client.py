@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from benchmarks.openrouter_stub import PRODUCTS_COMPLETION, start_stub
+from http_client import AsyncOpenRouterClient, CircuitBreaker, CircuitOpenError, OpenRouterClient, OpenRouterError
+
+PAYLOAD = {"model": "m", "messages": [{"role": "user", "content": "x"}]}
+
+
+@pytest.fixture
+def stub():
+    server, url = start_stub(latency=0.0, content=PRODUCTS_COMPLETION)
+    yield server, url
+    server.shutdown()
+
+
+def failing(server, status=503):
+    server.config.error_rate = 1.0
+    server.config.error_status = status
+
+
+def test_retries_count_as_one_breaker_failure(stub):
+    server, url = stub
+    failing(server)
+    breaker = CircuitBreaker(failure_threshold=3)
+    client = OpenRouterClient(url=url, max_retries=2, backoff_base=0.0, breaker=breaker)
+    with pytest.raises(OpenRouterError):
+        client.chat_completion(PAYLOAD, {})
+    assert server.config.stats()["requests"] == 3
+    assert breaker.snapshot()["consecutive_failures"] == 1
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+
+
+def test_non_retryable_status_is_not_a_breaker_failure(stub):
+    server, url = stub
+    failing(server, status=400)
+    breaker = CircuitBreaker(failure_threshold=1)
+    client = OpenRouterClient(url=url, max_retries=2, backoff_base=0.0, breaker=breaker)
+    with pytest.raises(OpenRouterError) as error:
+        client.chat_completion(PAYLOAD, {})
+    assert error.value.status_code == 400
+    assert server.config.stats()["requests"] == 1
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+
+
+def test_any_request_error_resolves_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.0)
+    breaker.record_failure()
+    # رابط غير صالح يرفع InvalidURL وليس ConnectionError أو Timeout
+    client = OpenRouterClient(url="http://[invalid", max_retries=0, breaker=breaker)
+    with pytest.raises(OpenRouterError):
+        client.chat_completion(PAYLOAD, {})
+    assert breaker.snapshot()["state"] == CircuitBreaker.OPEN
+    assert breaker.allow_request()
+
+
+def test_open_breaker_short_circuits_before_sending(stub):
+    server, url = stub
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    breaker.record_failure()
+    client = OpenRouterClient(url=url, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        client.chat_completion(PAYLOAD, {})
+    assert server.config.stats()["requests"] == 0
+
+
+def test_async_retries_count_once_and_cancel_releases_trial(stub):
+    server, url = stub
+    failing(server)
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0.0)
+
+    async def run():
+        client = AsyncOpenRouterClient(url=url, max_retries=2, backoff_base=0.0, breaker=breaker)
+        with pytest.raises(OpenRouterError):
+            await client.chat_completion(PAYLOAD, {})
+        assert breaker.snapshot()["consecutive_failures"] == 1
+
+        breaker.record_failure()
+        breaker.record_failure()
+        server.config.error_rate = 0.0
+        server.config.latency = 1.0
+        task = asyncio.ensure_future(client.chat_completion(PAYLOAD, {}))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+
+    asyncio.run(run())
+    assert breaker.snapshot()["state"] == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+from jobs import JobQueue, JobStore
+from metrics import MetricsRegistry
+
+
+def test_gauge_is_read_at_render_time_and_not_stored():
+    registry = MetricsRegistry()
+    depth = {"queued": 2, "running": 1}
+    registry.gauge("jobs", "Jobs by status", lambda: depth, ("status",))
+    registry.gauge("oldest", "Oldest job age", lambda: 1.5)
+    depth["queued"] = 3
+    text = registry.render()
+    assert 'jobs{status="queued"} 3' in text
+    assert 'jobs{status="running"} 1' in text
+    assert "# TYPE oldest gauge" in text and "oldest 1.5" in text
+    assert registry.snapshot() == {"jobs": [], "oldest": []}
+
+
+def test_failing_gauge_does_not_break_render():
+    registry = MetricsRegistry()
+    registry.counter("requests", "Requests").inc()
+
+    def broken():
+        raise RuntimeError("database is locked")
+
+    registry.gauge("jobs", "Jobs", broken)
+    text = registry.render()
+    assert "requests 1" in text
+    assert "# TYPE jobs gauge" in text
+
+
+class _Analyzer:
+    def search_products(self, query, country, platform):
+        if query == "boom":
+            raise ValueError("boom")
+        return [{"name_ar": query}]
+
+
+def test_job_queue_reports_outcome_and_wait(tmp_path):
+    observed = []
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), _Analyzer(), workers=1, poll_interval=0.01,
+                     observer=lambda outcome, wait: observed.append((outcome, wait)))
+    queue.submit("قلم", "sa", "amazon")
+    queue.submit("boom", "sa", "amazon")
+    queue.start()
+    deadline = time.time() + 2
+    while len(observed) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    queue.stop()
+    assert sorted(outcome for outcome, _ in observed) == [JobStore.DONE, JobStore.FAILED]
+    assert all(wait >= 0 for _, wait in observed)
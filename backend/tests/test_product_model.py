@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from product_model import Marketing, Product
+
+MARKETING = {"platform": "تيك توك", "ad_copy": None, "video_idea": "عرض عملي", "hashtags": None,
+             "ad_budget": "50 ريال/يوم"}
+
+
+@pytest.fixture
+def template():
+    return Product.from_mapping({"id": "amazon-1", "source": "amazon", "tips": ["صور", "فيديو"],
+                                 "profit_analysis": {"purchase_price": 100, "currency": "ريال"},
+                                 "marketing": MARKETING})
+
+
+def test_from_mapping_converts_sections_and_lists(template):
+    assert isinstance(template.marketing, Marketing)
+    assert template.tips == ("صور", "فيديو")
+    assert template["name_ar"] is None
+    with pytest.raises(ValueError):
+        Product.from_mapping({"id": "x", "unknown": 1})
+
+
+def test_filler_matches_replace_and_shares_other_fields(template):
+    fill = template.filler("name_ar", "marketing")
+    fill_marketing = template.marketing.filler("ad_copy", "hashtags")
+    marketing = fill_marketing("إعلان", ("#قلم",))
+    product = fill("قلم", marketing)
+    assert product.to_dict() == template.replace(name_ar="قلم", marketing=marketing).to_dict()
+    assert marketing.to_dict() == dict(MARKETING, ad_copy="إعلان", hashtags=("#قلم",))
+    assert product.profit_analysis is template.profit_analysis
+    assert template.name_ar is None
+    with pytest.raises(ValueError):
+        template.filler("unknown")
+
+
+def test_to_plain_turns_sections_into_dicts(template):
+    plain = template.to_plain()
+    assert type(plain) is dict and type(plain["marketing"]) is dict
+    assert plain["marketing"] == MARKETING
+    assert plain["profit_analysis"]["purchase_price"] == 100
+    assert plain["market_analysis"] is None
+    assert list(plain) == list(Product.FIELDS)
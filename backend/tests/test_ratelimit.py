@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+import ratelimit
+from ratelimit import (MemoryAdmissionStore, OverloadedError, RateLimiter, RUNNING, SQLiteAdmissionStore,
+                       UpstreamGate, WAITING)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(
+        time=fake.time, monotonic=time.monotonic, sleep=time.sleep))
+    return fake
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryAdmissionStore()
+    return SQLiteAdmissionStore(str(tmp_path / "limits.sqlite3"))
+
+
+def test_bucket_allows_burst_then_refills_at_rate(store, clock):
+    limiter = RateLimiter(store, per_minute=60, burst=3)
+    assert [limiter.acquire("a")[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire("a")
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    clock.advance(0.5)
+    assert limiter.acquire("a") == (False, pytest.approx(0.5))
+    clock.advance(0.5)
+    assert limiter.acquire("a") == (True, 0.0)
+    assert limiter.stats()["allowed"] == 4
+    assert limiter.stats()["limited"] == 2
+
+
+def test_bucket_refill_is_capped_at_burst(store, clock):
+    limiter = RateLimiter(store, per_minute=60, burst=2)
+    clock.advance(3600)
+    assert [limiter.acquire("a")[0] for _ in range(3)] == [True, True, False]
+
+
+def test_buckets_are_per_client(store, clock):
+    limiter = RateLimiter(store, per_minute=60, burst=1)
+    assert limiter.acquire("a")[0]
+    assert not limiter.acquire("a")[0]
+    assert limiter.acquire("b")[0]
+
+
+def test_cost_is_charged_in_full(store, clock):
+    limiter = RateLimiter(store, per_minute=60, burst=10)
+    assert limiter.acquire("a", cost=8)[0]
+    allowed, retry_after = limiter.acquire("a", cost=5)
+    assert not allowed
+    assert retry_after == pytest.approx(3.0)
+    assert limiter.acquire("a", cost=2)[0]
+
+
+def test_cost_above_burst_is_rejected_not_discounted(store):
+    limiter = RateLimiter(store, per_minute=60, burst=20)
+    assert limiter.max_cost == 20
+    with pytest.raises(ValueError):
+        limiter.acquire("a", cost=21)
+
+
+def test_disabled_limiter_allows_everything(store):
+    limiter = RateLimiter(store, per_minute=0, burst=1)
+    assert limiter.max_cost == float("inf")
+    assert all(limiter.acquire("a", cost=1000)[0] for _ in range(5))
+
+
+def test_store_admits_in_order_and_rejects_when_queue_is_full(store):
+    assert store.enter("h1", 1, 1, lease=60) == RUNNING
+    assert store.enter("h2", 1, 1, lease=60) == WAITING
+    assert store.enter("h3", 1, 1, lease=60) == ratelimit.REJECTED
+    assert not store.promote("h2", 1, lease=60)
+    store.leave("h1")
+    assert store.promote("h2", 1, lease=60)
+    assert store.gate_counts(lease=60) == (1, 0)
+
+
+def test_store_expires_abandoned_slots_after_lease(store, clock):
+    assert store.enter("h1", 1, 0, lease=60) == RUNNING
+    assert store.enter("h2", 1, 0, lease=60) == ratelimit.REJECTED
+    clock.advance(61)
+    assert store.enter("h2", 1, 0, lease=60) == RUNNING
+
+
+def test_gate_queues_then_admits_when_slot_frees(store):
+    gate = UpstreamGate(store, max_inflight=1, max_queued=1, queue_timeout=5.0, poll_interval=0.005)
+    release = threading.Event()
+    entered = threading.Event()
+
+    def hold():
+        with gate.admit():
+            entered.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    assert entered.wait(5)
+    admitted = []
+
+    def wait_turn():
+        with gate.admit():
+            admitted.append(gate.stats()["in_flight"])
+
+    waiter = threading.Thread(target=wait_turn)
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while gate.stats()["queued"] != 1 and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    with pytest.raises(OverloadedError):
+        with gate.admit():
+            pass
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert admitted == [1]
+    stats = gate.stats()
+    assert stats["admitted"] == 2
+    assert stats["shed"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_gate_sheds_after_queue_timeout(store):
+    gate = UpstreamGate(store, max_inflight=1, max_queued=1, queue_timeout=0.05, poll_interval=0.005,
+                        retry_after=7.0)
+    with gate.admit():
+        with pytest.raises(OverloadedError) as error:
+            with gate.admit():
+                pass
+    assert error.value.retry_after == 7.0
+    assert gate.stats()["in_flight"] == 0
+
+
+def test_gate_async_releases_slot(store):
+    gate = UpstreamGate(store, max_inflight=1, max_queued=0, poll_interval=0.005)
+
+    async def run():
+        async with gate.admit_async():
+            assert gate.stats()["in_flight"] == 1
+            with pytest.raises(OverloadedError):
+                async with gate.admit_async():
+                    pass
+        async with gate.admit_async():
+            pass
+
+    asyncio.run(run())
+    stats = gate.stats()
+    assert (stats["in_flight"], stats["queued"], stats["admitted"], stats["shed"]) == (0, 0, 2, 1)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import pytest
+
+from benchmarks.openrouter_stub import PRODUCTS_COMPLETION, start_stub
+from http_client import CircuitBreaker, CircuitOpenError, OpenRouterClient, OpenRouterError
+from routing import FAILOVER, HEDGE, PRIMARY, ModelRouter, parse_models
+
+SLOW = 0.5
+
+
+class Observer:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, model, role, outcome, seconds):
+        with self.lock:
+            self.calls.append((model, role, outcome))
+
+
+def make_router(models=("a", "b"), samples=20, latency=0.02, **options):
+    options.setdefault("hedge_min_samples", samples)
+    options.setdefault("hedge_min_delay", 0.0)
+    router = ModelRouter(list(models), observer=Observer(), **options)
+    for i in range(samples):
+        for rank, model in enumerate(models):
+            router.record_success(model, latency * (rank + 1))
+    router.observer.calls.clear()
+    return router
+
+
+def sync_send(latencies, errors=()):
+    started = {}
+
+    def send(payload, headers, cancel=None):
+        model = payload["model"]
+        started[model] = time.perf_counter()
+        if model in errors:
+            raise errors[model] if isinstance(errors, dict) else OpenRouterError("503", status_code=503)
+        time.sleep(latencies.get(model, 0.0))
+        return {"model": model}
+
+    return send, started
+
+
+def state(router, model):
+    return router.models[model].breaker.snapshot()["state"]
+
+
+def test_ranking_prefers_fastest_then_untried_before_failed():
+    router = ModelRouter(["slow", "fast", "mid"])
+    for _ in range(5):
+        router.record_success("slow", 0.3)
+        router.record_success("fast", 0.1)
+        router.record_success("mid", 0.2)
+    assert router.choose() == "fast"
+    assert [stats.name for stats in router._ranked()] == ["fast", "mid", "slow"]
+
+    router = ModelRouter(["known", "new", "broken"])
+    router.record_success("known", 0.1)
+    router.record_failure("broken")
+    assert [stats.name for stats in router._ranked()] == ["new", "known", "broken"]
+
+
+def test_choose_skips_open_breakers_and_select_raises_when_all_open():
+    router = ModelRouter(["a", "b"], failure_threshold=1)
+    router.record_success("a", 0.01)
+    router.record_success("b", 0.02)
+    router.record_failure("a")
+    assert router.choose() == "b"
+    router.record_failure("b")
+    with pytest.raises(CircuitOpenError):
+        router.select()
+
+
+def test_hedge_delay_is_the_model_quantile_after_min_samples():
+    router = ModelRouter(["a", "b"], hedge=True, hedge_min_samples=20, hedge_quantile=0.95, hedge_min_delay=0.0)
+    for i in range(19):
+        router.record_success("a", (i + 1) / 100)
+    assert router.hedge_delay("a") is None
+    router.record_success("a", 0.20)
+    assert router.hedge_delay("a") == pytest.approx(0.19)
+    assert ModelRouter(["a"], hedge=True).hedge is False
+
+
+def test_fast_primary_sends_no_hedge():
+    router = make_router(hedge=True)
+    send, started = sync_send({"a": 0.0})
+    assert router.complete(send, {}, {}) == {"model": "a"}
+    assert list(started) == ["a"]
+    assert router.stats()["hedging"]["sent"] == 0
+
+
+def test_hedge_fires_after_quantile_delay_and_wins():
+    router = make_router(hedge=True)
+    delay = router.hedge_delay("a")
+    send, started = sync_send({"a": SLOW, "b": 0.0})
+    begin = time.perf_counter()
+    assert router.complete(send, {}, {}) == {"model": "b"}
+    elapsed = time.perf_counter() - begin
+
+    assert started["b"] - started["a"] >= delay
+    assert elapsed < SLOW
+    hedging = router.stats()["hedging"]
+    assert (hedging["sent"], hedging["won"]) == (1, 1)
+    assert ("b", HEDGE, "success") in router.observer.calls
+
+
+def test_sync_loser_is_dropped_and_recorded_as_lost():
+    router = make_router(hedge=True)
+    send, _ = sync_send({"a": 0.2, "b": 0.0})
+    assert router.complete(send, {}, {}) == {"model": "b"}
+    router._executor.shutdown(wait=True)
+
+    assert ("a", PRIMARY, "lost") in router.observer.calls
+    # الخاسر نجح فعلاً: قاطعه مغلق وزمنه يدخل في الترتيب
+    assert state(router, "a") == CircuitBreaker.CLOSED
+    assert router.models["a"].successes == 21
+    assert router.stats()["hedging"]["won"] == 1
+
+
+def test_hedge_winner_stops_loser_retries():
+    server, url = start_stub(content=PRODUCTS_COMPLETION,
+                             models={"a": {"latency": 0.2, "error_rate": 1.0}, "b": {"latency": 0.0}})
+    try:
+        router = make_router(hedge=True)
+        client = OpenRouterClient(url=url, max_retries=3, backoff_base=0.2)
+        result = router.complete(client.chat_completion, {"messages": []}, {})
+        assert result["choices"]
+        # الطلب الخاسر ينتهي بخطأ 503 بعد فوز b، ولا يعيد المحاولة بعده
+        deadline = time.time() + 2
+        while ("a", PRIMARY, "cancelled") not in router.observer.calls and time.time() < deadline:
+            time.sleep(0.01)
+        assert ("a", PRIMARY, "cancelled") in router.observer.calls
+        assert server.config.model_stats() == {"a": 1, "b": 1}
+        assert router.models["a"].failures == 0
+        assert client.breaker.snapshot()["total_failures"] == 0
+    finally:
+        server.shutdown()
+
+
+def test_budget_refusal_sends_no_hedge():
+    router = make_router(hedge=True)
+    send, started = sync_send({"a": 0.1, "b": 0.0})
+    asked = []
+
+    def allow_hedge():
+        asked.append(True)
+        return False
+
+    assert router.complete(send, {}, {}, allow_hedge=allow_hedge) == {"model": "a"}
+    assert asked == [True]
+    assert list(started) == ["a"]
+    assert router.stats()["hedging"]["sent"] == 0
+
+
+def test_hedge_not_sent_without_a_healthy_alternate():
+    router = make_router(hedge=True, failure_threshold=1)
+    router.record_failure("b")
+    send, started = sync_send({"a": 0.1})
+    assert router.complete(send, {}, {}, allow_hedge=lambda: pytest.fail("budget asked")) == {"model": "a"}
+    assert list(started) == ["a"]
+
+
+def test_primary_error_fails_over_once_to_alternate():
+    router = make_router()
+    send, started = sync_send({}, errors=("a",))
+    assert router.complete(send, {}, {}) == {"model": "b"}
+    assert list(started) == ["a", "b"]
+    assert ("a", PRIMARY, "error") in router.observer.calls
+    assert ("b", FAILOVER, "success") in router.observer.calls
+    assert router.stats()["failover"] == {"sent": 1, "won": 1}
+
+
+def test_failover_error_is_raised_without_further_attempts():
+    router = make_router(models=("a", "b", "c"))
+    send, started = sync_send({}, errors=("a", "b", "c"))
+    with pytest.raises(OpenRouterError):
+        router.complete(send, {}, {})
+    assert list(started) == ["a", "b"]
+
+
+def test_both_hedged_attempts_failing_raises_without_failover():
+    router = make_router(models=("a", "b", "c"), hedge=True)
+    calls = []
+
+    def send(payload, headers, cancel=None):
+        calls.append(payload["model"])
+        if payload["model"] == "a":
+            time.sleep(0.1)
+        raise OpenRouterError("503", status_code=503)
+
+    with pytest.raises(OpenRouterError):
+        router.complete(send, {}, {})
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_client_circuit_open_releases_trial_without_failover():
+    router = make_router(failure_threshold=1, recovery_timeout=0.01)
+    router.record_failure("a")
+    time.sleep(0.02)
+    assert state(router, "a") == CircuitBreaker.OPEN
+
+    calls = []
+
+    def send(payload, headers, cancel=None):
+        calls.append(payload["model"])
+        raise CircuitOpenError("OpenRouter circuit breaker is open")
+
+    with pytest.raises(CircuitOpenError):
+        router.complete(send, {}, {})
+    assert calls == ["a"]
+    # الطلب التجريبي لم يُرسل فيبقى متاحاً للطلب التالي
+    assert state(router, "a") == CircuitBreaker.HALF_OPEN
+    assert router.choose() == "a"
+
+
+def test_recovered_model_trial_failure_is_hidden_by_failover():
+    router = make_router(failure_threshold=1, recovery_timeout=0.01)
+    router.record_failure("a")
+    time.sleep(0.02)
+    send, started = sync_send({}, errors=("a",))
+    assert router.complete(send, {}, {}) == {"model": "b"}
+    assert state(router, "a") == CircuitBreaker.OPEN
+
+
+def test_async_hedge_cancels_loser_and_releases_half_open_trial():
+    router = make_router(hedge=True, samples=3, hedge_min_samples=2, failure_threshold=1, recovery_timeout=0.05)
+    router.record_failure("a")
+    time.sleep(0.06)
+    cancelled = []
+
+    async def send(payload, headers):
+        if payload["model"] == "a":
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append("a")
+                raise
+        return {"model": payload["model"]}
+
+    async def run():
+        result = await router.complete_async(send, {}, {})
+        # الطلب التجريبي يُحرر فور الإلغاء دون انتظار الحلقة
+        assert router.models["a"].breaker._trial_in_flight is False
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == {"model": "b"}
+    assert cancelled == ["a"]
+    assert ("a", PRIMARY, "cancelled") in router.observer.calls
+    assert state(router, "a") == CircuitBreaker.HALF_OPEN
+    assert router.choose() == "a"
+
+
+def test_async_budget_refusal_and_failover():
+    router = make_router(hedge=True)
+
+    async def send(payload, headers):
+        if payload["model"] == "a":
+            await asyncio.sleep(0.1)
+            raise OpenRouterError("503", status_code=503)
+        return {"model": payload["model"]}
+
+    assert asyncio.run(router.complete_async(send, {}, {}, allow_hedge=lambda: False)) == {"model": "b"}
+    stats = router.stats()
+    assert stats["hedging"]["sent"] == 0
+    assert stats["failover"] == {"sent": 1, "won": 1}
+
+
+def test_async_cancelled_caller_releases_trial():
+    router = make_router(failure_threshold=1, recovery_timeout=0.01)
+    router.record_failure("a")
+    time.sleep(0.02)
+
+    async def send(payload, headers):
+        await asyncio.sleep(1)
+
+    async def run():
+        task = asyncio.ensure_future(router.complete_async(send, {}, {}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert router.choose() == "a"
+
+
+def test_parse_models():
+    assert parse_models(" a, b ,a,, c ") == ["a", "b", "c"]
+    assert parse_models("") == []
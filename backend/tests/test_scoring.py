@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from scoring import columns_from_rows, score_columns
+
+ANALYZED = {
+    "name_ar": "قلم",
+    "profit_analysis": {"purchase_price": 100, "suggested_price": 200, "total_costs": 30.0, "currency": "ريال"},
+    "marketing": {"ad_budget": "60 ريال/يوم"},
+    "market_analysis": {"competition": "منخفض"},
+}
+
+
+def test_columns_from_flat_rows_use_defaults():
+    columns = columns_from_rows([{"purchase_price": 10, "suggested_price": 30}])
+    assert columns == {"purchase_price": [10], "suggested_price": [30], "costs": [0.0], "shipping_days": [0.0],
+                       "ad_budget": [0.0], "competition": [1]}
+
+
+def test_columns_from_analyze_products_read_nested_sections():
+    columns = columns_from_rows([ANALYZED])
+    assert columns["purchase_price"] == [100]
+    assert columns["suggested_price"] == [200]
+    assert columns["costs"] == [30.0]
+    assert columns["ad_budget"] == [60.0]
+    assert columns["competition"] == ["منخفض"]
+
+
+def test_flat_fields_override_nested_and_unknown_text_uses_default():
+    row = dict(ANALYZED, market_analysis={"competition": "متوسط إلى عالي"}, shipping_days=7, costs=5)
+    columns = columns_from_rows([row])
+    assert columns["competition"] == [1]
+    assert columns["shipping_days"] == [7]
+    assert columns["costs"] == [5]
+
+
+def test_analyze_products_score_like_flat_rows():
+    flat = {"purchase_price": 100, "suggested_price": 200, "costs": 30.0, "ad_budget": 60.0, "competition": 0}
+    assert score_columns(columns_from_rows([ANALYZED])) == score_columns(columns_from_rows([flat]))
+
+
+def test_missing_prices_are_rejected():
+    with pytest.raises(ValueError):
+        columns_from_rows([{"profit_analysis": {"suggested_price": 10}}])
+    with pytest.raises(ValueError):
+        columns_from_rows(["not a product"])
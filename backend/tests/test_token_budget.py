@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import math
+import types
+
+import pytest
+
+import prompts
+import ratelimit
+from prompts import (MESSAGE_OVERHEAD_TOKENS, OUTPUT_TOKENS, PRODUCT_OVERHEAD_TOKENS, REPLY_OVERHEAD_TOKENS,
+                     RESPONSE_OVERHEAD_TOKENS, PromptBuilder, estimate_messages_tokens, estimate_tokens)
+from ratelimit import BudgetExceededError, MemoryAdmissionStore, SQLiteAdmissionStore, TokenBudget
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def budget(request, tmp_path, clock):
+    store = MemoryAdmissionStore() if request.param == "memory" else SQLiteAdmissionStore(
+        str(tmp_path / "limits.sqlite3"))
+    return TokenBudget(store, per_minute=6000)
+
+
+@pytest.fixture
+def heuristic(monkeypatch):
+    monkeypatch.setattr(prompts, "_encoding", lambda: None)
+
+
+def test_reserve_until_exhausted_then_refill(budget, clock):
+    assert budget.reserve(4000) == 4000
+    assert budget.reserve(2000) == 2000
+    with pytest.raises(BudgetExceededError) as error:
+        budget.reserve(1000)
+    # 6000 tokens في الدقيقة = 100 في الثانية
+    assert error.value.retry_after == pytest.approx(10.0)
+    clock[0] += 10
+    assert budget.reserve(1000) == 1000
+    assert budget.stats()["reserved_tokens"] == 7000
+    assert budget.stats()["exhausted"] == 1
+
+
+def test_settle_refunds_unused_reservation(budget):
+    reserved = budget.reserve(5000)
+    budget.settle(reserved, 1200)
+    assert budget.reserve(4800) == 4800
+    with pytest.raises(BudgetExceededError):
+        budget.reserve(1)
+    assert budget.stats()["used_tokens"] == 1200
+
+
+def test_settle_over_reservation_takes_nothing_extra(budget):
+    budget.settle(budget.reserve(1000), 1500)
+    assert budget.reserve(5000) == 5000
+    assert budget.stats()["used_tokens"] == 1500
+
+
+def test_refund_never_exceeds_capacity(budget):
+    budget.settle(budget.reserve(6000), 0)
+    budget.settle(0, 0)
+    assert budget.reserve(6000) == 6000
+    with pytest.raises(BudgetExceededError):
+        budget.reserve(1)
+
+
+def test_oversized_request_is_capped_at_capacity(budget):
+    assert budget.reserve(10000) == 6000
+    with pytest.raises(BudgetExceededError):
+        budget.reserve(1)
+
+
+def test_disabled_budget_reserves_nothing():
+    budget = TokenBudget(MemoryAdmissionStore(), per_minute=0)
+    assert not budget.enabled
+    assert budget.reserve(10 ** 9) == 0
+    budget.settle(0, 100)
+    assert budget.stats()["used_tokens"] == 0
+
+
+def test_estimate_tokens_heuristic(heuristic):
+    assert estimate_tokens("") == 0
+    # 8 حروف عربية / 2.0 + 7 حروف أخرى (مسافتان و "watch") / 3.5
+    assert estimate_tokens("ساعة ذكية watch") == math.ceil(8 / 2.0 + 7 / 3.5)
+    assert estimate_tokens("a" * 35) == 10
+
+
+def test_estimate_messages_adds_chat_overhead(heuristic):
+    messages = [{"role": "system", "content": "a" * 35}, {"role": "user", "content": ""}]
+    assert estimate_messages_tokens(messages) == 10 + 2 * MESSAGE_OVERHEAD_TOKENS + REPLY_OVERHEAD_TOKENS
+
+
+def test_output_tokens_follow_fields_and_count():
+    builder = PromptBuilder(product_count=3, fields=("name_ar", "profit_analysis"), output_margin=1.25)
+    assert builder.fields == ("name_ar", "name_en", "profit_analysis")
+    per_product = PRODUCT_OVERHEAD_TOKENS + OUTPUT_TOKENS["name_ar"] + OUTPUT_TOKENS["name_en"] \
+        + OUTPUT_TOKENS["profit_analysis"]
+    assert builder.max_tokens == math.ceil(per_product * 3 * 1.25) + RESPONSE_OVERHEAD_TOKENS
+    assert builder.output_tokens(1) < builder.output_tokens(5)
+    assert PromptBuilder(product_count=50, max_tokens=2000).max_tokens == 2000
+
+
+def test_prompt_includes_only_selected_fields_and_truncates_query():
+    builder = PromptBuilder(fields=("name_ar", "profit_analysis"), max_query_chars=10)
+    system, user = builder.messages("  سماعات   لاسلكية بلوتوث مقاومة للماء ", "sa", "أمازون")
+    assert system["role"] == "system"
+    assert "سماعات لاس" in user["content"] and "لاسلكية" not in user["content"]
+    assert '"profit_analysis"' in user["content"] and '"marketing"' not in user["content"]
+    with pytest.raises(ValueError):
+        PromptBuilder(fields=("unknown",))
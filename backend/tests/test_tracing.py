@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import SamplingProfiler
+from tracing import TraceIdFilter, Tracer, current_trace_id, parse_trace_header
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def by_name(self):
+        return {span.name: span for span in self.spans}
+
+
+def test_parse_trace_header():
+    assert parse_trace_header(traceparent=f"00-{TRACE_ID}-b7ad6b7169203331-01") == (TRACE_ID, "b7ad6b7169203331", True)
+    assert parse_trace_header(traceparent=f"00-{TRACE_ID}-b7ad6b7169203331-00")[2] is False
+    assert parse_trace_header(trace_id=TRACE_ID.upper()) == (TRACE_ID, None, False)
+    assert parse_trace_header(trace_id="not-a-trace", traceparent="garbage") == (None, None, False)
+
+
+def test_trace_sets_and_resets_current_trace_id():
+    tracer = Tracer(ListExporter())
+    span, tokens = tracer.start_trace("GET /", trace_id=TRACE_ID)
+    assert current_trace_id() == TRACE_ID
+    tracer.end_trace(span, tokens)
+    assert current_trace_id() is None
+    assert tracer.exporter.spans == [span]
+
+
+def test_nested_spans_record_parents_and_errors():
+    tracer = Tracer(ListExporter())
+    root, tokens = tracer.start_trace("POST /api/analyze", trace_id=TRACE_ID, parent_id="b7ad6b7169203331")
+    with tracer.span("search_products", country="sa") as search:
+        try:
+            with tracer.span("openrouter"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+    tracer.end_trace(root, tokens)
+
+    spans = tracer.exporter.by_name()
+    assert root.parent_id == "b7ad6b7169203331"
+    assert search.parent_id == root.span_id
+    assert search.attributes == {"country": "sa"}
+    assert spans["openrouter"].parent_id == search.span_id
+    assert spans["openrouter"].error == "ValueError: boom"
+    assert {span.trace_id for span in tracer.exporter.spans} == {TRACE_ID}
+
+
+def test_unsampled_request_keeps_trace_id_without_spans():
+    tracer = Tracer(ListExporter(), sample_rate=0.0)
+    root, tokens = tracer.start_trace("GET /", trace_id=TRACE_ID)
+    with tracer.span("search_products") as span:
+        assert current_trace_id() == TRACE_ID
+        assert span.span_id is None
+    tracer.end_trace(root, tokens)
+    assert tracer.exporter.spans == []
+
+    root, tokens = tracer.start_trace("GET /", force=True)
+    tracer.end_trace(root, tokens)
+    assert len(tracer.exporter.spans) == 1
+
+
+def test_disabled_tracer_still_assigns_trace_id():
+    tracer = Tracer()
+    root, tokens = tracer.start_trace("GET /")
+    assert len(current_trace_id()) == 32
+    tracer.end_trace(root, tokens)
+
+
+def test_context_propagates_to_executor_threads_with_copy_context():
+    tracer = Tracer(ListExporter())
+    root, tokens = tracer.start_trace("GET /api/analyze", trace_id=TRACE_ID)
+
+    def search(platform):
+        with tracer.span(f"search {platform}"):
+            return current_trace_id(), threading.current_thread().name
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="fanout") as executor:
+        copied = [executor.submit(contextvars.copy_context().run, search, p) for p in ("amazon", "noon")]
+        results = [future.result() for future in copied]
+        # بدون نسخ السياق لا يرى الخيط رقم تتبع الطلب
+        assert executor.submit(current_trace_id).result() is None
+    tracer.end_trace(root, tokens)
+
+    assert all(trace_id == TRACE_ID for trace_id, _ in results)
+    assert all(thread.startswith("fanout") for _, thread in results)
+    spans = tracer.exporter.by_name()
+    assert spans["search amazon"].parent_id == root.span_id
+    assert spans["search noon"].parent_id == root.span_id
+
+
+def test_context_propagates_to_asyncio_tasks_and_threads():
+    tracer = Tracer(ListExporter())
+
+    async def handle():
+        root, tokens = tracer.start_trace("POST /api/analyze", trace_id=TRACE_ID)
+        try:
+            async def child():
+                with tracer.span("task"):
+                    return current_trace_id()
+
+            in_task = await asyncio.ensure_future(child())
+            in_thread = await asyncio.to_thread(current_trace_id)
+            return root, in_task, in_thread
+        finally:
+            tracer.end_trace(root, tokens)
+
+    root, in_task, in_thread = asyncio.run(handle())
+    assert in_task == in_thread == TRACE_ID
+    assert tracer.exporter.by_name()["task"].parent_id == root.span_id
+
+
+def test_end_trace_in_another_context_does_not_raise():
+    tracer = Tracer(ListExporter())
+    root, tokens = tracer.start_trace("GET /stream", trace_id=TRACE_ID)
+    contextvars.Context().run(tracer.end_trace, root, tokens)
+    assert root.duration_ms is not None
+    tracer.end_trace(root, tokens)
+    assert len(tracer.exporter.spans) == 1
+
+
+def test_trace_id_filter_adds_trace_id_to_records():
+    tracer = Tracer()
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "msg", (), None)
+    TraceIdFilter().filter(record)
+    assert record.trace_id == "-"
+    root, tokens = tracer.start_trace("GET /", trace_id=TRACE_ID)
+    TraceIdFilter().filter(record)
+    tracer.end_trace(root, tokens)
+    assert record.trace_id == TRACE_ID
+
+
+def busy_work(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+def test_profiler_samples_the_profiled_thread(tmp_path):
+    profiler = SamplingProfiler(interval=0.001).start()
+    busy_work(0.1)
+    samples = profiler.stop()
+
+    assert sum(samples.values()) > 5
+    assert any("busy_work (test_tracing.py:" in stack for stack in samples)
+    # العينات من الخيط المطلوب فقط وليس من خيط البروفايلر نفسه
+    assert all("_sample_loop" not in stack for stack in samples)
+    lines = profiler.collapsed().splitlines()
+    assert len(lines) == len(samples)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert samples[stack] == int(count) == max(samples.values())
+
+    path = profiler.dump(str(tmp_path / "profiles" / "request.collapsed"))
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == profiler.collapsed()
+
+
+def test_profiler_stops_when_thread_exits():
+    ready = threading.Event()
+    worker = threading.Thread(target=ready.wait, args=(5,))
+    worker.start()
+    profiler = SamplingProfiler(thread_id=worker.ident, interval=0.001).start()
+    ready.set()
+    worker.join()
+    profiler._thread.join(2)
+    assert not profiler._thread.is_alive()
+    profiler.stop()
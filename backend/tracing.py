@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_current_trace_id = contextvars.ContextVar("trace_id", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+_TRACE_ID_RE = re.compile(r"^[0-9a-f]{16,32}$")
+
+
+def current_trace_id():
+    return _current_trace_id.get()
+
+
+def parse_trace_header(trace_id=None, traceparent=None):
+    """رقم التتبع من X-Trace-Id أو traceparent (W3C)، ويرجع (trace_id, parent_id, sampled)"""
+    if traceparent:
+        parts = traceparent.strip().lower().split("-")
+        if len(parts) == 4 and _TRACE_ID_RE.match(parts[1]) and len(parts[2]) == 16:
+            return parts[1], parts[2], parts[3] == "01"
+    if trace_id and _TRACE_ID_RE.match(trace_id.strip().lower()):
+        return trace_id.strip().lower(), None, False
+    return None, None, False
+
+
+class Span:
+    """خطوة واحدة في مسار الطلب مع زمنها وخصائصها"""
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self._started) * 1000
+            self.tracer.exporter.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "thread": threading.current_thread().name,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """خطوة لا تسجل شيئاً عندما لا يكون الطلب ضمن العينة"""
+
+    trace_id = span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """تتبع اختياري: رقم تتبع لكل طلب دائماً، وخطوات مسجلة فقط للطلبات ضمن العينة"""
+
+    def __init__(self, exporter=None, sample_rate=1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def start_trace(self, name, trace_id=None, parent_id=None, force=False, **attributes):
+        """بداية طلب جديد، ويرجع (span, tokens) لتمريرها إلى end_trace"""
+        trace_id = trace_id or uuid.uuid4().hex
+        sampled = self.enabled and (force or random.random() < self.sample_rate)
+        span = Span(self, name, trace_id, parent_id, attributes) if sampled else _NOOP_SPAN
+        tokens = (_current_trace_id.set(trace_id), _current_span.set(span if sampled else None))
+        return span, tokens
+
+    @staticmethod
+    def end_trace(span, tokens, error=None):
+        if error is not None and isinstance(span, Span):
+            span.error = str(error)
+        span.end()
+        try:
+            _current_span.reset(tokens[1])
+            _current_trace_id.reset(tokens[0])
+        except ValueError:
+            # انتهى الطلب في سياق مختلف عن بدايته (مثلاً بعد رد متدفق)
+            pass
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """خطوة فرعية داخل الطلب الحالي، وبدون أي تكلفة تقريباً إن لم يكن الطلب ضمن العينة"""
+        parent = _current_span.get()
+        if parent is None:
+            yield _NOOP_SPAN
+            return
+        span = Span(self, name, parent.trace_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+
+class FileSpanExporter:
+    """كتابة كل خطوة كسطر JSON في ملف محلي"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class HTTPSpanExporter:
+    """إرسال الخطوات على دفعات إلى collector عبر POST من خيط خلفي حتى لا يتأخر الطلب"""
+
+    def __init__(self, url, batch_size=100, flush_interval=1.0, max_queue=10000, timeout=2):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._send_loop, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            # لا نوقف الطلبات إذا كان الـ collector بطيئاً أو متوقفاً
+            self.dropped += 1
+
+    def _send_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._session.post(self.url, json={"spans": batch}, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.dropped += len(batch)
+                logger.warning("⚠️ فشل إرسال خطوات التتبع: %s", e)
+
+
+def create_span_exporter(target):
+    """TRACE_EXPORT: فارغ (معطل) أو رابط http(s) لـ collector أو مسار ملف JSON Lines"""
+    if not target:
+        return None
+    if target.startswith(("http://", "https://")):
+        return HTTPSpanExporter(target)
+    return FileSpanExporter(target)
+
+
+class TraceIdFilter(logging.Filter):
+    """إضافة رقم تتبع الطلب الحالي لكل سطر في السجل (%(trace_id)s)"""
+
+    def filter(self, record):
+        record.trace_id = _current_trace_id.get() or "-"
+        return True
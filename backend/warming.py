@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from cache import make_cache_key
+from product_model import AI_SOURCE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def parse_hours(value):
+    """نافذة ساعات خارج الذروة بصيغة 2-6 (أو 22-4 عبر منتصف الليل)، والقيمة الفارغة = كل الساعات"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    start, _, end = value.partition("-")
+    return int(start) % 24, int(end or start) % 24
+
+
+def in_hours(hours, hour):
+    if hours is None:
+        return True
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def load_hot_queries(path):
+    """قائمة الاستعلامات الساخنة من ملف JSON بصيغة {"sa": ["ساعة ذكية", ...], "eg": [...]}"""
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        str(country).strip().lower(): [str(query).strip() for query in queries if str(query).strip()]
+        for country, queries in data.items()
+    }
+
+
+class QueryStats:
+    """عدد طلبات كل استعلام لكل سوق في SQLite، يُجمع في الذاكرة ويُكتب دفعة واحدة كل flush_interval"""
+
+    def __init__(self, path, flush_interval=30.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._flushed_at = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS query_hits (
+                country TEXT NOT NULL,
+                query TEXT NOT NULL,
+                hits INTEGER NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (country, query)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_query_hits_last_seen ON query_hits(last_seen)")
+
+    def _connection(self):
+        # اتصال مستقل لكل خيط لأن اتصالات SQLite لا تُشارك بين الخيوط
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, query, country):
+        query = " ".join(str(query or "").split())
+        if not query:
+            return
+        with self._lock:
+            self._pending[(str(country or "").strip().lower(), query)] += 1
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO query_hits (country, query, hits, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (country, query) DO UPDATE SET hits = hits + excluded.hits, last_seen = excluded.last_seen",
+                [(country, query, hits, now) for (country, query), hits in pending.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def top(self, country, limit, window_seconds):
+        """أكثر الاستعلامات طلباً في السوق خلال آخر window_seconds"""
+        self.flush()
+        rows = self._connection().execute(
+            "SELECT query FROM query_hits WHERE country = ? AND last_seen >= ? ORDER BY hits DESC LIMIT ?",
+            (country, time.time() - window_seconds, limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, older_than):
+        cursor = self._connection().execute("DELETE FROM query_hits WHERE last_seen < ?", (time.time() - older_than,))
+        return cursor.rowcount
+
+
+class CacheWarmer:
+    """حساب تحليلات الاستعلامات الساخنة مسبقاً خارج الذروة بمعدل محدود حتى تصبح طلبات الذروة إصابات كاش"""
+
+    def __init__(self, analyzer, hot_queries=None, query_stats=None, countries=(), top_n=50,
+                 stats_window=3 * 86400, rate_per_minute=30, ttl_seconds=86400, hours=None,
+                 interval=3600, lock_path=None):
+        self.analyzer = analyzer
+        self.hot_queries = hot_queries or {}
+        self.query_stats = query_stats
+        self.countries = list(countries)
+        self.top_n = top_n
+        self.stats_window = stats_window
+        self.rate_per_minute = rate_per_minute
+        self.ttl_seconds = ttl_seconds
+        self.hours = hours
+        self.interval = interval
+        self.lock_path = lock_path
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.running = False
+        self.cycles = 0
+        self.last_run = None
+        self.last_summary = None
+
+    def targets(self, countries=None, from_stats=True):
+        """(الاستعلام، السوق) من القائمة المضبوطة ثم الأكثر طلباً مؤخراً، بدون تكرار"""
+        countries = countries or self.countries or list(self.hot_queries)
+        seen = set()
+        targets = []
+        for country in countries:
+            queries = list(self.hot_queries.get(country, []))
+            if from_stats and self.query_stats is not None and self.top_n > 0:
+                queries += self.query_stats.top(country, self.top_n, self.stats_window)
+            for query in queries:
+                key = make_cache_key(query, country, "")
+                if key not in seen:
+                    seen.add(key)
+                    targets.append((query, country))
+        return targets
+
+    def warm(self, targets, force=False, platforms=None):
+        """تحليل كل استعلام لكل منصة وتخزينه، مع تخطي المدخلات التي ما زالت صالحة لنصف مدة التخزين"""
+        cache = self.analyzer.cache
+        platforms = platforms or self.analyzer.fanout_platforms
+        delay = 60.0 / self.rate_per_minute if self.rate_per_minute > 0 else 0.0
+        summary = {"targets": len(targets), "warmed": 0, "fresh": 0, "failed": 0}
+        with self._lock:
+            self.running = True
+        try:
+            for query, country in targets:
+                for platform in platforms:
+                    if self._stop.is_set():
+                        return summary
+                    cache_key = make_cache_key(query, country, platform)
+                    remaining = cache.expires_in(cache_key)
+                    if not force and remaining is not None and remaining >= self.ttl_seconds / 2:
+                        summary["fresh"] += 1
+                        continue
+                    try:
+                        products = self.analyzer.refresh(query, country, platform, ttl_seconds=self.ttl_seconds)
+                    except Exception as e:
+                        logger.warning("⚠️ فشل تسخين %s (%s/%s): %s", query, country, platform, e)
+                        products = None
+                    summary["warmed" if self._analyzed(products) else "failed"] += 1
+                    if delay and self._stop.wait(delay):
+                        return summary
+            return summary
+        finally:
+            with self._lock:
+                self.running = False
+                self.cycles += 1
+                self.last_run = datetime.now().isoformat()
+                self.last_summary = summary
+
+    @staticmethod
+    def _analyzed(products):
+        """هل أرجع التحديث تحليلاً جديداً؟ (النتيجة القديمة والبيانات التجريبية عند الفشل لا تُحسب)"""
+        return bool(products) and all(
+            product.get("source") == AI_SOURCE and not product.get("stale") for product in products)
+
+    def run_once(self, force=False):
+        targets = self.targets()
+        logger.info("🔥 تسخين الكاش: %s استعلام × %s منصة", len(targets), len(self.analyzer.fanout_platforms))
+        summary = self.warm(targets, force=force)
+        logger.info("🔥 انتهى تسخين الكاش: %s", summary)
+        return summary
+
+    def _try_lock(self):
+        """قفل ملف حتى يسخن عامل gunicorn واحد فقط، ويرجع الملف المقفل أو None"""
+        if self.lock_path is None or fcntl is None:
+            return True
+        handle = open(self.lock_path, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    def _loop(self):
+        last_cycle = 0.0
+        while not self._stop.wait(min(60.0, self.interval)):
+            if self.query_stats is not None:
+                try:
+                    self.query_stats.flush()
+                except sqlite3.Error as e:
+                    logger.error("❌ خطأ في حفظ إحصاءات الاستعلامات: %s", e)
+            if time.monotonic() - last_cycle < self.interval or not in_hours(self.hours, datetime.now().hour):
+                continue
+            handle = self._try_lock()
+            if handle is None:
+                continue
+            last_cycle = time.monotonic()
+            try:
+                self.run_once()
+                if self.query_stats is not None:
+                    self.query_stats.purge(self.stats_window)
+            except Exception as e:
+                logger.error("❌ فشل تسخين الكاش: %s", e)
+            finally:
+                if handle is not True:
+                    handle.close()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "scheduled": self._thread is not None,
+                "hours": "-".join(map(str, self.hours)) if self.hours is not None else None,
+                "rate_per_minute": self.rate_per_minute,
+                "running": self.running,
+                "cycles": self.cycles,
+                "last_run": self.last_run,
+                "last_summary": self.last_summary,
+            }
@@ -13,7 +13,8 @@ const elements = {
     resultsCount: document.getElementById('resultsCount'),
     searchQuery: document.getElementById('searchQuery'),
     errorSection: document.getElementById('errorSection'),
-    errorMessage: document.getElementById('errorMessage')
+    errorMessage: document.getElementById('errorMessage'),
+    aiBadge: document.getElementById('aiBadge')
 };
 
 // استمع لضغط Enter في حقل البحث
@@ -28,7 +29,7 @@ elements.analyzeBtn.addEventListener('click', analyzeProducts);
 
 async function analyzeProducts() {
     const query = elements.queryInput.value.trim();
-    
+
     if (!query) {
         showError('يرجى إدخال نوع المنتج الذي تريد البحث عنه');
         return;
@@ -40,7 +41,7 @@ async function analyzeProducts() {
     hideError();
 
     try {
-        const response = await fetch(`${API_BASE_URL}/api/analyze`, {
+        const response = await fetch(API_BASE_URL + '/api/analyze', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -48,23 +49,19 @@ async function analyzeProducts() {
             body: JSON.stringify({
                 query: query,
                 country: elements.countrySelect.value,
-                platform: elements.platformSelect.value
+                platform: elements.platformSelect.value,
+                stream: true
             })
         });
 
-        const data = await response.json();
-
         if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.error || 'حدث خطأ في الخادم');
         }
 
-        if (!data.success) {
-            throw new Error(data.error || 'فشل في التحليل');
-        }
+        // عرض كل منتج فور وصوله
+        await readProductStream(response);
 
-        // عرض النتائج
-        displayResults(data);
-        
     } catch (error) {
         console.error('Error:', error);
         showError(error.message);
@@ -73,44 +70,95 @@ async function analyzeProducts() {
     }
 }
 
-function displayResults(data) {
-    elements.resultsCount.textContent = `${data.products_count} منتج`;
-    elements.searchQuery.textContent = `عنوان البحث: ${data.query}`;
-    
+async function readProductStream(response) {
+    // خادم لا يدعم البث يرجع JSON كاملاً
+    if ((response.headers.get('Content-Type') || '').includes('application/json')) {
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || 'فشل في التحليل');
+        }
+        displayResults(data);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+
+            if (event.type === 'meta') {
+                startResults(event);
+            } else if (event.type === 'product') {
+                // إخفاء شاشة التحميل بمجرد وصول أول منتج
+                elements.loadingSection.style.display = 'none';
+                appendProduct(event.product, event.index);
+            } else if (event.type === 'done') {
+                elements.resultsCount.textContent = event.products_count + ' منتج';
+            } else if (event.type === 'error') {
+                throw new Error(event.error || 'فشل في التحليل');
+            }
+        }
+    }
+}
+
+function startResults(data) {
+    elements.resultsCount.textContent = '0 منتج';
+    elements.searchQuery.textContent = 'عنوان البحث: ' + data.query;
+    elements.aiBadge.style.display = 'none';
     elements.resultsContainer.innerHTML = '';
-    
-    data.products.forEach((product, index) => {
-        const productCard = createProductCard(product, index + 1);
-        elements.resultsContainer.appendChild(productCard);
-    });
-    
     showResults();
 }
 
+function appendProduct(product, index) {
+    // إظهار شارة AI إذا كان التحليل باستخدام الذكاء الاصطناعي
+    if (product.analyzed_by === 'openrouter') {
+        elements.aiBadge.style.display = 'inline-block';
+    }
+    elements.resultsContainer.appendChild(createProductCard(product, index));
+    elements.resultsCount.textContent = index + ' منتج';
+}
+
+function displayResults(data) {
+    startResults(data);
+    data.products.forEach((product, index) => appendProduct(product, index + 1));
+    elements.resultsCount.textContent = data.products_count + ' منتج';
+}
+
 function createProductCard(product, index) {
     const card = document.createElement('div');
     card.className = 'product-card';
-    
+
+    const aiBadge = product.analyzed_by === 'openrouter' ? 
+        '<span class="ai-badge">تحليل بالذكاء الاصطناعي</span>' : '';
+
     card.innerHTML = `
         <div class="product-header">
-            ${product.image ? `
-                <img src="${product.image}" alt="${product.name_ar}" class="product-image" 
-                     onerror="this.src='https://via.placeholder.com/300x200/667eea/white?text=صورة+المنتج'">
-            ` : ''}
-            
+            <img src="${product.image}" alt="${product.name_ar}" class="product-image" 
+                 onerror="this.src='https://via.placeholder.com/300x200/667eea/white?text=صورة+المنتج'">
+
             <div class="product-basic-info">
-                <h3 class="product-name">${index}. ${product.name_ar} / ${product.name_en}</h3>
+                <h3 class="product-name">${index}. ${product.name_ar} ${aiBadge}</h3>
                 <p class="product-description">${product.short_description}</p>
-                
+
                 <div style="display: flex; gap: 15px; flex-wrap: wrap; margin-top: 10px;">
-                    <span class="profit-badge">💰 هامش ربح: ${product.profit_analysis?.profit_margin || 'N/A'}</span>
+                    <span class="profit-badge">💰 هامش ربح: ${product.profit_analysis.profit_margin}</span>
                     <span class="profit-badge" style="background: #2196F3;">📊 ${product.difficulty}</span>
                     <span class="profit-badge" style="background: #FF9800;">🎯 ${product.target}</span>
                 </div>
             </div>
         </div>
 
-        <!-- المعلومات الأساسية -->
         <div class="detail-section">
             <h4>📊 المعلومات الأساسية</h4>
             <div class="detail-grid">
@@ -129,26 +177,24 @@ function createProductCard(product, index) {
             </div>
         </div>
 
-        <!-- تحليل الربحية -->
         <div class="detail-section">
             <h4>💰 تحليل الربحية</h4>
             <div class="detail-grid">
                 <div class="detail-item">
                     <span class="detail-label">سعر الشراء:</span>
-                    <span class="detail-value">${product.profit_analysis?.purchase_price} ${product.profit_analysis?.currency}</span>
+                    <span class="detail-value">${product.profit_analysis.purchase_price} ${product.profit_analysis.currency}</span>
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">سعر البيع المقترح:</span>
-                    <span class="detail-value">${product.profit_analysis?.suggested_price} ${product.profit_analysis?.currency}</span>
+                    <span class="detail-value">${product.profit_analysis.suggested_price} ${product.profit_analysis.currency}</span>
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">صافي الربح:</span>
-                    <span class="detail-value">${product.profit_analysis?.net_profit} ${product.profit_analysis?.currency}</span>
+                    <span class="detail-value">${product.profit_analysis.net_profit} ${product.profit_analysis.currency}</span>
                 </div>
             </div>
         </div>
 
-        <!-- الجمهور المستهدف -->
         <div class="detail-section">
             <h4>🎯 الجمهور المستهدف</h4>
             <div class="detail-grid">
@@ -162,90 +208,86 @@ function createProductCard(product, index) {
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">الاهتمامات:</span>
-                    <span class="detail-value">${product.interests?.join('، ') || ''}</span>
+                    <span class="detail-value">${product.interests.join('، ')}</span>
                 </div>
             </div>
         </div>
 
-        <!-- الاستراتيجية التسويقية -->
         <div class="detail-section">
             <h4>📢 الاستراتيجية التسويقية</h4>
             <div class="detail-grid">
                 <div class="detail-item">
                     <span class="detail-label">منصة البيع:</span>
-                    <span class="detail-value">${product.marketing?.platform}</span>
+                    <span class="detail-value">${product.marketing.platform}</span>
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">ميزانية الإعلان:</span>
-                    <span class="detail-value">${product.marketing?.ad_budget}</span>
+                    <span class="detail-value">${product.marketing.ad_budget}</span>
                 </div>
             </div>
             <div style="margin-top: 15px;">
                 <span class="detail-label">النص الإعلاني:</span>
                 <p style="background: #f8f9fa; padding: 12px; border-radius: 8px; margin-top: 8px; line-height: 1.5;">
-                    ${product.marketing?.ad_copy}
+                    ${product.marketing.ad_copy}
                 </p>
             </div>
             <div style="margin-top: 10px;">
                 <span class="detail-label">الهاشتاقات:</span>
                 <p style="color: #667eea; font-weight: 500; margin-top: 5px;">
-                    ${product.marketing?.hashtags?.join(' ') || ''}
+                    ${product.marketing.hashtags.join(' ')}
                 </p>
             </div>
         </div>
 
-        <!-- تحليل السوق -->
         <div class="detail-section">
             <h4>📊 تحليل السوق</h4>
             <div class="detail-grid">
                 <div class="detail-item">
                     <span class="detail-label">مستوى المنافسة:</span>
-                    <span class="detail-value">${product.market_analysis?.competition}</span>
+                    <span class="detail-value">${product.market_analysis.competition}</span>
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">حجم الطلب:</span>
-                    <span class="detail-value">${product.market_analysis?.demand}</span>
+                    <span class="detail-value">${product.market_analysis.demand}</span>
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">توقعات النمو:</span>
-                    <span class="detail-value">${product.market_analysis?.growth_prediction}</span>
+                    <span class="detail-value">${product.market_analysis.growth_prediction}</span>
                 </div>
             </div>
         </div>
 
-        <!-- نصائح الخبراء -->
         <div class="detail-section">
             <h4>⚡ نصائح الخبراء</h4>
             <ul class="tips-list">
-                ${product.tips?.map(tip => `<li>${tip}</li>`).join('') || '<li>لا توجد نصائح متاحة</li>'}
+                ${product.tips.map(tip => '<li>' + tip + '</li>').join('')}
             </ul>
         </div>
 
-        <!-- الموردين -->
         <div class="detail-section">
             <h4>🛒 معلومات الموردين</h4>
             <div class="detail-grid">
                 <div class="detail-item">
                     <span class="detail-label">مدة الشحن:</span>
-                    <span class="detail-value">${product.suppliers?.shipping_days}</span>
+                    <span class="detail-value">${product.suppliers.shipping_days}</span>
                 </div>
                 <div class="detail-item">
                     <span class="detail-label">حد الأدنى للطلب:</span>
-                    <span class="detail-value">${product.suppliers?.min_order}</span>
+                    <span class="detail-value">${product.suppliers.min_order}</span>
                 </div>
             </div>
         </div>
     `;
-    
+
     return card;
 }
 
 function showLoading(show) {
     const btnText = elements.analyzeBtn.querySelector('.btn-text');
     const spinner = elements.analyzeBtn.querySelector('.loading-spinner');
-    
+
     if (show) {
-        btnText.textContent = 'جاري التحليل...';
+        btnText.textContent = 'جاري التحليل بالذكاء الاصطناعي...';
         spinner.style.display = 'block';
         elements.analyzeBtn.disabled = true;
         elements.loadingSection.style.display = 'block';
@@ -277,7 +319,7 @@ function hideError() {
 // اختبار اتصال API عند التحميل
 window.addEventListener('load', async () => {
     try {
-        const response = await fetch(`${API_BASE_URL}/api/health`);
+        const response = await fetch(API_BASE_URL + '/api/health');
         if (!response.ok) throw new Error('الخادم غير متاح');
         console.log('✅ النظام يعمل بشكل صحيح');
     } catch (error) {